@@ -0,0 +1,373 @@
+# This .py file will be used for running the data_wrangle primitives on a lazy Polars or DuckDB frame.
+# Importing python packages
+import functools
+import inspect
+
+import numpy as np
+import pandas as pd
+
+# Polars and DuckDB are optional; the pandas backend works without them.
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# The one setting the notebook flips: "pandas", "polars" or "duckdb".
+BACKEND = "pandas"
+
+# Backend implementations of the data_wrangle primitives, keyed by backend and function name.
+_IMPLEMENTATIONS = {"polars": {}, "duckdb": {}}
+
+_DUCKDB_CONNECTION = None
+
+# Position of every row of the DuckDB relations made by to_backend. DuckDB joins do not keep the row
+# order, so df_combo orders by this column and collect returns the rows in its order.
+_ROW = "__row"
+
+
+def set_backend(name):
+    """
+        Chooses the backend used by to_backend and scan_csv.
+
+        Parameters
+        ----------
+        name : str
+            "pandas", "polars" or "duckdb".
+    """
+    global BACKEND
+    if name not in ("pandas", "polars", "duckdb"):
+        raise ValueError(f"Unknown backend '{name}', use 'pandas', 'polars' or 'duckdb'")
+    _require(name)
+    BACKEND = name
+
+
+def _require(name):
+    if name == "polars" and pl is None:
+        raise ImportError("The polars backend needs the polars package (pip install polars)")
+    if name == "duckdb" and duckdb is None:
+        raise ImportError("The duckdb backend needs the duckdb package (pip install duckdb)")
+
+
+def duckdb_connection():
+    """
+        The in-process DuckDB connection shared by every DuckDB relation made here.
+    """
+    global _DUCKDB_CONNECTION
+    _require("duckdb")
+    if _DUCKDB_CONNECTION is None:
+        _DUCKDB_CONNECTION = duckdb.connect()
+
+    return _DUCKDB_CONNECTION
+
+
+def frame_backend(df):
+    """
+        Names the backend a frame belongs to: "polars", "duckdb" or "pandas".
+    """
+    if pl is not None and isinstance(df, (pl.LazyFrame, pl.DataFrame)):
+        return "polars"
+    if duckdb is not None and isinstance(df, duckdb.DuckDBPyRelation):
+        return "duckdb"
+
+    return "pandas"
+
+
+def to_backend(df, backend=None):
+    """
+        Wraps a pandas DataFrame as a lazy frame of the chosen backend. Chained data_wrangle calls on
+        the result are only planned; nothing runs until collect. Frames that already belong to the
+        chosen backend are returned unchanged, and frames of another backend are collected first.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame, polars.LazyFrame or duckdb.DuckDBPyRelation
+        backend : str, optional
+            Defaults to the BACKEND setting.
+
+        Returns
+        -------
+        pandas.DataFrame, polars.LazyFrame or duckdb.DuckDBPyRelation
+    """
+    backend = BACKEND if backend is None else backend
+    _require(backend)
+    if frame_backend(df) == backend:
+        return df
+    df = collect(df)
+    if backend == "polars":
+        return pl.from_pandas(df).lazy()
+    if backend == "duckdb":
+        return duckdb_connection().from_df(df.assign(**{_ROW: np.arange(len(df))}))
+
+    return df
+
+
+def scan_csv(file, backend=None):
+    """
+        Opens a CSV file with the chosen backend. Polars and DuckDB scan the file lazily, so only
+        the rows and columns the query needs are parsed.
+
+        Parameters
+        ----------
+        file : str
+            Path to the CSV file.
+        backend : str, optional
+            Defaults to the BACKEND setting.
+
+        Returns
+        -------
+        pandas.DataFrame, polars.LazyFrame or duckdb.DuckDBPyRelation
+    """
+    backend = BACKEND if backend is None else backend
+    _require(backend)
+    if backend == "polars":
+        return pl.scan_csv(file, infer_schema_length=None)
+    if backend == "duckdb":
+        return duckdb_connection().read_csv(file)
+
+    return pd.read_csv(file)
+
+
+def collect(df):
+    """
+        Runs a lazy frame (optimized and multithreaded by its engine) and returns a pandas DataFrame.
+        pandas DataFrames are returned unchanged.
+    """
+    backend = frame_backend(df)
+    if backend == "polars":
+        return (df.collect() if isinstance(df, pl.LazyFrame) else df).to_pandas()
+    if backend == "duckdb":
+        if _ROW in df.columns:
+            return df.order(f'"{_ROW}"').select(*[duckdb.ColumnExpression(col) for col in _columns(df)]).df()
+        return df.df()
+
+    return df
+
+
+def dispatch(func):
+    """
+        Decorator that sends a data_wrangle primitive to the Polars or DuckDB implementation when its
+        first argument is a frame of that backend, and to the pandas code otherwise.
+    """
+    first_arg = next(iter(inspect.signature(func).parameters))
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        df = args[0] if args else kwargs[first_arg]
+        backend = frame_backend(df)
+        if backend == "pandas":
+            return func(*args, **kwargs)
+        impl = _IMPLEMENTATIONS[backend].get(func.__name__)
+        if impl is None:
+            raise NotImplementedError(f"{func.__name__} has no {backend} implementation")
+        return impl(*args, **kwargs)
+
+    return wrapper
+
+
+def _register(backend, name):
+    def decorator(impl):
+        _IMPLEMENTATIONS[backend][name] = impl
+        return impl
+    return decorator
+
+
+def _columns(df):
+    """
+        Column names of a Polars or DuckDB frame without running it.
+    """
+    if frame_backend(df) == "polars":
+        return df.collect_schema().names()
+
+    return [col for col in df.columns if col != _ROW]
+
+
+def _check_columns(df, col_names):
+    missing_cols = [col for col in col_names if col not in _columns(df)]
+    if missing_cols:
+        raise KeyError(f"The following columns were not found in the DataFrame: {missing_cols}")
+
+
+# ---- Polars implementations ----
+
+def _lazy(df):
+    return df.lazy() if isinstance(df, pl.DataFrame) else df
+
+
+@_register("polars", "remove_cols")
+def _polars_remove_cols(df, col_names):
+    return _lazy(df).drop(col_names)
+
+
+@_register("polars", "drop_columns")
+def _polars_drop_columns(df, column_strings):
+    return _lazy(df).drop([col for col in _columns(df) if any(s in col for s in column_strings)])
+
+
+@_register("polars", "remove_rows")
+def _polars_remove_rows(df, col, row_values):
+    pattern = '|'.join(row_values)
+    return _lazy(df).filter(~pl.col(col).str.contains(pattern).fill_null(False))
+
+
+@_register("polars", "rename_columns")
+def _polars_rename_columns(df, column_name_mappings):
+    # pandas ignores mappings for columns that do not exist, so drop them first.
+    columns = set(_columns(df))
+    return _lazy(df).rename({old: new for old, new in column_name_mappings.items() if old in columns})
+
+
+@_register("polars", "column_value_changer")
+def _polars_column_value_changer(df, column_name, rename_mapping):
+    return _lazy(df).with_columns(pl.col(column_name).replace(rename_mapping))
+
+
+@_register("polars", "filter_dataframe")
+def _polars_filter_dataframe(df, columns_with_include, values_to_include,
+                             columns_with_exclude, values_to_exclude):
+    if len(columns_with_include) != len(values_to_include):
+        raise Exception("Each column listed must have values passed to filter on.")
+    _check_columns(df, columns_with_include)
+    _check_columns(df, columns_with_exclude)
+
+    # All conditions go into one filter so the optimizer can push it down to the scan.
+    conditions = [pl.col(col).is_in(vals) for col, vals in zip(columns_with_include, values_to_include)]
+    conditions += [~pl.col(col).is_in(vals).fill_null(False) for col, vals in zip(columns_with_exclude, values_to_exclude)]
+
+    return _lazy(df).filter(*conditions) if conditions else _lazy(df)
+
+
+@_register("polars", "select_columns")
+def _polars_select_columns(df, column_names):
+    return _lazy(df).select(column_names)
+
+
+@_register("polars", "df_split")
+def _polars_df_split(df, col_names, value1, value2):
+    return _lazy(df).filter(pl.col(col_names) == value1), _lazy(df).filter(pl.col(col_names) == value2)
+
+
+@_register("polars", "df_combo")
+def _polars_df_combo(df1, df2, col_name, how, geo_key=False):
+    if geo_key:
+        raise NotImplementedError("geo_key is only supported for pandas DataFrames")
+    # Match pandas: the columns of df1 then the other columns of df2; outer joins come back sorted by
+    # key, right joins in the row order of df2 and the others in the row order of df1.
+    keys = [col_name] if isinstance(col_name, str) else list(col_name)
+    columns = _columns(df1) + [col for col in _columns(df2) if col not in keys]
+    if how == "outer":
+        joined = _lazy(df1).join(_lazy(df2), on=col_name, how="full", coalesce=True,
+                                 maintain_order="left").sort(col_name, nulls_last=True, maintain_order=True)
+    else:
+        joined = _lazy(df1).join(_lazy(df2), on=col_name, how=how,
+                                 maintain_order="right" if how == "right" else "left")
+
+    return joined.select(columns)
+
+
+# ---- DuckDB implementations ----
+
+def _keep(df, col_names):
+    # The row position always comes along.
+    col_names = list(col_names) + ([_ROW] if _ROW in df.columns and _ROW not in col_names else [])
+    return df.select(*[duckdb.ColumnExpression(col) for col in col_names])
+
+
+def _isin(col, values):
+    return duckdb.ColumnExpression(col).isin(*[duckdb.ConstantExpression(val) for val in values])
+
+
+@_register("duckdb", "remove_cols")
+def _duckdb_remove_cols(df, col_names):
+    return _keep(df, [col for col in _columns(df) if col not in col_names])
+
+
+@_register("duckdb", "drop_columns")
+def _duckdb_drop_columns(df, column_strings):
+    return _keep(df, [col for col in _columns(df) if not any(s in col for s in column_strings)])
+
+
+@_register("duckdb", "remove_rows")
+def _duckdb_remove_rows(df, col, row_values):
+    pattern = duckdb.ConstantExpression('|'.join(row_values))
+    matches = duckdb.FunctionExpression("regexp_matches", duckdb.ColumnExpression(col), pattern)
+    return df.filter(~duckdb.CoalesceOperator(matches, duckdb.ConstantExpression(False)))
+
+
+@_register("duckdb", "rename_columns")
+def _duckdb_rename_columns(df, column_name_mappings):
+    return df.select(*[
+        duckdb.ColumnExpression(col).alias(column_name_mappings.get(col, col)) for col in df.columns
+    ])
+
+
+@_register("duckdb", "column_value_changer")
+def _duckdb_column_value_changer(df, column_name, rename_mapping):
+    column = duckdb.ColumnExpression(column_name)
+    renamed = None
+    for old, new in rename_mapping.items():
+        when = column == duckdb.ConstantExpression(old)
+        value = duckdb.ConstantExpression(new)
+        renamed = duckdb.CaseExpression(when, value) if renamed is None else renamed.when(when, value)
+    if renamed is None:
+        return df
+    renamed = renamed.otherwise(column).alias(column_name)
+
+    return df.select(*[renamed if col == column_name else duckdb.ColumnExpression(col) for col in df.columns])
+
+
+@_register("duckdb", "filter_dataframe")
+def _duckdb_filter_dataframe(df, columns_with_include, values_to_include,
+                             columns_with_exclude, values_to_exclude):
+    if len(columns_with_include) != len(values_to_include):
+        raise Exception("Each column listed must have values passed to filter on.")
+    _check_columns(df, columns_with_include)
+    _check_columns(df, columns_with_exclude)
+
+    false = duckdb.ConstantExpression(False)
+    for col, vals in zip(columns_with_include, values_to_include):
+        df = df.filter(_isin(col, vals))
+    for col, vals in zip(columns_with_exclude, values_to_exclude):
+        # Rows with a missing value are kept, like ~isin in pandas.
+        df = df.filter(~duckdb.CoalesceOperator(_isin(col, vals), false))
+
+    return df
+
+
+@_register("duckdb", "select_columns")
+def _duckdb_select_columns(df, column_names):
+    return _keep(df, column_names)
+
+
+@_register("duckdb", "df_split")
+def _duckdb_df_split(df, col_names, value1, value2):
+    column = duckdb.ColumnExpression(col_names)
+    return (df.filter(column == duckdb.ConstantExpression(value1)),
+            df.filter(column == duckdb.ConstantExpression(value2)))
+
+
+@_register("duckdb", "df_combo")
+def _duckdb_df_combo(df1, df2, col_name, how, geo_key=False):
+    if geo_key:
+        raise NotImplementedError("geo_key is only supported for pandas DataFrames")
+    # DuckDB does not keep row order through a join, so order like pandas from the row positions:
+    # outer joins by key, right joins by the right rows, the others by the left rows. Relations
+    # without row positions (e.g. from scan_csv) are ordered by the key.
+    key = f'"{col_name}" NULLS LAST'
+    if _ROW not in df1.columns or _ROW not in df2.columns:
+        left, right = [df.select(*[duckdb.ColumnExpression(col) for col in _columns(df)]) for df in (df1, df2)]
+        return left.join(right, f'"{col_name}"', how=how).order(key)
+
+    right_row = f"{_ROW}_right"
+    right = df2.select(*[duckdb.ColumnExpression(col) for col in _columns(df2)],
+                       duckdb.ColumnExpression(_ROW).alias(right_row))
+    joined = df1.join(right, f'"{col_name}"', how=how)
+    rows = {"outer": [key, f'"{_ROW}" NULLS LAST', f'"{right_row}"'],
+            "right": [f'"{right_row}"', f'"{_ROW}"']}.get(how, [f'"{_ROW}"', f'"{right_row}"'])
+    columns = ", ".join(f'"{col}"' for col in joined.columns if col not in (_ROW, right_row))
+
+    return joined.project(f'{columns}, row_number() OVER (ORDER BY {", ".join(rows)}) - 1 AS "{_ROW}"')
@@ -0,0 +1,195 @@
+# This .py file will be used for functions that pre-aggregate data into bins for the large-data plots.
+# Importing python packages
+import numpy as np
+
+
+def column_edges(values, bins):
+    """
+        Computes equal-width bin edges for every column of an array at once.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            2D array (observations x columns).
+        bins : int
+            Number of bins per column.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape (columns x bins + 1) holding the edges of each column.
+    """
+    values = np.asarray(values, dtype=float)
+    with np.errstate(invalid="ignore"):
+        low = np.nanmin(values, axis=0)
+        high = np.nanmax(values, axis=0)
+
+    # Columns that are empty or constant still get a usable range.
+    low = np.where(np.isnan(low), 0.0, low)
+    high = np.where(np.isnan(high), 1.0, high)
+    flat = high <= low
+    low = np.where(flat, low - 0.5, low)
+    high = np.where(flat, high + 0.5, high)
+
+    return low[:, None] + (high - low)[:, None] * np.linspace(0, 1, bins + 1)
+
+
+def bin_index(values, edges):
+    """
+        Finds the bin of every value, column by column. Values outside the edges or missing get -1.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            2D array (observations x columns).
+        edges : numpy.ndarray
+            Edges from column_edges (columns x bins + 1).
+
+        Returns
+        -------
+        numpy.ndarray
+            Integer array of bin positions with the same shape as values.
+    """
+    values = np.asarray(values, dtype=float)
+    bins = edges.shape[1] - 1
+    low = edges[:, 0]
+    width = (edges[:, -1] - low) / bins
+
+    with np.errstate(invalid="ignore"):
+        idx = np.floor((values - low) / width)
+        # The right edge belongs to the last bin, like numpy.histogram (allowing for rounding in the edges).
+        on_right_edge = (idx == bins) & (values - edges[:, -1] <= width * 1e-9)
+    idx = np.where(on_right_edge, bins - 1, idx)
+    valid = (idx >= 0) & (idx < bins)
+
+    return np.where(valid, idx, -1).astype(np.int64)
+
+
+def hist1d(values, bins=40, edges=None, density=False):
+    """
+        Histograms of every column of an array in one pass.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            2D array (observations x columns).
+        bins : int, default=40
+            Number of bins per column.
+        edges : numpy.ndarray, optional
+            Precomputed edges (columns x bins + 1).
+        density : bool, default=False
+            Normalize each histogram so its area is 1.
+
+        Returns
+        -------
+        tuple
+            1. numpy.ndarray of counts or densities (columns x bins).
+            2. numpy.ndarray of edges (columns x bins + 1).
+    """
+    values = np.asarray(values, dtype=float)
+    if edges is None:
+        edges = column_edges(values, bins)
+    bins = edges.shape[1] - 1
+    n_cols = values.shape[1]
+
+    idx = bin_index(values, edges)
+    # Offset each column's bins so a single bincount fills every histogram.
+    flat = (idx + np.arange(n_cols) * bins)[idx >= 0]
+    counts = np.bincount(flat, minlength=n_cols * bins).reshape(n_cols, bins).astype(float)
+
+    if density:
+        widths = np.diff(edges, axis=1)
+        totals = counts.sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            counts = counts / (totals * widths)
+
+    return counts, edges
+
+
+def hist2d(x_idx, y_idx, bins_x, bins_y, weights=None):
+    """
+        2D histogram from precomputed bin positions.
+
+        Parameters
+        ----------
+        x_idx, y_idx : numpy.ndarray
+            1D bin positions from bin_index (-1 marks values to skip).
+        bins_x, bins_y : int
+            Number of bins along each axis.
+        weights : numpy.ndarray, optional
+            Values summed into each cell instead of counting rows.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape (bins_y x bins_x), ready to draw as an image with y on the vertical axis.
+    """
+    keep = (x_idx >= 0) & (y_idx >= 0)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+        keep &= ~np.isnan(weights)
+        weights = weights[keep]
+
+    cells = y_idx[keep] * bins_x + x_idx[keep]
+
+    return np.bincount(cells, weights=weights, minlength=bins_x * bins_y).reshape(bins_y, bins_x).astype(float)
+
+
+def binned_mean(x_idx, y_idx, bins_x, bins_y, values):
+    """
+        Mean of a value inside every cell of a 2D grid (NaN where a cell is empty).
+
+        Parameters
+        ----------
+        x_idx, y_idx : numpy.ndarray
+            1D bin positions from bin_index.
+        bins_x, bins_y : int
+            Number of bins along each axis.
+        values : numpy.ndarray
+            Values to average.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape (bins_y x bins_x).
+    """
+    values = np.asarray(values, dtype=float)
+    observed = ~np.isnan(values)
+    counts = hist2d(np.where(observed, x_idx, -1), y_idx, bins_x, bins_y)
+    totals = hist2d(x_idx, y_idx, bins_x, bins_y, weights=values)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, totals / counts, np.nan)
+
+
+def pairwise_hist2d(values, bins=40):
+    """
+        Precomputes the 2D histogram of every pair of columns plus the 1D histogram of each column,
+        which is everything a binned scatter plot matrix needs. The data is only binned once.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            2D array (observations x columns).
+        bins : int, default=40
+            Number of bins per column.
+
+        Returns
+        -------
+        dict
+            "edges" (columns x bins + 1), "density" (columns x bins) and "pairs", a dict mapping
+            (row, column) positions to a (bins x bins) count grid.
+    """
+    values = np.asarray(values, dtype=float)
+    edges = column_edges(values, bins)
+    idx = bin_index(values, edges)
+    density, _ = hist1d(values, edges=edges, density=True)
+
+    n_cols = values.shape[1]
+    pairs = {}
+    for row in range(n_cols):
+        for col in range(n_cols):
+            if row != col:
+                pairs[(row, col)] = hist2d(idx[:, col], idx[:, row], bins, bins)
+
+    return {"edges": edges, "density": density, "pairs": pairs}
@@ -0,0 +1,230 @@
+# This .py file will be used for stacking several ACS census vintages into one (geography, year) panel.
+# Importing python packages
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+from data_loader import load_census_native, load_csv, load_csv_chunks
+from data_wrangle import CENSUS_COLUMNS, df_combo, process_census_data
+from profiling import frame_bytes, stage
+from scenarios import ScenarioSweep
+
+# Name of the year column of the panels.
+YEAR_COL = "year"
+
+# Parts of the census labels that change with the vintage, and what they become in the metric IDs.
+LABEL_VARIANTS = [
+    (re.compile(r"\bIN \d{4} INFLATION-ADJUSTED DOLLARS\b", re.IGNORECASE), "IN INFLATION-ADJUSTED DOLLARS")
+]
+
+# Metric IDs of labels the Census Bureau reworded between vintages -> metric ID of the label in
+# CENSUS_COLUMNS, e.g. {metric_id('<old label>'): metric_id('<2022 label>')}.
+METRIC_ALIASES = {}
+
+# Processed vintages, keyed by file, its size and modification time and the year.
+_VINTAGES = {}
+
+
+def metric_id(label):
+    """
+        The stable ID of a census metric label: the year-specific parts of LABEL_VARIANTS replaced,
+        spaces and the trailing ':' of every '!!' part removed and lower case, so the same metric
+        of different vintages gets the same ID.
+
+        Parameters
+        ----------
+        label : str
+            Metric label ('!!' path), e.g. 'INCOME IN THE PAST 12 MONTHS (IN 2022 INFLATION-ADJUSTED
+            DOLLARS)!!Households'.
+
+        Returns
+        -------
+        str
+    """
+    label = str(label)
+    for pattern, replacement in LABEL_VARIANTS:
+        label = pattern.sub(replacement, label)
+    parts = [" ".join(part.split()).rstrip(":").rstrip() for part in label.split("!!")]
+    key = "!!".join(parts).casefold()
+
+    return METRIC_ALIASES.get(key, key)
+
+
+# Metric ID -> the label of CENSUS_COLUMNS the census steps select.
+CENSUS_METRIC_IDS = {metric_id(col): col for col in CENSUS_COLUMNS}
+
+
+def normalize_census_labels(df):
+    """
+        Renames the metric columns of a census frame of any vintage (raw transposed or from
+        load_census_native) to the labels of CENSUS_COLUMNS, so census_filter_cols and
+        census_rename_cols work on it.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            A census frame with one column per metric ('!!' path).
+
+        Returns
+        -------
+        pandas.DataFrame
+            df with the matching columns renamed (the other columns are left as they are).
+    """
+    renames = {}
+    for col in df.columns:
+        label = CENSUS_METRIC_IDS.get(metric_id(col))
+        if label is not None and label != col:
+            renames[col] = label
+
+    targets = list(renames.values()) + [col for col in df.columns if col not in renames]
+    repeated = sorted({label for label in renames.values() if targets.count(label) > 1})
+    if repeated:
+        raise ValueError(f"Several columns have the metric ID of the following columns: {repeated}")
+
+    return df.rename(columns=renames) if renames else df
+
+
+def _is_native(file):
+    # Native downloads have one Estimate and one Margin of Error column per location.
+    header = load_csv_chunks(file, chunksize=1, sample=False)
+    columns = next(iter(header), pd.DataFrame()).columns[1:]
+    header.close()
+    return len(columns) > 0 and all(str(col).endswith(("!!Estimate", "!!Margin of Error")) for col in columns)
+
+
+def load_vintage(file, year, native=None):
+    """
+        Parses and processes one census vintage.
+
+        Parameters
+        ----------
+        file : str
+            Path to the census CSV file of the vintage.
+        year : int
+            ACS year of the file.
+        native : bool, optional
+            The file is a Census download as it is (see load_census_native) rather than a manually
+            transposed file; detected from the header when not given.
+
+        Returns
+        -------
+        pandas.DataFrame
+            process_census_data of the file with a year column after State.
+    """
+    native = _is_native(file) if native is None else native
+    df = load_census_native(file) if native else load_csv(file)
+    df = process_census_data(normalize_census_labels(df), lean=True, native=native)
+    df.insert(1, YEAR_COL, year)
+
+    return df
+
+
+def _vintage_key(file, year):
+    info = os.stat(file)
+    return os.path.abspath(file), info.st_size, info.st_mtime_ns, year
+
+
+def census_panel(sources, native=None, executor="process", max_workers=None):
+    """
+        Stacks several ACS vintages of the census data into one (State, year) panel. The labels of
+        every vintage are mapped to the CENSUS_COLUMNS labels by their metric IDs (see metric_id),
+        so all vintages end up with the columns of process_census_data. Vintages are parsed in
+        parallel, and each processed vintage is kept until its file changes, so adding a vintage
+        only parses the new file.
+
+        Parameters
+        ----------
+        sources : dict
+            ACS year -> path to the census CSV file of that year.
+        native : bool, optional
+            Whether the files are native Census downloads (see load_vintage), detected per file
+            when not given.
+        executor : str, default="process"
+            'process' parses the new vintages on a process pool, 'thread' on a thread pool.
+        max_workers : int, optional
+            Pool size, defaults to the number of CPUs (at most the number of new vintages).
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per State and year, sorted by State and year.
+    """
+    if executor not in ("thread", "process"):
+        raise ValueError(f"executor must be 'thread' or 'process', got '{executor}'.")
+    keys = {year: _vintage_key(file, year) for year, file in sources.items()}
+    new = [year for year in sources if keys[year] not in _VINTAGES]
+
+    with stage("panel - census", vintages=len(sources), parsed=len(new)) as record:
+        if len(new) == 1 or (new and executor == "thread"):
+            with ThreadPoolExecutor(max_workers=min(max_workers or os.cpu_count() or 1, len(new))) as pool:
+                frames = list(pool.map(load_vintage, [sources[year] for year in new], new, [native] * len(new)))
+        elif new:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            with ProcessPoolExecutor(max_workers=min(max_workers or os.cpu_count() or 1, len(new)),
+                                     mp_context=context) as pool:
+                frames = list(pool.map(load_vintage, [sources[year] for year in new], new, [native] * len(new)))
+        else:
+            frames = []
+        for year, df in zip(new, frames):
+            _VINTAGES[keys[year]] = df
+
+        panel = pd.concat([_VINTAGES[keys[year]] for year in sources], ignore_index=True)
+        panel = panel.sort_values(["State", YEAR_COL], kind="stable", ignore_index=True)
+        record["frame_bytes"] = frame_bytes(panel)
+
+    return panel
+
+
+def chronic_panel(cdi_df, years, **settings):
+    """
+        Stacks the chronic disease table (process_chronic_disease_data) of several years into one
+        (State, year) panel. The years share one ScenarioSweep, so the raw data is cleaned once.
+
+        Parameters
+        ----------
+        cdi_df : pandas.DataFrame
+            The raw chronic disease indicators data.
+        years : list
+            Values of 'YearStart'.
+        **settings
+            Other scenario settings (questions, values_exclude, stratifications), see
+            scenarios.scenario_config.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per State and year, sorted by State and year.
+    """
+    sweep = ScenarioSweep(cdi_df)
+    frames = sweep.run({year: {**settings, "years": [year]} for year in years}, output="chronic")
+    parts = []
+    for year, df in frames.items():
+        df = df.copy(deep=False)
+        df.insert(1, YEAR_COL, year)
+        parts.append(df)
+
+    return pd.concat(parts, ignore_index=True).sort_values(["State", YEAR_COL], kind="stable", ignore_index=True)
+
+
+def panel_combo(chronic, census, how="inner"):
+    """
+        Joins a chronic disease panel and a census panel on State and year.
+
+        Parameters
+        ----------
+        chronic : pandas.DataFrame
+            chronic_panel output.
+        census : pandas.DataFrame
+            census_panel output.
+        how : str, default="inner"
+            Type of join.
+
+        Returns
+        -------
+        pandas.DataFrame
+    """
+    return df_combo(chronic, census, ["State", YEAR_COL], how)
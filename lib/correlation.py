@@ -0,0 +1,346 @@
+# This .py file will be used for functions that compute correlation matrices for the visualizations.
+# Importing python packages
+import hashlib
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Rank matrices that have already been computed, keyed by a fingerprint of the data.
+_RANK_CACHE = {}
+_RANK_CACHE_SIZE = 8
+
+
+def frame_fingerprint(values, column_names):
+    """
+        Creates a fingerprint for a numeric block so repeated calls on the same data can be cached.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            2D float array holding the data.
+        column_names : list
+            Names of the columns in the array.
+
+        Returns
+        -------
+        str
+            Hex digest identifying the data and its column names.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(values).tobytes())
+    digest.update(str(values.shape).encode())
+    digest.update("\x1f".join(map(str, column_names)).encode())
+
+    return digest.hexdigest()
+
+
+def rank_columns(values, axis=0):
+    """
+        Ranks every column of an array at once, giving tied values their average rank.
+        Missing values (NaN) stay NaN and are left out of the ranking.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Array of floats to rank.
+        axis : int, default=0
+            Axis holding the observations (rows for a 2D data block).
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of average ranks (starting at 1) with the same shape as the input.
+    """
+    values = np.asarray(values, dtype=float)
+    if axis not in (-1, values.ndim - 1):
+        # Sorting along the last (contiguous) axis is much faster, so rank there and move the axis back.
+        return np.moveaxis(rank_columns(np.moveaxis(values, axis, -1), axis=-1), -1, axis)
+    n = values.shape[axis]
+
+    # NaNs are sorted last, so the ranks of the observed values always start at 1.
+    order = np.argsort(values, axis=axis, kind="stable")
+    sorted_vals = np.take_along_axis(values, order, axis=axis)
+
+    shape = [1] * values.ndim
+    shape[axis] = n
+    positions = np.broadcast_to(np.arange(n).reshape(shape), values.shape)
+
+    # Flag where a new group of tied values starts and ends along the axis.
+    first = [slice(None)] * values.ndim
+    rest = [slice(None)] * values.ndim
+    first[axis] = slice(1, None)
+    rest[axis] = slice(None, -1)
+    changed = sorted_vals[tuple(first)] != sorted_vals[tuple(rest)]
+
+    pad_shape = list(values.shape)
+    pad_shape[axis] = 1
+    pad = np.ones(pad_shape, dtype=bool)
+    group_start = np.concatenate([pad, changed], axis=axis)
+    group_end = np.concatenate([changed, pad], axis=axis)
+
+    start = np.maximum.accumulate(np.where(group_start, positions, 0), axis=axis)
+    end = np.flip(
+        np.minimum.accumulate(np.flip(np.where(group_end, positions, n - 1), axis=axis), axis=axis),
+        axis=axis
+    )
+    avg_rank = (start + end) / 2 + 1
+    avg_rank[np.isnan(sorted_vals)] = np.nan
+
+    ranks = np.empty_like(values)
+    np.put_along_axis(ranks, order, avg_rank, axis=axis)
+
+    return ranks
+
+
+def pairwise_corr(a, b=None):
+    """
+        Pearson correlation between every column of a and every column of b using pairwise complete
+        observations. The NaN handling is done with mask matrices, so all pairs come out of a few matrix
+        products instead of a loop over column pairs. Leading axes are treated as a batch, so a stack of
+        resampled blocks (resamples x observations x columns) is handled in one call.
+
+        Parameters
+        ----------
+        a : numpy.ndarray
+            Array of shape (..., observations, columns).
+        b : numpy.ndarray, optional
+            Array with the same leading shape and number of observations. Defaults to a.
+
+        Returns
+        -------
+        numpy.ndarray
+            Correlation matrices of shape (..., a columns, b columns).
+    """
+    a = np.asarray(a, dtype=float)
+    b = a if b is None else np.asarray(b, dtype=float)
+
+    mask_a = ~np.isnan(a)
+    mask_b = mask_a if b is a else ~np.isnan(b)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Fast path: no missing values, so a single product of standardized columns is enough.
+        if mask_a.all() and mask_b.all():
+            a_c = a - a.mean(axis=-2, keepdims=True)
+            b_c = a_c if b is a else b - b.mean(axis=-2, keepdims=True)
+            a_norm = np.sqrt((a_c ** 2).sum(axis=-2))
+            b_norm = a_norm if b is a else np.sqrt((b_c ** 2).sum(axis=-2))
+            corr = (np.swapaxes(a_c, -1, -2) @ b_c) / (a_norm[..., :, None] * b_norm[..., None, :])
+            if a.shape[-2] < 2:
+                corr[:] = np.nan
+            return np.clip(corr, -1, 1)
+
+        # Center each column on its own mean first to keep the sums numerically stable. Columns
+        # without any value have a NaN mean and end up with NaN correlations.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            a_c = np.where(mask_a, a - np.nanmean(a, axis=-2, keepdims=True), 0.0)
+            b_c = a_c if b is a else np.where(mask_b, b - np.nanmean(b, axis=-2, keepdims=True), 0.0)
+        m_a_t = np.swapaxes(mask_a, -1, -2).astype(float)
+        m_b = mask_b.astype(float)
+        a_c_t = np.swapaxes(a_c, -1, -2)
+
+        n_ab = m_a_t @ m_b
+        sum_a = a_c_t @ m_b
+        sum_b = m_a_t @ b_c
+        sum_aa = (a_c_t ** 2) @ m_b
+        sum_bb = m_a_t @ (b_c ** 2)
+        sum_ab = a_c_t @ b_c
+
+        cov = sum_ab - sum_a * sum_b / n_ab
+        var_a = sum_aa - sum_a ** 2 / n_ab
+        var_b = sum_bb - sum_b ** 2 / n_ab
+        corr = cov / np.sqrt(var_a * var_b)
+
+    corr[n_ab < 2] = np.nan
+
+    return np.clip(corr, -1, 1)
+
+
+def rerank_pairs(corr, values_rows, values_cols=None):
+    """
+        Corrects a Spearman matrix computed from ranks of whole columns for missing values. The ranks
+        of a column only hold for a pair when both columns miss the same rows; the other pairs are
+        re-ranked over their complete rows, like DataFrame.corr(method="spearman"). The pairs of one
+        row column are re-ranked together. Leading axes are treated as a batch, like pairwise_corr,
+        so a stack of resampled blocks is corrected in one call.
+
+        Parameters
+        ----------
+        corr : numpy.ndarray
+            Spearman matrix (..., row columns x columns) from the column ranks, updated in place.
+        values_rows : numpy.ndarray
+            Data of the row columns (..., observations x columns), not ranked.
+        values_cols : numpy.ndarray, optional
+            Data of the columns. Defaults to values_rows.
+
+        Returns
+        -------
+        numpy.ndarray
+            corr with the pairs re-ranked.
+    """
+    values_cols = values_rows if values_cols is None else values_cols
+    mask_rows = ~np.isnan(values_rows)
+    mask_cols = ~np.isnan(values_cols)
+    if mask_rows.all() and mask_cols.all():
+        return corr
+
+    n_both = np.swapaxes(mask_rows, -1, -2).astype(float) @ mask_cols.astype(float)
+    partial = ((n_both != mask_rows.sum(axis=-2)[..., :, None])
+               | (n_both != mask_cols.sum(axis=-2)[..., None, :]))
+    # A pair is re-ranked in every block when it is partial in any of them.
+    partial = partial.reshape((-1,) + partial.shape[-2:]).any(axis=0)
+    for i in np.flatnonzero(partial.any(axis=1)):
+        cols = np.flatnonzero(partial[i])
+        complete = mask_rows[..., [i]] & mask_cols[..., cols]
+        # One (observations x 1) block per pair, ranked over the complete rows of that pair.
+        ranks_i = np.swapaxes(rank_columns(np.where(complete, values_rows[..., [i]], np.nan), axis=-2), -1, -2)
+        ranks_j = np.swapaxes(rank_columns(np.where(complete, values_cols[..., cols], np.nan), axis=-2), -1, -2)
+        corr[..., i, cols] = pairwise_corr(ranks_i[..., None], ranks_j[..., None])[..., 0, 0]
+
+    return corr
+
+
+def rank_matrix(df, column_names=None):
+    """
+        Returns the rank matrix for the numeric columns of a DataFrame, ranking each column only once.
+        The result is cached, so later correlation requests against the same data reuse the ranks.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        column_names : list, optional
+            Columns to rank. Defaults to every numeric column.
+
+        Returns
+        -------
+        tuple
+            1. pandas.Index of the ranked column names.
+            2. numpy.ndarray of average ranks (rows x columns).
+    """
+    if column_names is None:
+        column_names = df.select_dtypes(include="number").columns
+    column_names = pd.Index(column_names)
+
+    values = df[column_names].to_numpy(dtype=float, na_value=np.nan)
+    key = frame_fingerprint(values, column_names)
+
+    if key not in _RANK_CACHE:
+        if len(_RANK_CACHE) >= _RANK_CACHE_SIZE:
+            _RANK_CACHE.pop(next(iter(_RANK_CACHE)))
+        _RANK_CACHE[key] = rank_columns(values, axis=0)
+
+    return column_names, _RANK_CACHE[key]
+
+
+def clear_rank_cache():
+    """
+        Empties the cached rank matrices.
+    """
+    _RANK_CACHE.clear()
+
+
+def corr_block(df, row_names, column_names=None, corr_method="spearman"):
+    """
+        Computes only the requested block of the correlation matrix. Spearman uses the cached rank matrix
+        of every numeric column, so asking for different slices of a wide frame never re-ranks the data;
+        only the pairs whose columns miss different rows are re-ranked (see rerank_pairs), so the values
+        equal DataFrame.corr.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        row_names : list
+            Columns making up the rows of the block.
+        column_names : list, optional
+            Columns making up the columns of the block. Defaults to row_names.
+        corr_method : str, default="spearman"
+            Correlation coefficient method ("pearson", "spearman", "kendall").
+
+        Returns
+        -------
+        pandas.DataFrame
+            Correlation block with row_names as the index and column_names as the columns.
+    """
+    if column_names is None:
+        column_names = row_names
+    row_names = list(row_names)
+    column_names = list(column_names)
+
+    if corr_method == "kendall":
+        # Kendall has no rank-once shortcut, so hand the block to pandas.
+        needed = list(dict.fromkeys(row_names + column_names))
+        return df[needed].corr(method="kendall").loc[row_names, column_names]
+
+    if corr_method == "spearman":
+        ranked_cols, ranks = rank_matrix(df)
+        missing_cols = [col for col in row_names + column_names if col not in ranked_cols]
+        if missing_cols:
+            raise KeyError(f"The following columns were not found or are not numeric: {missing_cols}")
+        values_rows = ranks[:, ranked_cols.get_indexer(row_names)]
+        values_cols = ranks[:, ranked_cols.get_indexer(column_names)]
+    elif corr_method == "pearson":
+        values_rows = df[row_names].to_numpy(dtype=float, na_value=np.nan)
+        values_cols = df[column_names].to_numpy(dtype=float, na_value=np.nan)
+    else:
+        raise ValueError(f"Unknown correlation method: {corr_method}")
+
+    if row_names == column_names:
+        corr = pairwise_corr(values_rows)
+    else:
+        corr = pairwise_corr(values_rows, values_cols)
+    if corr_method == "spearman":
+        corr = rerank_pairs(corr, df[row_names].to_numpy(dtype=float, na_value=np.nan),
+                            df[column_names].to_numpy(dtype=float, na_value=np.nan))
+
+    return pd.DataFrame(corr, index=row_names, columns=column_names)
+
+
+def benchmark_corr(n_rows=50, n_cols=1000, corr_method="spearman", seed=0):
+    """
+        Times the correlation engine against DataFrame.corr on random data.
+
+        Parameters
+        ----------
+        n_rows : int, default=50
+            Number of rows (observations).
+        n_cols : int, default=1000
+            Number of columns.
+        corr_method : str, default="spearman"
+            "pearson" or "spearman".
+        seed : int, default=0
+            Seed for the random data.
+
+        Returns
+        -------
+        dict
+            Seconds for the engine (cold and cached), seconds for pandas and the max absolute difference.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(n_rows, n_cols)), columns=[f"col_{i}" for i in range(n_cols)])
+    clear_rank_cache()
+
+    start = time.perf_counter()
+    engine_corr = corr_block(df, df.columns, corr_method=corr_method)
+    engine_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    corr_block(df, df.columns[:50], corr_method=corr_method)
+    cached_block_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pandas_corr = df.corr(method=corr_method)
+    pandas_s = time.perf_counter() - start
+
+    result = {
+        "engine_s": engine_s,
+        "cached_block_s": cached_block_s,
+        "pandas_s": pandas_s,
+        "max_abs_diff": float(np.nanmax(np.abs(engine_corr.to_numpy() - pandas_corr.to_numpy())))
+    }
+    print(f"{corr_method.capitalize()} {n_rows}x{n_cols}: engine {engine_s:.3f}s, "
+          f"cached 50x50 block {cached_block_s:.4f}s, DataFrame.corr {pandas_s:.3f}s, "
+          f"max diff {result['max_abs_diff']:.2e}")
+
+    return result
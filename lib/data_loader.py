@@ -1,15 +1,328 @@
 # This .py file will be used for functions that help with the import/loading of data files into DataFrames.
 # Importing python packages
+import bz2
+import gzip
+import io
+import os
+import queue
+import threading
+import time
+import zipfile
+
+import numpy as np
 import pandas as pd
 
-def load_csv(file):
+# zstandard is optional; it is only needed for .zst files.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# pyarrow is optional; with it the native Census table is held as Arrow strings (see load_census_native).
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# File suffixes that are decompressed while reading.
+COMPRESSIONS = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2', '.zst': 'zstd', '.zstd': 'zstd', '.zip': 'zip'}
+
+# Size of the pieces handed from the decompression thread to the CSV parser.
+READ_AHEAD_BYTES = 1 << 20
+
+# Location columns of a native Census table parsed at a time (see load_census_native).
+CENSUS_CHUNK_COLUMNS = 256
+
+# Sample mode for development runs (see set_sample): None reads every row.
+SAMPLE = None
+# Columns that define the sample groups when a file has them: geography, year and stratification.
+SAMPLE_KEYS = ['LocationDesc', 'State', 'YearStart', 'Stratification1']
+# Sample masks of the files read so far, so re-running a cell only parses the sampled rows.
+_SAMPLE_MASKS = {}
+
+
+class _CountingFile(io.RawIOBase):
+    """
+        Raw file that counts the (compressed) bytes read from disk.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._file.readinto(buffer)
+        self.bytes_read += n or 0
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class _ReadAhead(io.RawIOBase):
+    """
+        Decompresses in a background thread while the parser works on the previous piece, so
+        decompression and CSV parsing overlap. Counts the decompressed bytes.
+    """
+
+    def __init__(self, stream, closers=(), depth=4):
+        self._stream = stream
+        self._closers = closers
+        self._queue = queue.Queue(maxsize=depth)
+        self._buffer = b''
+        self._done = False
+        self._stop = threading.Event()
+        self.bytes_out = 0
+        threading.Thread(target=self._fill, daemon=True).start()
+
+    def _fill(self):
+        try:
+            while not self._stop.is_set():
+                piece = self._stream.read(READ_AHEAD_BYTES)
+                self._queue.put(piece)
+                if not piece:
+                    break
+        except Exception as err:
+            self._queue.put(err)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer and not self._done:
+            piece = self._queue.get()
+            if isinstance(piece, Exception):
+                raise piece
+            self._buffer = piece
+            self._done = not piece
+        n = min(len(buffer), len(self._buffer))
+        buffer[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        self.bytes_out += n
+        return n
+
+    def close(self):
+        self._stop.set()
+        # Unblock the thread if it is waiting on a full queue.
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        for closer in self._closers:
+            closer.close()
+        super().close()
+
+
+def _compression(file):
+    if not isinstance(file, (str, os.PathLike)):
+        return None
+    return COMPRESSIONS.get(os.path.splitext(str(file))[1].lower())
+
+
+def zip_members(file):
+    """
+        Lists the CSV files inside a zip archive (e.g. a Census download bundle).
+
+        Parameters
+        ----------
+        file : str
+            Path to the zip archive.
+
+        Returns
+        -------
+        list
+            Names of the CSV members.
+    """
+    with zipfile.ZipFile(file) as archive:
+        return [name for name in archive.namelist() if name.lower().endswith('.csv')]
+
+
+def _open_compressed(file, member=None):
+    """
+        Opens a compressed CSV file as a stream of decompressed bytes.
+
+        Returns
+        -------
+        tuple
+            1. Buffered binary stream for pandas.read_csv.
+            2. The _CountingFile (compressed bytes read).
+            3. The _ReadAhead (decompressed bytes handed to the parser).
+    """
+    compression = _compression(file)
+    raw = _CountingFile(file)
+    closers = [raw]
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=raw)
+    elif compression == 'bz2':
+        stream = bz2.BZ2File(raw)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raw.close()
+            raise ImportError("Reading .zst files needs the zstandard package (pip install zstandard)")
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, read_size=READ_AHEAD_BYTES)
+    else:
+        archive = zipfile.ZipFile(raw)
+        members = [name for name in archive.namelist() if name.lower().endswith('.csv')]
+        if member is None:
+            if len(members) != 1:
+                raw.close()
+                raise ValueError(f"{file} holds {len(members)} CSV files, pick one with member= "
+                                 f"or use load_csv_archive: {members}")
+            member = members[0]
+        stream = archive.open(member)
+        closers.insert(0, archive)
+
+    read_ahead = _ReadAhead(stream, closers=[stream] + closers)
+
+    return io.BufferedReader(read_ahead, buffer_size=READ_AHEAD_BYTES), raw, read_ahead
+
+
+def _report(file, raw, read_ahead, start, member=None):
+    seconds = max(time.perf_counter() - start, 1e-9)
+    name = f"{file}:{member}" if member else f"{file}"
+    print(f"Read {name}: {raw.bytes_read / 1e6:,.1f} MB compressed -> {read_ahead.bytes_out / 1e6:,.1f} MB "
+          f"in {seconds:,.2f} s ({read_ahead.bytes_out / 1e6 / seconds:,.1f} MB/s decompressed, "
+          f"{raw.bytes_read / 1e6 / seconds:,.1f} MB/s from disk)")
+
+
+def set_sample(frac=None, by=None, seed=0, min_rows=1):
+    """
+        Turns the sample mode on for every following load_csv/load_csv_chunks call, so a
+        development run of the notebook only reads a small, reproducible part of the raw files.
+        The same rows are picked on every run with the same seed.
+
+        Parameters
+        ----------
+        frac : float, optional
+            Share of the rows kept from every group, e.g. 0.05. None turns the sample mode off.
+        by : list, optional
+            Columns defining the groups; defaults to the SAMPLE_KEYS a file has. Files with none of
+            them (e.g. the census file) are read in full.
+        seed : int, default=0
+        min_rows : int, default=1
+            Rows kept from every group however small it is, so every geography, year and
+            stratification still shows up.
+    """
+    global SAMPLE
+    if frac is None:
+        SAMPLE = None
+        return
+    if not 0 < frac <= 1:
+        raise ValueError("frac must be between 0 and 1")
+    SAMPLE = {'frac': frac, 'by': by, 'seed': seed, 'min_rows': min_rows}
+
+
+def _sample_spec(sample):
+    if sample is None:
+        return SAMPLE
+    if sample is False:
+        return None
+    spec = dict(SAMPLE or {'by': None, 'seed': 0, 'min_rows': 1})
+    spec['frac'] = sample
+
+    return spec
+
+
+def _sample_mask(file, frac, by, seed, min_rows, member):
+    header = load_csv_chunks(file, chunksize=1, member=member, sample=False)
+    columns = list(next(iter(header), pd.DataFrame()).columns)
+    header.close()
+    by = [col for col in (SAMPLE_KEYS if by is None else by) if col in columns]
+    if not by:
+        return None
+
+    keys = load_csv(file, member=member, usecols=by, sample=False)
+    n_rows = len(keys)
+    group = keys.groupby(by, dropna=False, sort=False).ngroup().to_numpy()
+    sizes = np.bincount(group)
+    # Rank the rows of every group in a seeded random order and keep the first ones.
+    order = np.lexsort((np.random.default_rng(seed).random(n_rows), group))
+    starts = np.cumsum(sizes) - sizes
+    rank = np.empty(n_rows, dtype=np.int64)
+    rank[order] = np.arange(n_rows) - starts[group[order]]
+    n_keep = np.maximum(min_rows, np.ceil(frac * sizes)).astype(np.int64)
+
+    return rank < n_keep[group]
+
+
+def sample_rows(file, frac, by=None, seed=0, min_rows=1, member=None):
+    """
+        Picks a stratified sample of the rows of a CSV file. Only the group columns are parsed;
+        within every group a seeded random max(min_rows, frac * group size) rows are kept.
+
+        Parameters
+        ----------
+        file : str
+            Path to the CSV file.
+        frac : float
+            Share of the rows kept from every group.
+        by : list, optional
+            Columns defining the groups; defaults to the SAMPLE_KEYS the file has.
+        seed : int, default=0
+        min_rows : int, default=1
+        member : str, optional
+            CSV file to read from a zip archive holding several.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            Sorted positions of the kept rows, or None when the file has none of the group columns.
+    """
+    keep = _sample_mask(file, frac, by, seed, min_rows, member)
+
+    return None if keep is None else np.flatnonzero(keep)
+
+
+def _skiprows(file, member, sample):
     """
-        Load a CSV file into a pandas DataFrame.
+        File lines the CSV parser skips in the sample mode (None reads every row).
+    """
+    spec = _sample_spec(sample)
+    if spec is None or not isinstance(file, (str, os.PathLike)):
+        return None
+    stat = os.stat(file)
+    by = None if spec['by'] is None else tuple(spec['by'])
+    key = (os.path.abspath(file), member, stat.st_mtime_ns, stat.st_size, spec['frac'], by, spec['seed'], spec['min_rows'])
+    if key not in _SAMPLE_MASKS:
+        _SAMPLE_MASKS[key] = _sample_mask(file, spec['frac'], spec['by'], spec['seed'], spec['min_rows'], member)
+    keep = _SAMPLE_MASKS[key]
+    if keep is None:
+        return None
+
+    # Line 0 is the header.
+    return np.flatnonzero(~keep) + 1
+
+
+def load_csv(file, member=None, report=False, usecols=None, sample=None):
+    """
+        Load a CSV file into a pandas DataFrame. Files ending in .gz, .bz2, .zst or .zip are
+        decompressed while they are parsed, without writing the decompressed file to disk.
     
         Parameters
         ----------
         file : str or file-like object
             Path to the CSV file or a file-like object.
+        member : str, optional
+            CSV file to read from a zip archive holding several (see zip_members).
+        report : bool, default=False
+            Print the compressed/decompressed sizes and read throughput.
+        usecols : list, optional
+            Only parse these columns.
+        sample : float or bool, optional
+            Read a stratified sample with this share of the rows (see set_sample); False reads
+            every row. Defaults to the sample mode setting. The rows left out are skipped by the
+            parser, so their values are never converted.
     
         Returns
         -------
@@ -17,7 +330,133 @@ def load_csv(file):
             A DataFrame containing the data from the CSV file.
             
     """
-    return pd.read_csv(file)
+    skiprows = _skiprows(file, member, sample)
+    if _compression(file) is None:
+        return pd.read_csv(file, usecols=usecols, skiprows=skiprows)
+
+    start = time.perf_counter()
+    stream, raw, read_ahead = _open_compressed(file, member)
+    with stream:
+        df = pd.read_csv(stream, usecols=usecols, skiprows=skiprows)
+    if report:
+        _report(file, raw, read_ahead, start, member)
+
+    return df
+
+def load_csv_chunks(file, chunksize=100000, usecols=None, member=None, report=False, sample=None):
+    """
+        Load a CSV file in chunks of rows, so large files never have to sit in memory at once.
+        Compressed files (.gz, .bz2, .zst, .zip) are decompressed as the chunks are read.
+    
+        Parameters
+        ----------
+        file : str or file-like object
+            Path to the CSV file or a file-like object.
+        chunksize : int, default=100000
+            Number of rows per chunk.
+        usecols : list, optional
+            Only parse these columns.
+        member : str, optional
+            CSV file to read from a zip archive holding several.
+        report : bool, default=False
+            Print the read throughput once the last chunk is read.
+        sample : float or bool, optional
+            Read a stratified sample (see load_csv).
+    
+        Returns
+        -------
+        iterator of pandas.DataFrame
+            One DataFrame per chunk of rows.
+            
+    """
+    skiprows = _skiprows(file, member, sample)
+    if _compression(file) is None:
+        return pd.read_csv(file, chunksize=chunksize, usecols=usecols, skiprows=skiprows)
+
+    return _compressed_chunks(file, chunksize, usecols, member, report, skiprows)
+
+def _compressed_chunks(file, chunksize, usecols, member, report, skiprows=None):
+    start = time.perf_counter()
+    stream, raw, read_ahead = _open_compressed(file, member)
+    with stream:
+        with pd.read_csv(stream, chunksize=chunksize, usecols=usecols, skiprows=skiprows) as reader:
+            yield from reader
+    if report:
+        _report(file, raw, read_ahead, start, member)
+
+def load_csv_archive(file, report=False):
+    """
+        Load every CSV file of a zip archive (e.g. a Census download bundle), one at a time.
+    
+        Parameters
+        ----------
+        file : str
+            Path to the zip archive.
+        report : bool, default=False
+            Print the read throughput of each member.
+    
+        Returns
+        -------
+        dict
+            Maps each member name to its DataFrame.
+            
+    """
+    return {member: load_csv(file, member=member, report=report) for member in zip_members(file)}
+
+def _read_csv(file, member=None, **kwargs):
+    if _compression(file) is None:
+        return pd.read_csv(file, **kwargs)
+    stream, _, _ = _open_compressed(file, member)
+    with stream:
+        return pd.read_csv(stream, **kwargs)
+
+def load_census_native(file, member=None, chunk_columns=CENSUS_CHUNK_COLUMNS, population_group='Total population'):
+    """
+        Load a Census table as downloaded (one row per metric, one Estimate and one Margin of Error
+        column per location) straight into the state-by-metric frame of process_census_data(native=True),
+        without the manually transposed file. The file is read once, keeping only the location columns
+        of population_group, so the whole table is held in memory while it is transposed chunk_columns
+        location columns at a time (see data_wrangle.df_transpose). With pyarrow installed the table
+        is held as Arrow strings (one buffer per column, not a Python object per cell, on any pandas
+        version) and only the chunk being transposed becomes objects; without it older pandas holds
+        the whole table as objects.
+    
+        Parameters
+        ----------
+        file : str or file-like object
+            Path to the CSV file (may be .gz, .bz2, .zst or .zip).
+        member : str, optional
+            CSV file to read from a zip archive holding several.
+        chunk_columns : int, default=CENSUS_CHUNK_COLUMNS
+            Number of location columns transposed per chunk.
+        population_group : str, default='Total population'
+            Population group of the columns to keep (see data_wrangle.df_transpose).
+    
+        Returns
+        -------
+        pandas.DataFrame
+            Columns State, Label (Grouping) and one column per non-empty metric; one Estimate
+            and one Margin of Error row per location.
+            
+    """
+    from data_wrangle import _in_population_group, df_transpose
+
+    header = _read_csv(file, member, nrows=0).columns
+    usecols = [0] + [i for i, col in enumerate(header) if i and _in_population_group(col, population_group)]
+    table = _read_csv(file, member, usecols=usecols, dtype=str if pyarrow is None else 'string[pyarrow]')
+    chunks = []
+    for start in range(1, max(table.shape[1], 2), chunk_columns):
+        chunk = table.iloc[:, [0] + list(range(start, min(start + chunk_columns, table.shape[1])))]
+        # Empty metrics are only known once every chunk is transposed.
+        chunks.append(df_transpose(chunk, population_group, drop_empty=False))
+
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    present = df.iloc[:, 2:].notna().to_numpy()
+    cols = np.concatenate([[True, True], present.any(axis=0)])
+    rows = present.any(axis=1)
+
+    return df.loc[rows, cols].reset_index(drop=True)
+
 
 def save_df_to_csv(df, file_path):
     """
@@ -1,9 +1,23 @@
 # This .py file will be used for functions that help with the data wrangling.
 # Importing python packages
+import numpy as np
 import pandas as pd
 
+from backend import collect, dispatch, to_backend
+from geography import fips_codes, fips_names, geo_merge
+from missingness import profile_missing
+from precision import apply_precision, compact_series
+from profiling import frame_bytes, stage
+from validation import set_rules, validate_stage
+
+# Copy-on-Write (the default from pandas 3.0): selections and renames share memory with the frame
+# they came from until one of them is modified, so the functions below never copy a whole frame
+# up front. Functions that change values return a new frame unless called with inplace=True.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
 # ---- Section 1: Modular Functions ----
-def add_cols(df, col_names, start_position=0):
+def add_cols(df, col_names, start_position=0, inplace=False):
     """
         Inserts a list of new column(s) at the specified position, shiftin existing columns to the right.
         Sets the default value of the newly added column(s) as " ".        
@@ -16,18 +30,22 @@ def add_cols(df, col_names, start_position=0):
             A list of column names.
         integer
             A starting column position.
+        boolean, default=False
+            Insert into df itself instead of a new DataFrame.
     
         Returns
         -------
         pandas.DataFrame
             A DataFrame containing new columns added at the specified position.
     """
-    
+    if not inplace:
+        df = df.copy(deep=False)
     for index, col in enumerate(col_names):
         df.insert(start_position + index, col, value=" ")
 
     return df
 
+@dispatch
 def remove_cols(df, col_names):
     """
         Takes a list of new column(s) and removes them from the dataframe.        
@@ -46,6 +64,7 @@ def remove_cols(df, col_names):
     
     return df_new
 
+@dispatch
 def drop_columns(df, column_strings):
     """
         Searches for certain strings in column names and drops those columns
@@ -64,12 +83,13 @@ def drop_columns(df, column_strings):
             
     """
 
-    df_dropped = df.copy()
-    for search_string in column_strings: 
-        df_dropped = df_dropped.drop([col for col in df_dropped.columns if search_string in col], axis = 1)
+    # Find every matching column first, then drop them all at once.
+    cols_to_drop = [col for col in df.columns if any(search_string in col for search_string in column_strings)]
+    df_dropped = df.drop(cols_to_drop, axis = 1)
 
     return df_dropped
 
+@dispatch
 def remove_rows(df, col, row_values):
     """
         Removes specific rows when a specific value is in place in a DataFrame.
@@ -92,7 +112,7 @@ def remove_rows(df, col, row_values):
 
     return df_new
     
-def remove_nan_cols(df):
+def remove_nan_cols(df, profile=None):
     """
         Removes all empty columns in a DataFrame.
     
@@ -100,16 +120,23 @@ def remove_nan_cols(df):
         ----------
         pandas.DataFrame
             A DataFrame containing all original columns
+        MissingProfile, optional
+            Missing value profile of df (see missingness.py); without one the empty columns are
+            found with DataFrame.dropna.
     
         Returns
         -------
         pandas.DataFrame
             A DataFrame containing non-empty columns.
     """
-    df_drop_cols = df.dropna(axis=1, how='all')
+    if profile is None:
+        return df.dropna(axis=1, how='all')
+    profile.check(df)
+
+    df_drop_cols = df.loc[:, ~profile.empty_columns(df.columns).to_numpy()]
     return df_drop_cols
 
-def remove_nan_rows(df):
+def remove_nan_rows(df, profile=None, columns=None):
     """
         Removes all empty rows in a DataFrame.
     
@@ -117,6 +144,12 @@ def remove_nan_rows(df):
         ----------
         pandas.DataFrame
             A DataFrame containing all original rows
+        MissingProfile, optional
+            Missing value profile of df or of a frame with more columns and the same rows (e.g.
+            the profile used by remove_nan_cols); without one the empty rows are found with
+            DataFrame.dropna.
+        list, optional
+            Columns that must be blank, defaults to the columns from the 4th column onwards.
     
         Returns
         -------
@@ -124,13 +157,16 @@ def remove_nan_rows(df):
             A DataFrame containing non-empty rows.
     """
     # Drop rows where all columns from the 4th column onwards are blank
-    cols_to_check = df.columns[3:]
-    # Use dropna on the subset of columns
-    df_drop_rows = df.dropna(how='all', subset=cols_to_check)
+    cols_to_check = df.columns[3:] if columns is None else columns
+    if profile is None:
+        return df.dropna(how='all', subset=cols_to_check)
+    profile.check(df)
+
+    df_drop_rows = df[~profile.empty_rows(cols_to_check).to_numpy()]
     
     return df_drop_rows
 
-def col_name_changer(df, og_string, new_string):
+def col_name_changer(df, og_string, new_string, inplace=False):
     """
         Updates all column names.
     
@@ -142,16 +178,23 @@ def col_name_changer(df, og_string, new_string):
             Original String or set of characters within the column name to replace.
         string.new_string
             New string or set of characters to be replaced to in the column name.
+        boolean, default=False
+            Rename the columns of df itself instead of a new DataFrame.
     
         Returns
         -------
         pandas.DataFrame
             A DataFrame containing new column names.
     """
-    df.columns = [col.replace(og_string, new_string) for col in df.columns]
+    new_columns = [col.replace(og_string, new_string) for col in df.columns]
+    if not inplace:
+        # Shares the data with df, only the labels are new.
+        return df.set_axis(new_columns, axis=1)
+    df.columns = new_columns
 
     return df
 
+@dispatch
 def rename_columns(df, column_name_mappings):
     """
         Changes column names
@@ -173,6 +216,7 @@ def rename_columns(df, column_name_mappings):
 
     return df
 
+@dispatch
 def column_value_changer(df, column_name, rename_mapping):
     """
         Renames values within a specified column
@@ -193,11 +237,12 @@ def column_value_changer(df, column_name, rename_mapping):
             
             
     """
-    df_renamed = df.copy()
-    df_renamed[column_name] = df_renamed[column_name].replace(rename_mapping)
+    # Only the changed column is new; the others are shared with df.
+    df_renamed = df.assign(**{column_name: df[column_name].replace(rename_mapping)})
 
     return df_renamed
 
+@dispatch
 def filter_dataframe(df, columns_with_include, values_to_include,
                     columns_with_exclude, values_to_exclude):
     """
@@ -237,24 +282,26 @@ def filter_dataframe(df, columns_with_include, values_to_include,
     if missing_cols:
         raise KeyError(f"The following columns were not found in the DataFrame: {missing_cols}")
 
-    # create copy to filter
-    filtered_df = df.copy()
+    # combine every condition into one row mask, so the rows are only gathered once
+    keep = np.ones(len(df), dtype=bool)
 
     # zip to match include column list with values to include
     for col, val_list in zip(columns_with_include, values_to_include):
         # apply filter for included values
-        filtered_df = filtered_df[filtered_df[col].isin(val_list)]
+        keep &= df[col].isin(val_list).to_numpy()
 
     # zip to match exclude column list with values to exclude
     for col, val_list in zip(columns_with_exclude, values_to_exclude):
         # apply filter for excluded values
-        filtered_df = filtered_df[~filtered_df[col].isin(val_list)]
+        keep &= ~df[col].isin(val_list).to_numpy()
+
+    filtered_df = df[keep]
         
     return filtered_df
 
 
 
-def remove_leading_wspace(df, col_names):
+def remove_leading_wspace(df, col_names, inplace=False):
     """
         Remove leading white spaces from column.
     
@@ -264,16 +311,21 @@ def remove_leading_wspace(df, col_names):
             A DataFrame containing all original rows
         string
             Name of the column(s)
+        boolean, default=False
+            Update df itself instead of a new DataFrame.
     
         Returns
         -------
         pandas.DataFrame
         
     """
+    if not inplace:
+        df = df.copy(deep=False)
     df[col_names] = df[col_names].str.lstrip()
     
     return df
 
+@dispatch
 def df_split(df, col_names, value1, value2):
     """
         Takes a Dataframe and splits on a column name and string.
@@ -291,12 +343,13 @@ def df_split(df, col_names, value1, value2):
             1. A DataFrame containing rows with only the State.
             2. A DataFrame containing rows with the City, State.
     """
-    df_value1 = df[df[col_names] == value1].copy()
-    df_value2 =  df[df[col_names] == value2].copy()
+    df_value1 = df[df[col_names] == value1]
+    df_value2 =  df[df[col_names] == value2]
 
     return df_value1, df_value2
 
-def df_combo(df1, df2, col_name, how):
+@dispatch
+def df_combo(df1, df2, col_name, how, geo_key=False):
     """
         Merges 2 DataFrames together on Column and join type.
     
@@ -308,6 +361,8 @@ def df_combo(df1, df2, col_name, how):
             Name of the column(s)
         string
             Type of join
+        boolean, default=False
+            Join on the integer FIPS code of the geography names in col_name (see geography.py)
     
         Returns
         -------
@@ -315,11 +370,97 @@ def df_combo(df1, df2, col_name, how):
             1. A DataFrame containing rows with only the State.
             2. A DataFrame containing rows with the City, State.
     """
+    if geo_key:
+        return apply_precision(geo_merge(df1, df2, col_name, how))
+
     df_combined = pd.merge(df1, df2, on=col_name, how=how)
-    return df_combined
+    # Missing rows turn small integer columns into float64; store them with the precision policy again.
+    return apply_precision(df_combined)
 
 
+def df_combo_many(dfs, col_name, how='outer', names=None, geo_key=False):
+    """
+        Merges any number of DataFrames on a shared key column in one pass. The keys of every source
+        are looked up once in a sorted index of all keys and each source is placed in the output once, so
+        the cost grows with the total size of the sources instead of re-merging an ever wider frame.
+
+        Parameters
+        ----------
+        dfs : list of pandas.DataFrame
+            Sources with one row per key (e.g. one row per State).
+        col_name : str
+            Name of the key column present in every source.
+        how : str, default='outer'
+            'outer' keeps every key, 'inner' only keys found in all sources, 'left' the keys of the first source.
+        names : list, optional
+            Source names used in the report (defaults to 'source 0', 'source 1', ...).
+        geo_key : boolean, default=False
+            Align on the integer FIPS code of the geography names in col_name (see geography.py).
+
+        Returns
+        -------
+        tuple
+            1. The merged DataFrame, sorted by key.
+            2. A DataFrame with one row per source: n_keys, the keys of the output missing from the
+               source ('missing') and the keys of the source dropped from the output ('dropped').
+    """
+    if how not in ('outer', 'inner', 'left'):
+        raise ValueError(f"how must be 'outer', 'inner' or 'left', got '{how}'")
+    names = [f'source {i}' for i in range(len(dfs))] if names is None else list(names)
+
+    value_cols = pd.Index([col for df in dfs for col in df.columns if col != col_name])
+    overlap = sorted(set(value_cols[value_cols.duplicated()]))
+    if overlap:
+        raise ValueError(f"The following columns appear in more than one source: {overlap}")
+
+    source_keys = []
+    for name, df in zip(names, dfs):
+        keys = fips_codes(df[col_name]) if geo_key else df[col_name]
+        if geo_key and keys.isna().any():
+            unknown = sorted(set(df[col_name][keys.isna().to_numpy()]))
+            raise KeyError(f"The following geographies are not in the geography index: {unknown}")
+        keys = pd.Index(keys)
+        if keys.has_duplicates:
+            raise ValueError(f"Source '{name}' has duplicated values in '{col_name}'")
+        source_keys.append(keys)
+
+    # Position of every source row in one sorted index of all keys.
+    all_keys = source_keys[0].append(source_keys[1:]).unique().sort_values()
+    positions = [all_keys.get_indexer(keys) for keys in source_keys]
+    found = np.zeros((len(dfs), len(all_keys)), dtype=bool)
+    for i, pos in enumerate(positions):
+        found[i, pos] = True
+
+    if how == 'outer':
+        keep = np.ones(len(all_keys), dtype=bool)
+    elif how == 'inner':
+        keep = found.all(axis=0)
+    else:
+        keep = found[0]
+    out_keys = all_keys[keep]
+    out_pos = np.cumsum(keep) - 1
 
+    out_index = pd.RangeIndex(len(out_keys))
+    blocks = [pd.DataFrame({col_name: fips_names(out_keys).to_numpy() if geo_key else out_keys.to_numpy()})]
+    report = []
+    for name, df, keys, pos in zip(names, dfs, source_keys, positions):
+        # Label every kept source row with its output row; reindex fills the rest with NaN block by block.
+        kept = keep[pos]
+        block = df.drop(columns=[col_name])[kept]
+        blocks.append(block.set_axis(out_pos[pos[kept]]).reindex(out_index))
+
+        present = np.zeros(len(all_keys), dtype=bool)
+        present[pos] = True
+        missing = all_keys[keep & ~present]
+        report.append({'source': name, 'n_keys': len(keys),
+                       'missing': list(fips_names(missing) if geo_key else missing),
+                       'dropped': list(df[col_name][~kept])})
+
+    return apply_precision(pd.concat(blocks, axis=1)), pd.DataFrame(report).set_index('source')
+
+
+
+@dispatch
 def select_columns(df, column_names):
     """
         Selects specified columns from a data frame
@@ -341,13 +482,89 @@ def select_columns(df, column_names):
 
     return df_specific_columns
 
-def df_transpose():
-    print("transpose df")
+def _metric_paths(labels):
+    """
+        Full '!!' paths of the metric labels of a native Census table. Labels that are already
+        paths are kept; indented labels (4 spaces or non-breaking spaces per level) are joined
+        to the labels they are nested under. Repeated paths are numbered like repeated columns
+        of pandas.read_csv, so they match the columns of the transposed file.
+    """
+    paths, parents = [], []
+    for label in labels:
+        label = '' if pd.isna(label) else str(label)
+        if '!!' in label:
+            paths.append(label.strip())
+            continue
+        name = label.lstrip(' \xa0')
+        level = (len(label) - len(name)) // 4
+        parents = parents[:level] + [name.strip()]
+        paths.append('!!'.join(parents))
+
+    # Repeated paths get the '.1', '.2' ... suffixes pandas gives repeated column names.
+    seen = {}
+    for i, path in enumerate(paths):
+        if path in seen:
+            seen[path] += 1
+            paths[i] = f'{path}.{seen[path]}'
+        else:
+            seen[path] = 0
+
+    return paths
+
+def _in_population_group(col, population_group):
+    # Location columns name their population group between the location and the measure.
+    parts = [part.strip() for part in str(col).split('!!')]
+    return len(parts) <= 2 or parts[1] == population_group
+
+def df_transpose(df, population_group='Total population', drop_empty=True):
+    """
+        Turns a census table in the orientation of the Census download (one row per metric, one
+        Estimate and one Margin of Error column per location, e.g. 'Alabama!!Total population!!Estimate')
+        into the state-by-metric frame: one Estimate and one Margin of Error row per location.
+        This is the frame add_cols, df_formater, remove_nan_cols and remove_nan_rows build from
+        the manually transposed file.
+    
+        Parameters
+        ----------
+        pandas.DataFrame
+            The native census table, the metric labels in the first column.
+        string, default='Total population'
+            Population group of the location columns to keep (selected population profiles hold
+            several); columns without a group are always kept.
+        boolean, default=True
+            Drop the metrics and the rows without any value (section headings, empty groups).
+    
+        Returns
+        -------
+        pandas.DataFrame
+            Columns State, Label (Grouping) and one column per metric ('!!' path), values as strings.
+    """
+    metrics = _metric_paths(df.iloc[:, 0])
+    keep, states, labels = [], [], []
+    for col in df.columns[1:]:
+        if not _in_population_group(col, population_group):
+            continue
+        parts = [part.strip() for part in str(col).split('!!')]
+        keep.append(col)
+        states.append(parts[0])
+        labels.append(parts[-1])
+
+    # One location column at a time becomes one row; only this block is held as objects.
+    values = df[keep].to_numpy(dtype=object, na_value=np.nan).T
+    present = pd.notna(values)
+    rows = present.any(axis=1) if drop_empty else np.ones(len(keep), dtype=bool)
+    cols = present.any(axis=0) if drop_empty else np.ones(len(metrics), dtype=bool)
+
+    df_native = pd.DataFrame(values[rows][:, cols], columns=pd.Index(metrics)[cols], dtype='str')
+    df_native.insert(0, 'State', pd.array(np.array(states, dtype=object)[rows], dtype='str'))
+    df_native.insert(1, 'Label (Grouping)', pd.array(np.array(labels, dtype=object)[rows], dtype='str'))
+
+    return df_native
 
     
 # ---- Section 2: Specific Functions for Census Data ----
 
-def df_formater(df):
+def df_formater(df, inplace=False):
     """
         Formats the DataFrame, but adding the State to the correct row.
     
@@ -355,29 +572,22 @@ def df_formater(df):
         ----------
         pandas.DataFrame
             A DataFrame containing all original rows.
-        string.list
-            A list of column names.
-        integer
-            A starting column position.
+        boolean, default=False
+            Fill the State column of df itself instead of a new DataFrame.
     
         Returns
         -------
         pandas.DataFrame
-            A DataFrame containing new columns added at the specified position.
+            A DataFrame with the State filled in on every row.
     """
     
     check_list = ['Total population', 'Estimate', 'Margin of Error']
-    fill_value = None
-    for index, row in df.iterrows():
-        value = row['Label (Grouping)'].lstrip()
-        # print(value)
-        if value not in check_list:
-            fill_value = value
-            # print(fill_value)
-            df.at[index, 'State'] = fill_value
-        elif value in check_list:
-            fill_value2 = fill_value
-            df.at[index, 'State'] = fill_value2          
+    # Every label that is not in the check list names a location; the rows below it belong to it.
+    labels = df['Label (Grouping)'].str.lstrip()
+    states = labels.where(~labels.isin(check_list)).ffill()
+    if not inplace:
+        df = df.copy(deep=False)
+    df['State'] = states
         
     return df
     
@@ -399,22 +609,24 @@ def df_split_state_city(df, col_names):
     # Rows with just the State (no comma)
     df_state_only = df[~df[col_names].str.contains(',')].reset_index(drop=True)
     # Remove leading white spaces from column 'Label (Grouping)'
-    df_state_only = remove_leading_wspace(df_state_only, 'Label (Grouping)')
+    df_state_only = remove_leading_wspace(df_state_only, 'Label (Grouping)', inplace=True)
     
     # Rows with city and State (contains a comma)
     df_state_city = df[df[col_names].str.contains(',')].reset_index(drop=True)
     # Remove leading white spaces from column 'Label (Grouping)'
-    df_state_city = remove_leading_wspace(df_state_city, 'Label (Grouping)')
+    df_state_city = remove_leading_wspace(df_state_city, 'Label (Grouping)', inplace=True)
 
     return df_state_only, df_state_city
 
-def remove_percent(df):
+def remove_percent(df, inplace=False):
     """
         Removes the percent character (%) within the columnes that have percent values.
     
         Parameters
         ----------
         df : pandas.DataFrame
+        inplace : bool, default=False
+            Update df itself instead of a new DataFrame.
  
         Returns
         -------
@@ -423,10 +635,15 @@ def remove_percent(df):
             
             
     """
+    if not inplace:
+        df = df.copy(deep=False)
+    percent_cols = {}
     for col in df.columns:
-        if df[col].astype(str).str.contains('%').any():
-            df[col] = df[col].astype(str).str.replace('%', '', regex=False)
-            df.rename(columns={col: f"{col} - %"}, inplace=True)
+        values = df[col].astype(str)
+        if values.str.contains('%', regex=False).any():
+            df[col] = values.str.replace('%', '', regex=False)
+            percent_cols[col] = f"{col} - %"
+    df.rename(columns=percent_cols, inplace=True)
     return df
 
 def remove_symbol(df):
@@ -447,22 +664,8 @@ def remove_symbol(df):
     df = df.astype(str).replace('±', '', regex=True)
     return df
 
-def census_filter_cols(df):
-    """
-       Filtes down to a specific set of columsn for the census DataFrame.
-    
-        Parameters
-        ----------
-        pandas.DataFrame
-            A DataFrame containing all original rows
-    
-        Returns
-        -------
-        pandas.DataFrame
-            1. A DataFrame containing only the specific columns.
-    """
-    
-    final_col_list = [
+# The 60 census columns kept by census_filter_cols.
+CENSUS_COLUMNS = [
     'State',
     'Label (Grouping)',
     'SEX AND AGE!!Total population',
@@ -523,8 +726,27 @@ def census_filter_cols(df):
     'SELECTED MONTHLY OWNER COSTS AS A PERCENTAGE OF HOUSEHOLD INCOME IN THE PAST 12 MONTHS!!Housing units with a mortgage (excluding units where SMOC cannot be computed)',
     'SELECTED MONTHLY OWNER COSTS AS A PERCENTAGE OF HOUSEHOLD INCOME IN THE PAST 12 MONTHS!!Housing units with a mortgage (excluding units where SMOC cannot be computed)!!Less than 30 percent',
     'SELECTED MONTHLY OWNER COSTS AS A PERCENTAGE OF HOUSEHOLD INCOME IN THE PAST 12 MONTHS!!Housing units with a mortgage (excluding units where SMOC cannot be computed)!!30 percent or more'
-    ]
-    df_only_cols = df[final_col_list]
+]
+
+# census_filter_cols must give exactly these columns (checked by validation.py).
+set_rules('census_columns', [{'rule': 'columns', 'columns': CENSUS_COLUMNS}])
+
+def census_filter_cols(df):
+    """
+       Filtes down to a specific set of columsn for the census DataFrame.
+    
+        Parameters
+        ----------
+        pandas.DataFrame
+            A DataFrame containing all original rows
+    
+        Returns
+        -------
+        pandas.DataFrame
+            1. A DataFrame containing only the specific columns.
+    """
+    
+    df_only_cols = df[CENSUS_COLUMNS]
 
     return df_only_cols
 
@@ -608,7 +830,7 @@ def census_rename_cols(df):
     return df_rename_cols
     
 
-def numeric_converter(df, start_col=0):
+def numeric_converter(df, start_col=0, inplace=False):
     """
        Converts the values within a DataFrame into numeric.
     
@@ -618,6 +840,8 @@ def numeric_converter(df, start_col=0):
             A DataFrame containing all original rows
         int.start_col
             what column to start.
+        boolean, default=False
+            Convert the columns of df itself instead of a new DataFrame.
     
         Returns
         -------
@@ -628,10 +852,107 @@ def numeric_converter(df, start_col=0):
         cols_to_convert = df.columns[:]
     else:
         cols_to_convert = df.columns[start_col:]
-        
+
+    if not inplace:
+        df = df.copy(deep=False)
     for col in cols_to_convert:
-        df[col] = df[col].str.replace(',', '', regex=False)
-        df[col] = pd.to_numeric(df[col], errors='coerce')
+        # float64, or the compact dtype of the column when a precision policy is set (see precision.py)
+        df[col] = compact_series(col, pd.to_numeric(df[col].str.replace(',', '', regex=False), errors='coerce'))
+    return df
+
+def census_steps(lean=False, native=False, profile=False):
+    """
+        The steps of process_census_data, in order.
+
+        Parameters
+        ----------
+        lean : bool, default=False
+            Steps of the lean mode (see process_census_data).
+        native : bool, default=False
+            Steps for the state-by-metric frame of df_transpose/load_census_native, which needs
+            no State formatting and no blank row or column removal.
+        profile : bool, default=False
+            Build the missing value profile of the census data (recorded in the profiling trace)
+            and use it for both the blank column and the blank row removal.
+
+        Returns
+        -------
+        list
+            (name, function) pairs; each function takes the frame of the previous step.
+    """
+    state_remove = ['Guam', 'District of Columbia', 'Puerto Rico', 'United States', 'Virgin Islands']
+    # When requested, one missing value profile serves both blank column and blank row removal.
+    profiles = {}
+
+    def blank_cols(d):
+        if profile:
+            profiles['census'] = profile_missing(d, 'census')
+        return remove_nan_cols(d, profiles.get('census'))
+
+    steps = [
+        ('add_cols', lambda d: add_cols(d, ['State'], inplace=lean)),
+        ('df_formater', lambda d: df_formater(d, inplace=lean)),
+        ('remove_nan_cols', blank_cols),
+        ('remove_nan_rows', lambda d: remove_nan_rows(d, profiles.pop('census', None))),
+        ('df_split_state_city', lambda d: df_split_state_city(d, 'State')[0]),
+        ('remove_rows', lambda d: remove_rows(d, 'State', state_remove)),
+        ('census_filter_cols', census_filter_cols),
+        ('census_rename_cols', census_rename_cols),
+        ('df_split', lambda d: df_split(d, 'Label (Grouping)', 'Estimate', 'Margin of Error')[0]),
+        ('remove_percent', lambda d: remove_percent(d, inplace=lean)),
+        ('add_prefix', lambda d: d.add_prefix('est - ').rename(columns={'est - State': 'State'})
+                                  .drop(columns=['est - Label (Grouping)'])),
+        ('numeric_converter', lambda d: numeric_converter(d, 1, inplace=lean))
+    ]
+    if native:
+        steps = steps[4:]
+    if lean:
+        # Select the columns first, so the later steps only ever touch the 60 census columns.
+        # The blank rows and columns are blank in these columns too.
+        names = [name for name, _ in steps]
+        steps.insert(0 if native else 1, steps.pop(names.index('census_filter_cols')))
+
+    return steps
+
+def process_census_data(df, lean=False, native=False, profile=False):
+    """
+        Runs through the workflow utilizing defined functions to process the census data (the steps
+        of the Census Data Wrangling section of main.ipynb). The time and peak memory of every step
+        are recorded in the profiling trace (see profiling.py).
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The raw (transposed) census data.
+        lean : bool, default=False
+            Hands df over to the pipeline: the 60 census columns are selected before the State
+            rows are formatted, steps update their frames in place and every intermediate is
+            released as soon as the next step has run. df is changed and should not be used
+            afterwards; pass it without keeping a reference, e.g.
+            process_census_data(load_csv(path), lean=True), so it is freed as well.
+            With lean=False df is left unchanged.
+        native : bool, default=False
+            df is already the state-by-metric frame of load_census_native (or df_transpose), read
+            from the Census download as it is; the State formatting and blank row and column
+            removal steps are skipped.
+        profile : bool, default=False
+            Profile the missing values of the census data before the blank rows and columns are
+            dropped (see census_steps).
+
+        Returns
+        -------
+        pandas.DataFrame
+            The finalized census data frame (one row per State).
+
+
+    """
+    for name, step in census_steps(lean, native, profile):
+        with stage(f'census - {name}', lean=lean) as record:
+            # Rebinding df drops the last reference to the previous step's frame.
+            df = step(df)
+            record['frame_bytes'] = frame_bytes(df)
+            validate_stage(f'census - {name}', df, record)
+
     return df
 
 
@@ -655,11 +976,8 @@ def stratify_dataframe(df, column, value):
             
             
     """
-    # create copy to stratify
-    stratified_df = df.copy()
-
     # apply filter to select only those rows
-    stratified_df = stratified_df[stratified_df[column]==value]
+    stratified_df = df[df[column]==value]
 
     return stratified_df
 
@@ -690,15 +1008,62 @@ def pivot_questions(df):
     # reset the index
     df = df.reset_index()
 
-    return df
+    return apply_precision(df)
+
+# Rows of the raw chronic disease data kept by process_chronic_disease_data - year, data type, question, and state.
+CDI_COLUMNS_INCLUDE = ['YearStart','DataValueType','Question']
+CDI_VALUES_INCLUDE = [[2022],['Crude Prevalence'],['Diabetes among adults','Obesity among adults','Arthritis among adults',
+                                                   'Food insecure in the past 12 months among households',
+                                                   'Chronic obstructive pulmonary disease among adults',
+                                                   'Lack of health insurance among adults aged 18-64',
+                                                   'Lack of reliable transportation in the past 12 months among adults',
+                                                   'Unable to pay mortgage, rent, or utility bills in the past 12 months among adults',
+                                                   'Current asthma among adults']]
+CDI_COLUMNS_EXCLUDE = ['LocationDesc']
+CDI_VALUES_EXCLUDE = [['Guam','District of Columbia','Puerto Rico','United States','Virgin Islands']]
+
+# Readable names of the questions.
+CDI_QUESTION_NAMES = {'Arthritis among adults': 'Arthritis', 
+                      'Current asthma among adults': 'Asthma',
+                      'Unable to pay mortgage, rent, or utility bills in the past 12 months among adults': 'Bill Payment Instability',
+                      'Obesity among adults': 'Obesity',
+                      'Diabetes among adults': 'Diabetes',
+                      'Lack of reliable transportation in the past 12 months among adults': 'Transportation Instability',
+                      'Chronic obstructive pulmonary disease among adults': 'COPD'
+                     }
 
-def process_chronic_disease_data():
+# Columns of interest of the chronic disease data.
+CDI_COLUMNS = ['LocationDesc','Question','DataValueUnit','DataValue',
+               'Stratification1','LowConfidenceLimit','HighConfidenceLimit',
+               'Geolocation']
+
+# Stratifications that become column groups of the chronic disease table.
+STRATIFICATIONS = [
+    'Overall', 'Male', 'Female',
+    'Hispanic', 'White, non-Hispanic', 'Black, non-Hispanic',
+    'Hawaiian or Pacific Islander, non-Hispanic',
+    'American Indian or Alaska Native, non-Hispanic',
+    'Asian, non-Hispanic',
+    'Multiracial, non-Hispanic'
+]
+
+def process_chronic_disease_data(df, years=None, questions=None, values_exclude=None,
+                                 stratifications=None):
     """
         Runs through the workflow utilizing defined functions to process the chronic disease data
     
         Parameters
         ----------
-        None
+        df : pandas.DataFrame, polars.LazyFrame or duckdb.DuckDBPyRelation
+            The raw chronic disease indicators data (filtered on the BACKEND setting of backend.py)
+        years : list, optional
+            Values of 'YearStart' to keep, defaults to the years of CDI_VALUES_INCLUDE.
+        questions : list, optional
+            Values of 'Question' to keep, defaults to the questions of CDI_VALUES_INCLUDE.
+        values_exclude : list, optional
+            Locations to remove, defaults to CDI_VALUES_EXCLUDE.
+        stratifications : list, optional
+            Stratifications that become column groups, defaults to STRATIFICATIONS.
  
         Returns
         -------
@@ -708,38 +1073,30 @@ def process_chronic_disease_data():
             
     """
     # filter values in raw chronic disease data - year, data type, question, and state
-    columns_include = ['YearStart','DataValueType','Question']
-    values_include = [[2022],['Crude Prevalence'],['Diabetes among adults','Obesity among adults','Arthritis among adults',
-                                                    'Food insecure in the past 12 months among households',
-                                                    'Chronic obstructive pulmonary disease among adults',
-                                                    'Lack of health insurance among adults aged 18-64',
-                                                    'Lack of reliable transportation in the past 12 months among adults',
-                                                    'Unable to pay mortgage, rent, or utility bills in the past 12 months among adults',
-                                                    'Current asthma among adults']]
-    columns_exclude = ['LocationDesc']
-    values_exclude = [['Guam','District of Columbia','Puerto Rico','United States','Virgin Islands']]
-    
-    cd_filtered_df = filter_dataframe(df = df_indicators_raw,
-                                   columns_with_include = columns_include,
-                                   values_to_include = values_include,
-                                   columns_with_exclude = columns_exclude,
-                                   values_to_exclude = values_exclude)
+    columns_include = CDI_COLUMNS_INCLUDE
+    values_include = [CDI_VALUES_INCLUDE[0] if years is None else list(years),
+                      CDI_VALUES_INCLUDE[1],
+                      CDI_VALUES_INCLUDE[2] if questions is None else list(questions)]
+    columns_exclude = CDI_COLUMNS_EXCLUDE
+    values_exclude = CDI_VALUES_EXCLUDE if values_exclude is None else [list(values_exclude)]
+    
+    # the filter runs on the BACKEND setting (it reads the whole raw file); the kept rows come back
+    # as pandas because stratify_dataframe and pivot_questions only run on pandas
+    with stage('chronic - filter_dataframe') as record:
+        cd_filtered_df = collect(filter_dataframe(df = to_backend(df),
+                                                  columns_with_include = columns_include,
+                                                  values_to_include = values_include,
+                                                  columns_with_exclude = columns_exclude,
+                                                  values_to_exclude = values_exclude))
+        record['frame_bytes'] = frame_bytes(cd_filtered_df)
+        validate_stage('chronic - filter_dataframe', cd_filtered_df, record)
     # update values in the 'Question' column to readable names
-    cd_rename_mapping_dict = {'Arthritis among adults': 'Arthritis', 
-                      'Current asthma among adults': 'Asthma',
-                      'Unable to pay mortgage, rent, or utility bills in the past 12 months among adults': 'Bill Payment Instability',
-                      'Obesity among adults': 'Obesity',
-                      'Diabetes among adults': 'Diabetes',
-                      'Lack of reliable transportation in the past 12 months among adults': 'Transportation Instability',
-                      'Chronic obstructive pulmonary disease among adults': 'COPD'
-                     }
+    cd_rename_mapping_dict = CDI_QUESTION_NAMES
     
     cd_renamed_df = column_value_changer(cd_filtered_df, 'Question', cd_rename_mapping_dict)
 
     # select columns of interest
-    cd_column_name_list = ['LocationDesc','Question','DataValueUnit','DataValue',
-                        'Stratification1','LowConfidenceLimit','HighConfidenceLimit',
-                        'Geolocation']
+    cd_column_name_list = CDI_COLUMNS
     
     cd_selected_columns = select_columns(cd_renamed_df, cd_column_name_list)
 
@@ -750,15 +1107,7 @@ def process_chronic_disease_data():
     # process each stratification and append to a list 
     
     cd_processed_dfs = []
-    stratifications = [
-        'Overall', 'Male', 'Female',
-        'Hispanic', 'White, non-Hispanic', 'Black, non-Hispanic',
-        'Hawaiian or Pacific Islander, non-Hispanic',
-        'American Indian or Alaska Native, non-Hispanic',
-        'Asian, non-Hispanic',
-        'Multiracial, non-Hispanic'
-    ]
-                       
+    stratifications = STRATIFICATIONS if stratifications is None else list(stratifications)
     
     for strat in stratifications:
         # filter to the specified value
@@ -772,10 +1121,11 @@ def process_chronic_disease_data():
         
         cd_processed_dfs.append(temp_df)
     
-    # merge all processed chronic disease dataframes together 
-    chronic_disease_final = cd_processed_dfs[0]
-    for next_df in cd_processed_dfs[1:]:
-        chronic_disease_final = pd.merge(chronic_disease_final, next_df, on='State', how='outer')
+    # merge all processed chronic disease dataframes together in one pass
+    with stage('chronic - df_combo_many') as record:
+        chronic_disease_final, _ = df_combo_many(cd_processed_dfs, 'State', how='outer', names=stratifications)
+        record['frame_bytes'] = frame_bytes(chronic_disease_final)
+        validate_stage('chronic - df_combo_many', chronic_disease_final, record)
 
     return chronic_disease_final
     
@@ -865,8 +1215,8 @@ def diabete_v_overall(df):
     
     df_temp1 = select_columns(df, cols)
 
-    # Need to make a copy b/c pandas warning you about “chained assignment”.
-    df_final= df_temp1.copy()
+    # With Copy-on-Write the new columns only go into df_final, so no copy is needed.
+    df_final = df_temp1
 
     # Calculating total population sub-groups.
     df_final['Total Pop 18 and Over'] = df_final['est - Total Pop'] * (df_final['est - Total Pop 18 and Over - %'] / 100)
@@ -878,7 +1228,7 @@ def diabete_v_overall(df):
     df_final['Diabetes Prevalance - Males 18 and over'] = df_final['Total Pop 18 and Over – Male'] * (df_final['Males - Diabetes-DataValue'] /100)
     df_final['Diabetes Prevalance - Females 18 and over'] = df_final['Total Pop 18 and Over – Female'] * (df_final['Females - Diabetes-DataValue'] / 100)
 
-    return df_final
+    return apply_precision(df_final)
 
 def diabete_v_educated(df):
     """
@@ -904,13 +1254,13 @@ def diabete_v_educated(df):
     
     df_temp1 = select_columns(df, cols)
 
-    # Need to make a copy b/c pandas warning you about “chained assignment”.
-    df_final = df_temp1.copy()
+    # With Copy-on-Write the new columns only go into df_final, so no copy is needed.
+    df_final = df_temp1
 
     # Cacluating total Diabetes "Crude Prevalence" for each sup group.
     df_final['Diabetes Prevalance - 25 and over - Edu'] = df_final['est - Pop 25 and Over - Educated'] * (df_final['Overall - Diabetes-DataValue'] /100)
 
-    return df_final
+    return apply_precision(df_final)
 
 def diabete_v_employement(df):
     """
@@ -941,8 +1291,8 @@ def diabete_v_employement(df):
 
     df_temp1 = select_columns(df, cols)
 
-    # Need to make a copy b/c pandas warning you about “chained assignment”.
-    df_final= df_temp1.copy()
+    # With Copy-on-Write the new columns only go into df_final, so no copy is needed.
+    df_final = df_temp1
 
     # Calculating total population sub-groups.
     df_final['Total Pop 16 and Over - Employed'] = df_final['est - Pop 16 and Over'] * (df_final['est - Pop 16 and Over – Employed - %'] / 100)
@@ -953,7 +1303,7 @@ def diabete_v_employement(df):
     df_final['Diabetes Prevalance - 16 and Over - Employed'] = df_final['Total Pop 16 and Over - Employed'] * (df_final['Overall - Diabetes-DataValue'] / 100)
     df_final['Total Pop 16 and Over - Unemployed'] = df_final['Total Pop 16 and Over - Unemployed'] * (df_final['Overall - Diabetes-DataValue'] / 100)
 
-    return df_final
+    return apply_precision(df_final)
 
 def diabete_v_commute(df):
     """
@@ -985,8 +1335,8 @@ def diabete_v_commute(df):
 
     df_temp1 = select_columns(df, cols)
 
-    # Need to make a copy b/c pandas warning you about “chained assignment”.
-    df_final= df_temp1.copy()
+    # With Copy-on-Write the new columns only go into df_final, so no copy is needed.
+    df_final = df_temp1
 
     # Calculating total population sub-groups.
     df_final['Workers 16 and Over - That Drive or Carpool'] = df_final['est - Workers 16 and Over'] * ((df_final['est - Workers 16 and Over – Drove Alone - %'] + df_final['est - Workers 16 and Over – Carpooled - %'])/ 100)
@@ -1002,7 +1352,7 @@ def diabete_v_commute(df):
     df_final['Diabetes Prevalance - People Who Use Other Transport'] = df_final['Workers 16 and Over - Other Transport'] * (df_final['Overall - Diabetes-DataValue'] / 100)
     df_final['Diabetes Prevalance - People Who WFH'] = df_final['Workers 16 and Over - WFH'] * (df_final['Overall - Diabetes-DataValue'] / 100)
     
-    return df_final
+    return apply_precision(df_final)
 
 def diabete_v_income(df):
     """
@@ -1033,8 +1383,8 @@ def diabete_v_income(df):
 
     df_temp1 = select_columns(df, cols)
 
-    # Need to make a copy b/c pandas warning you about “chained assignment”.
-    df_final= df_temp1.copy()
+    # With Copy-on-Write the new columns only go into df_final, so no copy is needed.
+    df_final = df_temp1
 
     # Calculating total population sub-groups.
     df_final['Households with Earnings'] = df_final['est - Households With Income'] * (df_final['est - Households With Earnings - %'] / 100)
@@ -1060,7 +1410,7 @@ def diabete_v_income(df):
     df_final['Diabetes Prevalance - Households with SNAP'] = df_final['Households with SNAP'] * (df_final['Overall - Diabetes-DataValue'] / 100)
     df_final['Diabetes Prevalance - Financial Assistant'] = df_final['Households with Financial Assistant'] * (df_final['Overall - Diabetes-DataValue'] / 100)
 
-    return df_final
+    return apply_precision(df_final)
 
 def diabete_v_health_insurance(df):
     """
@@ -1089,8 +1439,8 @@ def diabete_v_health_insurance(df):
 
     df_temp1 = select_columns(df, cols)
 
-    # Need to make a copy b/c pandas warning you about “chained assignment”.
-    df_final= df_temp1.copy()
+    # With Copy-on-Write the new columns only go into df_final, so no copy is needed.
+    df_final = df_temp1
 
     # Calculating total population sub-groups.
     df_final['Pop with Private Health Insurance'] = df_final['est - Civilian Noninstitutionalized Pop'] * (df_final['est - Pop With Private Health Insurance - %'] / 100)
@@ -1104,7 +1454,7 @@ def diabete_v_health_insurance(df):
     df_final['Diabetes Prevalance - Pop with Health Insurance'] = df_final['Pop with Health Insurance'] * (df_final['Overall - Diabetes-DataValue'] / 100)
     df_final['Diabetes Prevalance - Pop without Health Insurance'] = df_final['Pop with Without Health Insurance'] * (df_final['Overall - Diabetes-DataValue'] / 100)
 
-    return df_final
+    return apply_precision(df_final)
 
 def diabete_v_poverty(df):
     """
@@ -1132,8 +1482,8 @@ def diabete_v_poverty(df):
 
     df_temp1 = select_columns(df, cols)
 
-    # Need to make a copy b/c pandas warning you about “chained assignment”.
-    df_final= df_temp1.copy()
+    # With Copy-on-Write the new columns only go into df_final, so no copy is needed.
+    df_final = df_temp1
 
     # Calculating total population sub-groups.
     df_final['Total Pop 18 and Over'] = df_final['est - Total Pop'] * (df_final['est - Total Pop 18 and Over - %'] / 100)
@@ -1144,5 +1494,5 @@ def diabete_v_poverty(df):
     df_final['Diabetes Prevalance - Pop 18 and Over Below Poverty'] = df_final['Total Pop 18 and Over Below Poverty'] * (df_final['Overall - Diabetes-DataValue'] / 100)
     df_final['Diabetes Prevalance - Pop 18 and Over Above Poverty'] = df_final['Total Pop 18 and Over Above Poverty'] * (df_final['Overall - Diabetes-DataValue'] / 100)
 
-    return df_final
+    return apply_precision(df_final)
     
\ No newline at end of file
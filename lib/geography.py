@@ -0,0 +1,263 @@
+# This .py file will be used for functions that map geography names to integer FIPS codes for joins and filters.
+# Importing python packages
+import numpy as np
+import pandas as pd
+
+# Name of the integer geography key column added by these functions.
+GEO_KEY = "FIPS"
+
+# Census 'Label (Grouping)' / CDI 'LocationDesc' names and their FIPS codes (0 is the nation).
+STATE_FIPS = {
+    'United States': 0,
+    'Alabama': 1, 'Alaska': 2, 'Arizona': 4, 'Arkansas': 5, 'California': 6,
+    'Colorado': 8, 'Connecticut': 9, 'Delaware': 10, 'District of Columbia': 11, 'Florida': 12,
+    'Georgia': 13, 'Hawaii': 15, 'Idaho': 16, 'Illinois': 17, 'Indiana': 18,
+    'Iowa': 19, 'Kansas': 20, 'Kentucky': 21, 'Louisiana': 22, 'Maine': 23,
+    'Maryland': 24, 'Massachusetts': 25, 'Michigan': 26, 'Minnesota': 27, 'Mississippi': 28,
+    'Missouri': 29, 'Montana': 30, 'Nebraska': 31, 'Nevada': 32, 'New Hampshire': 33,
+    'New Jersey': 34, 'New Mexico': 35, 'New York': 36, 'North Carolina': 37, 'North Dakota': 38,
+    'Ohio': 39, 'Oklahoma': 40, 'Oregon': 41, 'Pennsylvania': 42, 'Rhode Island': 44,
+    'South Carolina': 45, 'South Dakota': 46, 'Tennessee': 47, 'Texas': 48, 'Utah': 49,
+    'Vermont': 50, 'Virginia': 51, 'Washington': 53, 'West Virginia': 54, 'Wisconsin': 55,
+    'Wyoming': 56, 'Guam': 66, 'Puerto Rico': 72, 'Virgin Islands': 78
+}
+
+# Two letter abbreviations (CDI 'LocationAbbr').
+STATE_ABBR = {
+    'US': 0, 'AL': 1, 'AK': 2, 'AZ': 4, 'AR': 5, 'CA': 6, 'CO': 8, 'CT': 9, 'DE': 10, 'DC': 11,
+    'FL': 12, 'GA': 13, 'HI': 15, 'ID': 16, 'IL': 17, 'IN': 18, 'IA': 19, 'KS': 20, 'KY': 21,
+    'LA': 22, 'ME': 23, 'MD': 24, 'MA': 25, 'MI': 26, 'MN': 27, 'MS': 28, 'MO': 29, 'MT': 30,
+    'NE': 31, 'NV': 32, 'NH': 33, 'NJ': 34, 'NM': 35, 'NY': 36, 'NC': 37, 'ND': 38, 'OH': 39,
+    'OK': 40, 'OR': 41, 'PA': 42, 'RI': 44, 'SC': 45, 'SD': 46, 'TN': 47, 'TX': 48, 'UT': 49,
+    'VT': 50, 'VA': 51, 'WA': 53, 'WV': 54, 'WI': 55, 'WY': 56, 'GU': 66, 'PR': 72, 'VI': 78
+}
+
+# CDI 'LocationID' values that are not FIPS codes.
+CDI_LOCATION_ALIASES = {59: 0}
+
+FIPS_NAMES = {code: name for name, code in STATE_FIPS.items()}
+
+# BEA regions by state abbreviation.
+REGIONS = {
+    'New England': ['CT', 'ME', 'MA', 'NH', 'RI', 'VT'],
+    'Mideast': ['DE', 'DC', 'MD', 'NJ', 'NY', 'PA'],
+    'Great Lakes': ['IL', 'IN', 'MI', 'OH', 'WI'],
+    'Plains': ['IA', 'KS', 'MN', 'MO', 'NE', 'ND', 'SD'],
+    'Southeast': ['AL', 'AR', 'FL', 'GA', 'KY', 'LA', 'MS', 'NC', 'SC', 'TN', 'VA', 'WV'],
+    'Southwest': ['AZ', 'NM', 'OK', 'TX'],
+    'Rocky Mountain': ['CO', 'ID', 'MT', 'UT', 'WY'],
+    'Far West': ['AK', 'CA', 'HI', 'NV', 'OR', 'WA']
+}
+
+FIPS_REGIONS = {STATE_ABBR[abbr]: region for region, abbrs in REGIONS.items() for abbr in abbrs}
+
+
+def fips_codes(values):
+    """
+        Maps geography names or abbreviations to integer FIPS codes with a hash lookup.
+
+        Parameters
+        ----------
+        values : pandas.Series or list
+            Geography names (leading/trailing white space is ignored) or two letter abbreviations.
+
+        Returns
+        -------
+        pandas.Series
+            Nullable integer FIPS codes (<NA> for names that are not in the index).
+    """
+    names = pd.Series(values).astype("string").str.strip()
+    codes = names.map(STATE_FIPS)
+    codes = codes.fillna(names.map(STATE_ABBR))
+
+    return codes.astype("Int64")
+
+
+def cdi_location_fips(location_ids):
+    """
+        Converts CDI 'LocationID' values to FIPS codes (the national row uses 59 in the CDI file).
+
+        Parameters
+        ----------
+        location_ids : pandas.Series
+
+        Returns
+        -------
+        pandas.Series
+            Nullable integer FIPS codes.
+    """
+    ids = pd.to_numeric(pd.Series(location_ids), errors="coerce").astype("Int64")
+
+    return ids.replace(CDI_LOCATION_ALIASES)
+
+
+def fips_names(codes):
+    """
+        Maps FIPS codes back to geography names.
+
+        Parameters
+        ----------
+        codes : pandas.Series or list
+
+        Returns
+        -------
+        pandas.Series
+            Geography names.
+    """
+    return pd.Series(codes).map(FIPS_NAMES)
+
+
+def fips_regions(codes):
+    """
+        Maps FIPS codes to their BEA region (e.g. 'Southeast').
+
+        Parameters
+        ----------
+        codes : pandas.Series or list
+
+        Returns
+        -------
+        pandas.Series
+            Region names (<NA> for the nation and the territories).
+    """
+    return pd.Series(codes).map(FIPS_REGIONS)
+
+
+def region_fips(region):
+    """
+        Lists the FIPS codes of the states in a BEA region.
+
+        Parameters
+        ----------
+        region : str
+            Region name, e.g. 'Southeast'.
+
+        Returns
+        -------
+        list
+            Sorted FIPS codes.
+    """
+    if region not in REGIONS:
+        raise KeyError(f"Unknown region '{region}', use one of: {list(REGIONS)}")
+
+    return sorted(STATE_ABBR[abbr] for abbr in REGIONS[region])
+
+
+def add_fips(df, col_name, fips_col=GEO_KEY):
+    """
+        Adds an integer FIPS column next to a column of geography names.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        col_name : str
+            Column holding the geography names (e.g. 'State', 'LocationDesc').
+        fips_col : str, default="FIPS"
+            Name of the new column.
+
+        Returns
+        -------
+        pandas.DataFrame
+            A DataFrame with the FIPS column inserted right after col_name.
+    """
+    codes = fips_codes(df[col_name]).to_numpy()
+    df_fips = df.drop(columns=[fips_col], errors="ignore")
+    df_fips.insert(df_fips.columns.get_loc(col_name) + 1, fips_col, codes)
+
+    return df_fips
+
+
+def _geo_mask(df, col_name, names):
+    """
+        Boolean mask of the rows whose geography is one of names, compared on sorted integer keys.
+    """
+    if pd.api.types.is_integer_dtype(df[col_name]):
+        keys = df[col_name].to_numpy(dtype=np.int64, na_value=-1)
+    else:
+        keys = fips_codes(df[col_name]).to_numpy(dtype=np.int64, na_value=-1)
+
+    wanted = fips_codes(names)
+    unknown = [name for name, code in zip(names, wanted) if pd.isna(code)]
+    if unknown:
+        raise KeyError(f"The following geographies are not in the geography index: {unknown}")
+
+    wanted = np.sort(wanted.to_numpy(dtype=np.int64))
+    pos = np.clip(np.searchsorted(wanted, keys), 0, len(wanted) - 1)
+
+    return wanted[pos] == keys if len(wanted) else np.zeros(len(keys), dtype=bool)
+
+
+def remove_geographies(df, col_name, names):
+    """
+        Removes the rows of the listed geographies. Unlike remove_rows, the names are matched exactly
+        through their FIPS codes instead of a regex scan over the strings.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        col_name : str
+            Column with geography names, abbreviations or FIPS codes.
+        names : list
+            Geographies to remove (names or abbreviations).
+
+        Returns
+        -------
+        pandas.DataFrame
+            A DataFrame without the listed geographies.
+    """
+    return df[~_geo_mask(df, col_name, names)]
+
+
+def select_geographies(df, col_name, names):
+    """
+        Keeps only the rows of the listed geographies, matched through their FIPS codes.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        col_name : str
+            Column with geography names, abbreviations or FIPS codes.
+        names : list
+            Geographies to keep (names or abbreviations).
+
+        Returns
+        -------
+        pandas.DataFrame
+            A DataFrame with only the listed geographies.
+    """
+    return df[_geo_mask(df, col_name, names)]
+
+
+def geo_merge(df1, df2, col_name, how):
+    """
+        Merges two DataFrames on the integer FIPS code of a geography name column instead of the
+        names themselves. The name column is rebuilt from the codes, so rows that only exist in
+        df2 still get their name.
+
+        Parameters
+        ----------
+        df1, df2 : pandas.DataFrame
+        col_name : str
+            Geography name column present in both DataFrames (e.g. 'State').
+        how : str
+            Type of join.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The merged DataFrame, ordered by FIPS code.
+    """
+    left_keys = fips_codes(df1[col_name])
+    right_keys = fips_codes(df2[col_name])
+    unknown = pd.concat([df1[col_name][left_keys.isna().to_numpy()], df2[col_name][right_keys.isna().to_numpy()]])
+    if len(unknown):
+        raise KeyError(f"The following geographies are not in the geography index: {sorted(set(unknown))}")
+
+    # The integer keys go in the index, so neither input needs an extra column.
+    left = df1.set_axis(pd.Index(left_keys.to_numpy(dtype=np.int64), name=GEO_KEY))
+    right = df2.drop(columns=[col_name]).set_axis(pd.Index(right_keys.to_numpy(dtype=np.int64), name=GEO_KEY))
+
+    df_merged = pd.merge(left, right, how=how, left_index=True, right_index=True, sort=True)
+    df_merged[col_name] = df_merged[col_name].fillna(fips_names(df_merged.index.to_series(index=df_merged.index)))
+
+    return df_merged.reset_index(drop=True)
@@ -0,0 +1,285 @@
+# This .py file will be used for incremental ingestion of new Chronic Disease Indicators (CDI) releases.
+# Importing python packages
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_loader import save_df_to_csv
+from data_wrangle import (CDI_VALUES_INCLUDE, STRATIFICATIONS, df_combo, drop_columns,
+                          process_chronic_disease_data)
+
+# Columns identifying one row group of the raw CDI file.
+CDI_KEYS = ['YearStart', 'LocationID', 'QuestionID', 'StratificationID1']
+
+# Column prefixes of the processed files for the stratifications of the current CDI releases.
+PROCESSED_PREFIXES = {'Male': 'Males', 'Female': 'Females',
+                      'White, non-Hispanic': 'White', 'Black, non-Hispanic': 'Black',
+                      'Hawaiian or Pacific Islander, non-Hispanic': 'Hawaiian or Pacific Islander',
+                      'American Indian or Alaska Native, non-Hispanic': 'American Indian or Alaska Native',
+                      'Asian, non-Hispanic': 'Asian', 'Multiracial, non-Hispanic': 'Multiracial'}
+
+# Columns of the chronic disease table left out of the final dataset (see main.ipynb).
+FINAL_DROP_COLUMNS = ["White", "Black", "Hispanic", "Hawaiian or Pacific Islander",
+                      "American Indian or Alaska Native", "Multiracial", "Asian", "ConfidenceLimit"]
+
+
+def group_fingerprints(df, keys=CDI_KEYS):
+    """
+        Fingerprints every row group of a raw file. Each row is hashed over all of its columns and the
+        hashes of a group are summed, so the fingerprint does not depend on the row order and changes
+        when any value of the group changes.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Raw CDI data.
+        keys : list, default=['YearStart', 'LocationID', 'QuestionID', 'StratificationID1']
+            Columns identifying a group.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per group: the key columns, n_rows and fingerprint.
+    """
+    missing_cols = [col for col in keys if col not in df.columns]
+    if missing_cols:
+        raise KeyError(f"The following columns were not found in the DataFrame: {missing_cols}")
+
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    groups = df[keys].copy()
+    # uint64 sums wrap around, which is what we want for a hash; int64 keeps them CSV friendly.
+    groups['fingerprint'] = row_hashes.view(np.int64)
+    groups['n_rows'] = 1
+
+    fingerprints = groups.groupby(keys, dropna=False, sort=True).agg(n_rows=('n_rows', 'sum'),
+                                                                     fingerprint=('fingerprint', 'sum'))
+
+    return fingerprints.reset_index()
+
+
+def processed_rows(df_raw, years=None, questions=None, stratifications=None):
+    """
+        The rows of a raw file that process_chronic_disease_data reads, so changes to other years,
+        questions or stratifications do not mark any state as affected.
+
+        Parameters
+        ----------
+        df_raw : pandas.DataFrame
+            Raw CDI data.
+        years, questions, stratifications : list, optional
+            Same as process_chronic_disease_data (its defaults when not given).
+
+        Returns
+        -------
+        pandas.DataFrame
+    """
+    scope = {'YearStart': CDI_VALUES_INCLUDE[0] if years is None else years,
+             'DataValueType': CDI_VALUES_INCLUDE[1],
+             'Question': CDI_VALUES_INCLUDE[2] if questions is None else questions,
+             'Stratification1': STRATIFICATIONS if stratifications is None else stratifications}
+    mask = np.ones(len(df_raw), dtype=bool)
+    for col, values in scope.items():
+        mask &= df_raw[col].isin(list(values)).to_numpy()
+
+    return df_raw[mask]
+
+
+def processed_names(chronic):
+    """
+        Renames the stratification prefixes of the chronic disease table to the ones of the
+        processed files (see PROCESSED_PREFIXES), e.g. 'Male - Diabetes-DataValue' to
+        'Males - Diabetes-DataValue'.
+    """
+    renames = {}
+    for col in chronic.columns:
+        strat, sep, rest = str(col).partition(' - ')
+        if sep and strat in PROCESSED_PREFIXES:
+            renames[col] = f'{PROCESSED_PREFIXES[strat]} - {rest}'
+
+    return chronic.rename(columns=renames)
+
+
+def diff_fingerprints(old, new, keys=CDI_KEYS):
+    """
+        Compares the fingerprints of the last run with the current ones.
+
+        Parameters
+        ----------
+        old, new : pandas.DataFrame
+            Outputs of group_fingerprints (old may be empty on the first run).
+        keys : list
+            Columns identifying a group.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The key columns and a 'status' column ('added', 'changed' or 'removed') for every group
+            that is not identical in both runs.
+    """
+    if old.empty:
+        old = new.iloc[:0]
+    merged = pd.merge(old[keys + ['fingerprint']], new[keys + ['fingerprint']], on=keys,
+                      how='outer', suffixes=('_old', '_new'), indicator=True)
+    status = np.select(
+        [merged['_merge'] == 'right_only', merged['_merge'] == 'left_only',
+         merged['fingerprint_old'] != merged['fingerprint_new']],
+        ['added', 'removed', 'changed'], default='')
+    merged['status'] = status
+
+    return merged.loc[merged['status'] != '', keys + ['status']].reset_index(drop=True)
+
+
+def load_manifest(path, keys=CDI_KEYS):
+    """
+        Reads the fingerprints saved by the last run (an empty table if there was none).
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=keys + ['n_rows', 'fingerprint'])
+
+    return pd.read_csv(path)
+
+
+def affected_states(df_raw, delta, manifest, location_col='LocationDesc', keys=CDI_KEYS):
+    """
+        Names of the states whose processed rows depend on a changed group.
+
+        Parameters
+        ----------
+        df_raw : pandas.DataFrame
+            Current raw CDI data.
+        delta : pandas.DataFrame
+            Output of diff_fingerprints.
+        manifest : pandas.DataFrame
+            Fingerprints of the last run (used for groups that were removed).
+        location_col : str, default='LocationDesc'
+
+        Returns
+        -------
+        list
+    """
+    location_ids = delta['LocationID'].unique()
+    names = df_raw.loc[df_raw['LocationID'].isin(location_ids), location_col]
+    names = set(names.dropna())
+    if 'State' in manifest.columns:
+        names |= set(manifest.loc[manifest['LocationID'].isin(location_ids), 'State'].dropna())
+
+    return sorted(names)
+
+
+def _replace_rows(df_old, df_new, states, col_name='State'):
+    """
+        Replaces the rows of the given states in df_old with the rows of df_new, keeping df_old's
+        column order and ordering the result by col_name. Only the states of df_new are pivoted, so
+        columns they have no values for are missing from df_new and are filled with NaN; columns that
+        are not in df_old mean the layout changed and raise a ValueError.
+    """
+    extra = [col for col in df_new.columns if col not in df_old.columns]
+    if extra:
+        raise ValueError(f"The refreshed rows have columns that are not in the last run: {extra}")
+    kept = df_old[~df_old[col_name].isin(states)]
+    combined = pd.concat([kept, df_new.reindex(columns=df_old.columns)], ignore_index=True)
+
+    return combined.sort_values(col_name, kind='stable').reset_index(drop=True)
+
+
+def incremental_refresh(df_raw, census_final, chronic_final, final_dataset, manifest,
+                        process=process_chronic_disease_data, keys=CDI_KEYS, years=None, questions=None,
+                        stratifications=None, drop_strings=FINAL_DROP_COLUMNS):
+    """
+        Brings the processed outputs up to date with a new CDI release by recomputing only the states
+        with added, changed or removed row groups. Pivot cells of other states cannot change, so their
+        rows are reused as-is.
+
+        Parameters
+        ----------
+        df_raw : pandas.DataFrame
+            The new raw CDI release.
+        census_final : pandas.DataFrame
+            Processed census data joined into the final dataset.
+        chronic_final, final_dataset : pandas.DataFrame
+            Outputs of the last run (empty DataFrames on the first run).
+        manifest : pandas.DataFrame
+            Fingerprints of the last run (see load_manifest).
+        process : function, default=process_chronic_disease_data
+            Turns raw CDI rows into the chronic disease table (one row per State), called with the
+            years, questions and stratifications keywords.
+        keys : list
+            Columns identifying a group.
+        years, questions, stratifications : list, optional
+            Rows of the raw data that are processed, see processed_rows.
+        drop_strings : list, default=FINAL_DROP_COLUMNS
+            Columns of the chronic disease table left out of the final dataset (drop_columns).
+
+        Returns
+        -------
+        dict
+            "chronic_final", "final_dataset", "manifest" (the new fingerprints, with the State of
+            each group), "delta" (the changed groups) and "states" (the recomputed states).
+    """
+    df_raw = processed_rows(df_raw, years, questions, stratifications)
+    fingerprints = group_fingerprints(df_raw, keys)
+    states_by_id = df_raw.drop_duplicates('LocationID').set_index('LocationID')['LocationDesc']
+    fingerprints['State'] = fingerprints['LocationID'].map(states_by_id)
+
+    delta = diff_fingerprints(manifest, fingerprints, keys)
+    states = affected_states(df_raw, delta, manifest, keys=keys)
+
+    result = {"manifest": fingerprints, "delta": delta, "states": states,
+              "chronic_final": chronic_final, "final_dataset": final_dataset}
+    if not states:
+        return result
+
+    # Only the raw rows of the affected states go through the pipeline again, then the same steps
+    # as main.ipynb: drop the confidence limit and race columns and outer join the census data.
+    chronic_new = process(df_raw[df_raw['LocationDesc'].isin(states)], years=years, questions=questions,
+                          stratifications=stratifications)
+    chronic_new = processed_names(chronic_new)
+    final_new = df_combo(drop_columns(chronic_new, drop_strings),
+                         census_final[census_final['State'].isin(states)], 'State', 'outer')
+
+    if len(chronic_final.columns):
+        chronic_new = _replace_rows(chronic_final, chronic_new, states)
+    if len(final_dataset.columns):
+        final_new = _replace_rows(final_dataset, final_new, states)
+    result["chronic_final"] = chronic_new
+    result["final_dataset"] = final_new
+
+    return result
+
+
+def refresh_processed_files(df_raw, census_final, chronic_path, final_path, manifest_path,
+                            process=process_chronic_disease_data, keys=CDI_KEYS, **settings):
+    """
+        Runs incremental_refresh against the files of the last run and saves the updated outputs
+        and fingerprints. Nothing is rewritten when the release did not change.
+
+        Parameters
+        ----------
+        df_raw : pandas.DataFrame
+            The new raw CDI release.
+        census_final : pandas.DataFrame
+        chronic_path, final_path, manifest_path : str
+            CSV files of the chronic disease table, the final dataset and the fingerprints.
+        **settings
+            years, questions, stratifications and drop_strings of incremental_refresh.
+
+        Returns
+        -------
+        dict
+            Same as incremental_refresh.
+    """
+    def read(path):
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        df = pd.read_csv(path)
+        return df.loc[:, [col for col in df.columns if not str(col).startswith('Unnamed:')]]
+
+    result = incremental_refresh(df_raw, census_final, read(chronic_path), read(final_path),
+                                 load_manifest(manifest_path, keys), process=process, keys=keys, **settings)
+    if len(result["delta"]):
+        save_df_to_csv(result["chronic_final"], chronic_path)
+        save_df_to_csv(result["final_dataset"], final_path)
+        save_df_to_csv(result["manifest"], manifest_path)
+
+    return result
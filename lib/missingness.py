@@ -0,0 +1,239 @@
+# This .py file will be used for profiling the missing values of a DataFrame before blank rows and columns are dropped.
+# Importing python packages
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+
+# Number of set bits of every byte value (numpy 2 has np.bitwise_count for this).
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def _popcount(bitmap):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bitmap).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT[bitmap].sum(axis=1)
+
+
+# Bytes of the bitmap (8 rows each) unpacked at a time, so no more than a block of the profile is
+# ever held as one bool per cell.
+_BLOCK_BYTES = 1024
+
+
+def _row_keys(row_bitmap):
+    # One key per row of the row bitmap; rows with the same key miss the same columns.
+    if row_bitmap.shape[1] == 0:
+        return np.zeros(len(row_bitmap), dtype=np.uint8)
+    return np.ascontiguousarray(row_bitmap).view(np.dtype((np.void, row_bitmap.shape[1]))).ravel()
+
+
+class MissingProfile:
+    """
+        The missing values of a DataFrame as a packed null bitmap: one row of bits per column, 1 where
+        the value is missing (the same cells as DataFrame.isna). Built in one pass over the columns
+        with one bit per cell, so it stays small for wide and tall census extracts. Counts, patterns
+        and drop candidates are derived from the bitmap without touching the DataFrame again.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+    """
+
+    def __init__(self, df):
+        self.columns = df.columns
+        self.index = df.index
+        self.n_rows = len(df)
+        self.bitmap = np.empty((len(df.columns), (self.n_rows + 7) // 8), dtype=np.uint8)
+        for i in range(len(df.columns)):
+            self.bitmap[i] = np.packbits(df.iloc[:, i].isna().to_numpy())
+
+    def _positions(self, columns):
+        if columns is None:
+            return np.arange(len(self.columns))
+        positions = self.columns.get_indexer(pd.Index(columns))
+        if (positions < 0).any():
+            missing_cols = list(pd.Index(columns)[positions < 0])
+            raise KeyError(f"The following columns were not found in the DataFrame: {missing_cols}")
+        return positions
+
+    def _blocks(self, positions):
+        # Unpacked bits of the chosen columns (one row per column), a block of rows at a time.
+        for start in range(0, self.bitmap.shape[1], _BLOCK_BYTES):
+            count = min(self.n_rows - start * 8, _BLOCK_BYTES * 8)
+            yield np.unpackbits(self.bitmap[positions, start:start + _BLOCK_BYTES], axis=1, count=count)
+
+    def _row_bitmap(self, positions):
+        # The bits of the chosen columns packed per row instead of per column: one row of
+        # (len(positions) + 7) // 8 bytes per row of the frame, as small as the bitmap itself.
+        row_bitmap = np.zeros((self.n_rows, (len(positions) + 7) // 8), dtype=np.uint8)
+        row = 0
+        for bits in self._blocks(positions):
+            row_bitmap[row:row + bits.shape[1]] = np.packbits(bits.T, axis=1)
+            row += bits.shape[1]
+        return row_bitmap
+
+    def check(self, df):
+        """
+            Raises a ValueError when df does not have the rows of the profile or a column the
+            profile does not cover (profiles of a frame also describe its column subsets).
+        """
+        if len(df) != self.n_rows or not df.index.equals(self.index):
+            raise ValueError("The missing value profile was built from a DataFrame with other rows.")
+        self._positions(df.columns)
+
+    def column_nulls(self, columns=None):
+        """
+            Number of missing values of every column.
+
+            Returns
+            -------
+            pandas.Series
+        """
+        positions = self._positions(columns)
+        counts = _popcount(self.bitmap[positions])
+        # Padding bits of the last byte are 0, so they are never counted.
+        return pd.Series(counts, index=self.columns[positions], name='nulls')
+
+    def row_nulls(self, columns=None):
+        """
+            Number of missing values of every row among the chosen columns (default all).
+
+            Returns
+            -------
+            pandas.Series
+        """
+        row_bitmap = self._row_bitmap(self._positions(columns))
+        return pd.Series(_popcount(row_bitmap), index=self.index, name='nulls')
+
+    def empty_columns(self, columns=None):
+        """
+            Boolean Series, True for columns without any value (what remove_nan_cols drops).
+        """
+        return self.column_nulls(columns) == self.n_rows
+
+    def empty_rows(self, columns=None):
+        """
+            Boolean Series, True for rows without any value in the chosen columns (what
+            remove_nan_rows drops). A row is not empty when no columns are chosen.
+        """
+        n_cols = len(self._positions(columns))
+        return (self.row_nulls(columns) == n_cols) & (n_cols > 0)
+
+    def co_missing(self, columns=None):
+        """
+            Number of rows where both columns of a pair are missing (the diagonal holds the
+            missing values of each column).
+
+            Returns
+            -------
+            pandas.DataFrame
+                Square table, one row and column per column.
+        """
+        positions = self._positions(columns)
+        counts = np.zeros((len(positions), len(positions)), dtype=np.int64)
+        for bits in self._blocks(positions):
+            bits = bits.astype(np.float32)
+            counts += np.rint(bits @ bits.T).astype(np.int64)
+        return pd.DataFrame(counts, index=self.columns[positions], columns=self.columns[positions])
+
+    def patterns(self, columns=None, top=10):
+        """
+            The most common sets of missing columns among the rows.
+
+            Parameters
+            ----------
+            columns : list, optional
+                Columns to consider, defaults to all.
+            top : int, default=10
+                Number of patterns returned.
+
+            Returns
+            -------
+            pandas.DataFrame
+                One row per pattern: the number of rows, the number of missing columns and the
+                missing columns themselves.
+        """
+        positions = self._positions(columns)
+        row_bitmap = self._row_bitmap(positions)
+        _, first, counts = np.unique(_row_keys(row_bitmap), return_index=True, return_counts=True)
+        order = np.argsort(-counts, kind='stable')[:top]
+
+        names = self.columns[positions]
+        rows = []
+        for i in order:
+            missing = np.unpackbits(row_bitmap[first[i]], count=len(positions)).astype(bool)
+            rows.append({'rows': int(counts[i]), 'n_missing': int(missing.sum()), 'missing': list(names[missing])})
+
+        return pd.DataFrame(rows, columns=['rows', 'n_missing', 'missing'])
+
+    def drop_candidates(self, column_share=1.0, row_share=1.0, row_columns=None):
+        """
+            Columns and rows whose share of missing values reaches a threshold.
+
+            Parameters
+            ----------
+            column_share : float, default=1.0
+                Share of missing rows from which a column is a candidate (1.0: empty columns).
+            row_share : float, default=1.0
+                Share of missing values (among row_columns) from which a row is a candidate.
+            row_columns : list, optional
+                Columns checked for the rows, defaults to all.
+
+            Returns
+            -------
+            tuple
+                1. pandas.Index of the candidate columns.
+                2. pandas.Index of the candidate rows.
+        """
+        column_nulls = self.column_nulls()
+        n_cols = len(self._positions(row_columns))
+        row_nulls = self.row_nulls(row_columns)
+        columns = column_nulls.index[(column_nulls >= column_share * self.n_rows).to_numpy() & (self.n_rows > 0)]
+        rows = row_nulls.index[(row_nulls >= row_share * n_cols).to_numpy() & (n_cols > 0)]
+
+        return columns, rows
+
+    def summary(self):
+        """
+            The counts attached to the profiling trace.
+
+            Returns
+            -------
+            dict
+                n_rows, n_cols, null_cells, null_share, empty_columns, empty_rows and the number of
+                distinct missing patterns.
+        """
+        n_cols = len(self.columns)
+        column_nulls = _popcount(self.bitmap)
+        row_bitmap = self._row_bitmap(np.arange(n_cols))
+        row_nulls = _popcount(row_bitmap)
+        null_cells = int(column_nulls.sum())
+        n_cells = self.n_rows * n_cols
+
+        return {'n_rows': self.n_rows, 'n_cols': n_cols, 'null_cells': null_cells,
+                'null_share': null_cells / n_cells if n_cells else 0.0,
+                'empty_columns': int((column_nulls == self.n_rows).sum()),
+                'empty_rows': int((row_nulls == n_cols).sum()) if n_cols else 0,
+                'missing_patterns': len(np.unique(_row_keys(row_bitmap)))}
+
+
+def profile_missing(df, name='frame'):
+    """
+        Builds the MissingProfile of df and records its summary in the profiling trace as the
+        stage 'missing - <name>'.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        name : str, default='frame'
+            Name of the frame in the trace.
+
+        Returns
+        -------
+        MissingProfile
+    """
+    with stage(f'missing - {name}') as record:
+        profile = MissingProfile(df)
+        record.update(profile.summary())
+
+    return profile
@@ -0,0 +1,402 @@
+# This .py file will be used for planning the pipeline stages against a memory budget and running them in chunks when they would not fit.
+# Importing python packages
+import math
+import os
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from data_loader import _compression, _open_compressed, load_csv, load_csv_chunks
+from data_wrangle import (CDI_COLUMNS, CDI_COLUMNS_EXCLUDE, CDI_COLUMNS_INCLUDE, CDI_VALUES_EXCLUDE,
+                          CDI_VALUES_INCLUDE, CENSUS_COLUMNS, census_steps, df_combo, filter_dataframe,
+                          process_census_data, process_chronic_disease_data)
+from geography import fips_codes
+from profiling import frame_bytes, stage
+
+# Memory the pipeline may use, in bytes. None uses half of the memory of the machine or container.
+MEMORY_BUDGET = None
+
+# Peak memory of a stage as a multiple of the in-memory size of its input.
+STAGE_FACTORS = {
+    "filter_dataframe": 2.0,  # the input plus an output as large as the input
+    "chronic": 4.0,           # filter, renamed Question column and one pivot per stratification
+    "census": 3.0,            # raw frame, State column and the frame of the next step
+    "df_combo": 1.0           # added to the estimated size of the merged frame
+}
+
+# Share of the budget a single chunk may use; the rest holds the output gathered so far.
+CHUNK_SHARE = 0.25
+MIN_CHUNK_ROWS = 1000
+
+# Rows parsed to estimate the size of a CSV file.
+SAMPLE_ROWS = 2000
+# Expected size of a compressed CSV file once decompressed, as a multiple of the file size.
+COMPRESSION_RATIO = 5.0
+
+_UNITS = {"": 1, "B": 1, "KB": 2**10, "MB": 2**20, "GB": 2**30, "TB": 2**40}
+
+
+def _parse_bytes(size):
+    if isinstance(size, str):
+        match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?B?)\s*", size.upper())
+        if match is None:
+            raise ValueError(f"Cannot read the memory size '{size}', use e.g. '4GB' or '512MB'")
+        return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+    return int(size)
+
+
+def set_memory_budget(budget):
+    """
+        Sets the memory the pipeline may use.
+
+        Parameters
+        ----------
+        budget : int, str or None
+            Bytes, a size such as '4GB' or '512MB', or None for half of the available memory.
+    """
+    global MEMORY_BUDGET
+    MEMORY_BUDGET = None if budget is None else _parse_bytes(budget)
+
+
+def _available_memory():
+    sizes = []
+    try:
+        sizes.append(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+    except (AttributeError, ValueError, OSError):
+        pass
+    # Inside a container the cgroup limit is lower than the memory of the machine.
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as file:
+                value = file.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            sizes.append(int(value))
+
+    return min(sizes) if sizes else 8 * 2**30
+
+
+def memory_budget():
+    """
+        The memory budget in bytes (MEMORY_BUDGET, or half of the available memory).
+    """
+    if MEMORY_BUDGET is not None:
+        return MEMORY_BUDGET
+
+    return _available_memory() // 2
+
+
+def _text_bytes(file):
+    """
+        Expected number of decompressed bytes of a CSV file.
+    """
+    compression = _compression(file)
+    if compression is None:
+        return os.path.getsize(file)
+    if compression == "zip":
+        with zipfile.ZipFile(file) as archive:
+            return sum(info.file_size for info in archive.infolist() if info.filename.lower().endswith(".csv"))
+
+    return os.path.getsize(file) * COMPRESSION_RATIO
+
+
+def _head_lines(file, n_lines):
+    """
+        Bytes of the header and the first n_lines rows of a CSV file.
+    """
+    if _compression(file) is None:
+        stream = open(file, "rb")
+    else:
+        stream = _open_compressed(file)[0]
+    with stream:
+        lines = [stream.readline() for _ in range(n_lines + 1)]
+
+    return sum(len(line) for line in lines), sum(1 for line in lines[1:] if line)
+
+
+def estimate_source(source, usecols=None, sample_rows=SAMPLE_ROWS):
+    """
+        Estimates the rows and in-memory size of a DataFrame or a CSV file. Files are estimated from
+        the dtypes and string lengths of their first rows, scaled to the size of the file.
+
+        Parameters
+        ----------
+        source : pandas.DataFrame or str
+            A DataFrame or the path to a CSV file (compressed files are supported).
+        usecols : list, optional
+            Only count these columns.
+        sample_rows : int, default=2000
+            Rows parsed from a file.
+
+        Returns
+        -------
+        dict
+            "n_rows", "bytes_per_row" and "bytes".
+    """
+    if isinstance(source, pd.DataFrame):
+        frame = source if usecols is None else source[usecols]
+        n_rows = len(frame)
+        size = frame_bytes(frame)
+        return {"n_rows": n_rows, "bytes_per_row": size / max(n_rows, 1), "bytes": size}
+
+    reader = load_csv_chunks(source, chunksize=sample_rows, usecols=usecols, sample=False)
+    sample = next(iter(reader), None)
+    reader.close()
+    if sample is None or not len(sample):
+        return {"n_rows": 0, "bytes_per_row": 0.0, "bytes": 0}
+    bytes_per_row = frame_bytes(sample) / len(sample)
+    head_bytes, head_rows = _head_lines(source, sample_rows)
+    n_rows = head_rows if head_rows < sample_rows else int(_text_bytes(source) / (head_bytes / max(head_rows, 1)))
+
+    return {"n_rows": n_rows, "bytes_per_row": bytes_per_row, "bytes": int(n_rows * bytes_per_row)}
+
+
+def plan_stage(stage_name, estimate, budget=None, extra_bytes=0):
+    """
+        Decides whether a stage runs on the whole input at once or in chunks of rows.
+
+        Parameters
+        ----------
+        stage_name : str
+            One of STAGE_FACTORS.
+        estimate : dict
+            Output of estimate_source for the stage input.
+        budget : int or str, optional
+            Defaults to memory_budget().
+        extra_bytes : int, default=0
+            Memory the stage needs on top of its input (e.g. the other side of a join).
+
+        Returns
+        -------
+        dict
+            "estimate_bytes", "budget_bytes", "mode" ('memory' or 'chunked') and "chunk_rows".
+    """
+    budget = memory_budget() if budget is None else _parse_bytes(budget)
+    factor = STAGE_FACTORS[stage_name]
+    estimate_bytes = int(extra_bytes + factor * estimate["bytes"])
+    plan = {"estimate_bytes": estimate_bytes, "budget_bytes": budget, "mode": "memory", "chunk_rows": None}
+    if estimate_bytes > budget:
+        per_row = max(factor * estimate["bytes_per_row"], 1.0)
+        plan["mode"] = "chunked"
+        plan["chunk_rows"] = max(MIN_CHUNK_ROWS, int(max(budget - extra_bytes, 0) * CHUNK_SHARE / per_row))
+
+    return plan
+
+
+def _chunks(source, chunk_rows, usecols=None):
+    if isinstance(source, pd.DataFrame):
+        frame = source if usecols is None else source[usecols]
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows]
+    else:
+        yield from load_csv_chunks(source, chunksize=chunk_rows, usecols=usecols)
+
+
+def _load(source, usecols=None):
+    if isinstance(source, pd.DataFrame):
+        return source if usecols is None else source[usecols]
+
+    return load_csv(source, usecols=usecols)
+
+
+def run_filter_dataframe(source, columns_with_include, values_to_include, columns_with_exclude,
+                         values_to_exclude, usecols=None, budget=None):
+    """
+        filter_dataframe for inputs of any size: when the input would not fit in the budget it is
+        read and filtered one chunk of rows at a time, so only the kept rows are held in memory.
+
+        Parameters
+        ----------
+        source : pandas.DataFrame or str
+            A DataFrame or the path to a CSV file.
+        columns_with_include, values_to_include, columns_with_exclude, values_to_exclude
+            See data_wrangle.filter_dataframe.
+        usecols : list, optional
+            Only read these columns from a file.
+        budget : int or str, optional
+            Defaults to memory_budget().
+
+        Returns
+        -------
+        pandas.DataFrame
+            The filtered rows, the same as filter_dataframe on the whole input.
+    """
+    plan = plan_stage("filter_dataframe", estimate_source(source, usecols), budget)
+    with stage("planner - filter_dataframe", **plan) as record:
+        if plan["mode"] == "memory":
+            df = filter_dataframe(_load(source, usecols), columns_with_include, values_to_include,
+                                  columns_with_exclude, values_to_exclude)
+        else:
+            parts = [filter_dataframe(chunk, columns_with_include, values_to_include,
+                                      columns_with_exclude, values_to_exclude)
+                     for chunk in _chunks(source, plan["chunk_rows"], usecols)]
+            df = pd.concat(parts) if parts else _load(source, usecols).iloc[:0]
+        record["frame_bytes"] = frame_bytes(df)
+
+    return df
+
+
+def run_chronic_disease(source, budget=None):
+    """
+        process_chronic_disease_data for inputs of any size. A raw file that would not fit is
+        filtered chunk by chunk (reading only the columns the workflow uses); when the kept rows
+        are still too large, the pivot runs on groups of states and the results are stacked.
+
+        Parameters
+        ----------
+        source : pandas.DataFrame or str
+            The raw chronic disease indicators data, or the path to the CSV file.
+        budget : int or str, optional
+            Defaults to memory_budget().
+
+        Returns
+        -------
+        pandas.DataFrame
+            The same table as process_chronic_disease_data.
+    """
+    budget = memory_budget() if budget is None else _parse_bytes(budget)
+    usecols = list(dict.fromkeys(CDI_COLUMNS_INCLUDE + CDI_COLUMNS_EXCLUDE + CDI_COLUMNS))
+    plan = plan_stage("chronic", estimate_source(source, usecols), budget)
+    if plan["mode"] == "memory":
+        with stage("planner - chronic", **plan):
+            return process_chronic_disease_data(_load(source, usecols))
+
+    df = run_filter_dataframe(source, CDI_COLUMNS_INCLUDE, CDI_VALUES_INCLUDE, CDI_COLUMNS_EXCLUDE,
+                              CDI_VALUES_EXCLUDE, usecols=usecols, budget=budget)
+    plan = plan_stage("chronic", estimate_source(df), budget)
+    with stage("planner - chronic", **plan):
+        if plan["mode"] == "memory":
+            return process_chronic_disease_data(df)
+
+        # Pivot cells only depend on the rows of their own state, so groups of states can be
+        # processed one after the other.
+        states = sorted(df['LocationDesc'].dropna().unique())
+        n_groups = math.ceil(len(df) / plan["chunk_rows"])
+        parts = [process_chronic_disease_data(df[df['LocationDesc'].isin(group)])
+                 for group in np.array_split(states, n_groups) if len(group)]
+        # A single row per (Question, Stratification1) gives the column order of a full run.
+        template = df.drop_duplicates(['Question', 'Stratification1']).assign(LocationDesc=states[0])
+        columns = process_chronic_disease_data(template).columns
+
+        return pd.concat(parts, ignore_index=True).reindex(columns=columns)
+
+
+def run_census(source, budget=None):
+    """
+        process_census_data (lean) for inputs of any size, e.g. tract-level extracts. A file that
+        would not fit is read in chunks of rows with only the 60 census columns; each chunk goes
+        through the row by row steps (State fill, blank rows, state rows, locations out of scope)
+        and the remaining steps run once on the rows that are left.
+
+        Parameters
+        ----------
+        source : pandas.DataFrame or str
+            The raw (transposed) census data, or the path to the CSV file.
+        budget : int or str, optional
+            Defaults to memory_budget().
+
+        Returns
+        -------
+        pandas.DataFrame
+            The same table as process_census_data.
+    """
+    usecols = [col for col in CENSUS_COLUMNS if col != 'State']
+    plan = plan_stage("census", estimate_source(source, usecols), budget)
+    with stage("planner - census", **plan) as record:
+        if plan["mode"] == "memory":
+            df = process_census_data(_load(source, usecols), lean=True)
+            record["frame_bytes"] = frame_bytes(df)
+            return df
+
+        steps = census_steps(lean=True)
+        split = [name for name, _ in steps].index('census_rename_cols')
+        row_steps = [(name, step) for name, step in steps[:split] if name != 'remove_nan_cols']
+
+        parts = []
+        has_values = None
+        state = None
+        for chunk in _chunks(source, plan["chunk_rows"], usecols):
+            for name, step in row_steps:
+                chunk = step(chunk)
+                if name == 'df_formater':
+                    # Rows at the top of a chunk belong to the last location of the previous one.
+                    if state is not None:
+                        chunk['State'] = chunk['State'].fillna(state)
+                    if len(chunk):
+                        state = chunk['State'].iloc[-1]
+                    # remove_nan_cols has to see every row, so only remember which columns hold values.
+                    seen = chunk.notna().any()
+                    has_values = seen if has_values is None else has_values | seen
+            parts.append(chunk)
+
+        df = pd.concat(parts, ignore_index=True)
+        df = df.loc[:, has_values.reindex(df.columns).to_numpy()]
+        for name, step in steps[split:]:
+            df = step(df)
+        record["frame_bytes"] = frame_bytes(df)
+
+    return df
+
+
+def run_df_combo(df1, df2, col_name, how, geo_key=False, budget=None):
+    """
+        df_combo that merges df1 in chunks of rows against df2 when the merged frame would not fit
+        with both inputs in the budget ('right' joins chunk df2 instead).
+
+        Parameters
+        ----------
+        df1, df2 : pandas.DataFrame
+        col_name : str
+            Name of the column(s).
+        how : str
+            Type of join.
+        geo_key : bool, default=False
+            Join on the FIPS code (see data_wrangle.df_combo).
+        budget : int or str, optional
+            Defaults to memory_budget().
+
+        Returns
+        -------
+        pandas.DataFrame
+            The same rows and order as df_combo.
+    """
+    chunked, other = (df2, df1) if how == 'right' else (df1, df2)
+    estimate = estimate_source(chunked)
+    other_bytes = frame_bytes(other)
+    # One output row per chunked row, as wide as both inputs together.
+    merged_row = estimate["bytes_per_row"] + other_bytes / max(len(other), 1)
+    estimate = {"n_rows": estimate["n_rows"], "bytes_per_row": merged_row, "bytes": int(estimate["n_rows"] * merged_row)}
+    plan = plan_stage("df_combo", estimate, budget, extra_bytes=other_bytes + frame_bytes(chunked))
+
+    with stage("planner - df_combo", **plan) as record:
+        if plan["mode"] == "memory":
+            df = df_combo(df1, df2, col_name, how, geo_key)
+            record["frame_bytes"] = frame_bytes(df)
+            return df
+
+        chunk_how = 'left' if how == 'outer' else how
+        parts = []
+        for chunk in _chunks(chunked, plan["chunk_rows"]):
+            if how == 'right':
+                parts.append(df_combo(df1, chunk, col_name, 'right', geo_key))
+            else:
+                parts.append(df_combo(chunk, df2, col_name, chunk_how, geo_key))
+        if how == 'outer':
+            # Rows of df2 without a match in df1 come after the left join.
+            right_only = df2[~df2[col_name].isin(df1[col_name])]
+            parts.append(df_combo(df1.iloc[:0], right_only, col_name, 'right', geo_key))
+        df = pd.concat(parts, ignore_index=True)
+
+        # df_combo orders outer joins (and every geo_key join) by key, the others by their input.
+        if geo_key:
+            df = df.iloc[np.argsort(fips_codes(df[col_name]).to_numpy(), kind='stable')]
+        elif how == 'outer':
+            df = df.sort_values(col_name, kind='stable', na_position='last')
+        df = df.reset_index(drop=True)
+        record["frame_bytes"] = frame_bytes(df)
+
+    return df
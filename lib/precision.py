@@ -0,0 +1,213 @@
+# This .py file will be used for storing the numeric columns with less precision (float32 and small integers).
+# Importing python packages
+import re
+
+import numpy as np
+import pandas as pd
+
+from profiling import frame_bytes
+
+# The one setting the notebook flips: None keeps float64, "compact" applies the policy below.
+PRECISION = None
+
+# Columns holding percentages, stored as float32: the CDI DataValue/confidence limit columns and the
+# census '- %' columns. The 'Diabetes Prevalance - ...' columns of the diabete_v_* functions hold
+# population counts and stay on the integer/float64 path.
+PERCENT_PATTERN = re.compile(r"%|DataValue$|ConfidenceLimit$")
+
+# Integer types from the smallest, as (numpy type, nullable pandas type).
+_INT_TYPES = [(np.int8, pd.Int8Dtype()), (np.int16, pd.Int16Dtype()),
+              (np.int32, pd.Int32Dtype()), (np.int64, pd.Int64Dtype())]
+
+
+def set_precision(policy=None):
+    """
+        Chooses how numeric_converter, the chronic disease pivot, df_combo and the diabete_v_*
+        functions store numbers.
+
+        Parameters
+        ----------
+        policy : str or None, default=None
+            None (or "float64") keeps float64. "compact" stores percentages (prevalence rates) as
+            float32 and whole-number columns (counts, incomes) as the smallest integer type,
+            nullable (Int8 ... Int64) when values are missing; other columns keep float64.
+    """
+    global PRECISION
+    if policy not in (None, "float64", "compact"):
+        raise ValueError(f"Unknown precision policy '{policy}', use None or 'compact'")
+    PRECISION = None if policy == "float64" else policy
+
+
+def column_dtype(name, values):
+    """
+        The compact dtype of one numeric column.
+
+        Parameters
+        ----------
+        name : str
+            Column name, used to recognise percentages.
+        values : numpy.ndarray
+            The column as float64.
+
+        Returns
+        -------
+        dtype or None
+            float32, an integer dtype, or None to keep the column as it is.
+    """
+    if PERCENT_PATTERN.search(str(name)):
+        return np.dtype(np.float32)
+
+    finite = values[~np.isnan(values)]
+    if len(finite) == 0 or not np.array_equal(finite, np.round(finite)):
+        return None
+    low, high = finite.min(), finite.max()
+    for numpy_type, nullable_type in _INT_TYPES:
+        info = np.iinfo(numpy_type)
+        if info.min <= low and high <= info.max:
+            return nullable_type if len(finite) < len(values) else np.dtype(numpy_type)
+
+    return None
+
+
+def compact_series(name, series, policy=None):
+    """
+        One numeric column stored with the precision policy (see column_dtype).
+
+        Parameters
+        ----------
+        name : str
+            Column name.
+        series : pandas.Series
+        policy : str, optional
+            Policy to apply, defaults to PRECISION.
+
+        Returns
+        -------
+        pandas.Series
+            series itself when the policy is None or the column is not numeric.
+    """
+    policy = PRECISION if policy is None else policy
+    if policy is None or policy == "float64" or not pd.api.types.is_numeric_dtype(series.dtype) \
+            or pd.api.types.is_bool_dtype(series.dtype):
+        return series
+
+    dtype = column_dtype(name, series.to_numpy(dtype=float, na_value=np.nan))
+    if dtype is None or series.dtype == dtype:
+        return series
+
+    return series.astype(dtype)
+
+
+def apply_precision(df, columns=None, policy=None):
+    """
+        Stores the numeric columns of df with the precision policy. Does nothing while the policy
+        is None, so the pipeline functions can always call it.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        columns : list, optional
+            Columns to consider, defaults to every column.
+        policy : str, optional
+            Policy to apply, defaults to PRECISION.
+
+        Returns
+        -------
+        pandas.DataFrame
+            df with the changed columns replaced (the other columns are shared with df).
+    """
+    policy = PRECISION if policy is None else policy
+    if policy is None or policy == "float64":
+        return df
+
+    changes = {}
+    for col in (df.columns if columns is None else columns):
+        series = df[col]
+        compact = compact_series(col, series, policy)
+        if compact is not series:
+            changes[col] = compact
+    if not changes:
+        return df
+
+    df = df.copy(deep=False)
+    for col, series in changes.items():
+        df[col] = series
+
+    return df
+
+
+def precision_report(reference, compact):
+    """
+        Compares a float64 result with the same result computed with the compact policy.
+
+        Parameters
+        ----------
+        reference : pandas.DataFrame
+            Result with PRECISION None.
+        compact : pandas.DataFrame
+            Result with PRECISION "compact" (same rows and columns).
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per numeric column: both dtypes, bytes of both columns, the largest absolute
+            and relative difference, and whether the missing values are the same. The attrs
+            hold the total bytes of both frames.
+    """
+    rows = []
+    for col in dict.fromkeys(reference.columns):
+        if col not in compact.columns or isinstance(reference[col], pd.DataFrame) \
+                or not pd.api.types.is_numeric_dtype(reference[col].dtype):
+            continue
+        ref = reference[col].to_numpy(dtype=float, na_value=np.nan)
+        new = compact[col].to_numpy(dtype=float, na_value=np.nan)
+        both = ~np.isnan(ref) & ~np.isnan(new)
+        drift = np.abs(ref[both] - new[both])
+        scale = np.abs(ref[both])
+        rel = np.divide(drift, scale, out=np.zeros_like(drift), where=scale > 0)
+        rows.append({"column": col,
+                     "reference_dtype": str(reference[col].dtype), "compact_dtype": str(compact[col].dtype),
+                     "reference_bytes": int(reference[col].memory_usage(index=False, deep=True)),
+                     "compact_bytes": int(compact[col].memory_usage(index=False, deep=True)),
+                     "max_abs_drift": float(drift.max()) if len(drift) else 0.0,
+                     "max_rel_drift": float(rel.max()) if len(rel) else 0.0,
+                     "same_missing": bool(np.array_equal(np.isnan(ref), np.isnan(new)))})
+
+    report = pd.DataFrame(rows, columns=["column", "reference_dtype", "compact_dtype", "reference_bytes",
+                                         "compact_bytes", "max_abs_drift", "max_rel_drift", "same_missing"])
+    report = report.set_index("column")
+    report.attrs["reference_bytes"] = frame_bytes(reference)
+    report.attrs["compact_bytes"] = frame_bytes(compact)
+
+    return report
+
+
+def compare_precision(func, *args, **kwargs):
+    """
+        Runs func with PRECISION None and with "compact" and compares the results.
+
+        Parameters
+        ----------
+        func : function
+            Pipeline function returning a DataFrame, e.g. process_census_data.
+        *args, **kwargs
+            Arguments of func. Functions that change their input (lean=True, inplace=True) need
+            a fresh input for each run and should be compared with precision_report instead.
+
+        Returns
+        -------
+        tuple
+            1. The float64 result.
+            2. The compact result.
+            3. The precision_report of the two.
+    """
+    previous = PRECISION
+    try:
+        set_precision(None)
+        reference = func(*args, **kwargs)
+        set_precision("compact")
+        compact = func(*args, **kwargs)
+    finally:
+        set_precision(previous)
+
+    return reference, compact, precision_report(reference, compact)
@@ -0,0 +1,153 @@
+# This .py file will be used for measuring the run time and peak memory of the pipeline stages.
+# Importing python packages
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# One record per stage finished between start_trace and stop_trace, in the order they finished.
+TRACE = []
+
+# Whether stages are recorded (between start_trace and stop_trace).
+_TRACING = False
+
+# Records of the stages that are currently running in each thread (stages can be nested).
+_OPEN = threading.local()
+
+
+def _open_stages():
+    if not hasattr(_OPEN, "stages"):
+        _OPEN.stages = []
+    return _OPEN.stages
+
+
+def start_trace(memory=True):
+    """
+        Empties the trace and starts recording stages. Stages are only recorded between start_trace
+        and stop_trace, so the trace does not grow while nothing is being profiled. tracemalloc,
+        which slows Python code down, is only used when memory is True; it sees Python and NumPy
+        allocations, not buffers allocated by Arrow (the pyarrow backed string columns of pandas 3).
+
+        Parameters
+        ----------
+        memory : bool, default=True
+            Measure the peak memory of every stage with tracemalloc.
+    """
+    global _TRACING
+    TRACE.clear()
+    _TRACING = True
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def stop_trace():
+    """
+        Stops recording stages and measuring memory, and returns the trace report.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Same as trace_report.
+    """
+    global _TRACING
+    _TRACING = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    return trace_report()
+
+
+def frame_bytes(df):
+    """
+        Memory held by a DataFrame, including the Python strings of object columns.
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+@contextmanager
+def stage(name, **info):
+    """
+        Context manager that records the time and the peak memory of one pipeline stage between
+        start_trace and stop_trace (outside of them the record is not kept). The yielded record can
+        be given extra fields, e.g. record["frame_bytes"] = frame_bytes(df) for the frame the stage
+        produced.
+
+        Parameters
+        ----------
+        name : str
+            Stage name, e.g. 'census - df_formater'.
+        **info
+            Extra fields stored with the record.
+
+        Returns
+        -------
+        dict
+            The stage record (added to TRACE when the stage ends while tracing).
+    """
+    record = {"stage": name, **info}
+    if not _TRACING:
+        yield record
+        return
+
+    open_stages = _open_stages()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if open_stages:
+            # reset_peak also resets the peak of the enclosing stage, so keep it aside.
+            open_stages[-1]["_peak"] = max(open_stages[-1]["_peak"], peak)
+        tracemalloc.reset_peak()
+        record["_start"] = current
+        record["_peak"] = current
+    open_stages.append(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        open_stages.pop()
+        if tracing and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, record.pop("_peak"))
+            record["start_bytes"] = record.pop("_start")
+            record["end_bytes"] = current
+            record["peak_bytes"] = peak
+            if open_stages:
+                open_stages[-1]["_peak"] = max(open_stages[-1]["_peak"], peak)
+        else:
+            record.pop("_start", None)
+            record.pop("_peak", None)
+        if _TRACING:
+            TRACE.append(record)
+
+
+def trace_report(trace=None):
+    """
+        Summarises a trace: time, memory held before and after, and peak memory of every stage, in
+        MB, plus each peak as a multiple of the largest frame the stages produced.
+
+        Parameters
+        ----------
+        trace : list, optional
+            Stage records, defaults to TRACE.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per stage.
+    """
+    trace = TRACE if trace is None else trace
+    columns = ["stage", "seconds", "start_mb", "end_mb", "peak_mb", "frame_mb", "peak_x_largest_frame"]
+    report = pd.DataFrame(trace).reindex(columns=list(dict.fromkeys(
+        ["stage", "seconds", "start_bytes", "end_bytes", "peak_bytes", "frame_bytes"]
+        + [key for record in trace for key in record])))
+
+    for col in ["start", "end", "peak", "frame"]:
+        report[f"{col}_mb"] = report.pop(f"{col}_bytes").astype(float) / 2**20
+    largest = report["frame_mb"].max()
+    report["peak_x_largest_frame"] = report["peak_mb"] / largest if largest > 0 else np.nan
+
+    return report[columns + [col for col in report.columns if col not in columns]]
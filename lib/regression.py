@@ -0,0 +1,164 @@
+# This .py file will be used for functions that fit regressions between chronic disease prevalence and census metrics.
+# Importing python packages
+import numpy as np
+import pandas as pd
+
+
+def batch_ols(x, y, weights=None):
+    """
+        Fits a univariate least squares line for every (covariate, response) pair in one batched call.
+        Rows with a missing value are left out pair by pair, using mask matrices so every sum comes out
+        of a single matrix product.
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            2D array of covariates (observations x p).
+        y : numpy.ndarray
+            2D array of responses (observations x q).
+        weights : numpy.ndarray, optional
+            1D array of observation weights (e.g. population). Rows with a missing weight are dropped.
+
+        Returns
+        -------
+        dict
+            Arrays of shape (p x q): "n", "slope", "intercept", "r2", "slope_se", "intercept_se",
+            "t_stat", "rse", "sse" and "df_resid".
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if weights is None:
+        weights = np.ones(x.shape[0])
+    weights = np.asarray(weights, dtype=float)
+
+    mask_w = ~np.isnan(weights)
+    mask_x = ~np.isnan(x) & mask_w[:, None]
+    mask_y = ~np.isnan(y) & mask_w[:, None]
+    w = np.where(mask_w, weights, 0.0)[:, None]
+
+    # Shift each column by its own mean so the sums stay numerically stable.
+    center_x = np.nanmean(x, axis=0)
+    center_y = np.nanmean(y, axis=0)
+    x_c = np.where(mask_x, x - center_x, 0.0)
+    y_c = np.where(mask_y, y - center_y, 0.0)
+    m_x = mask_x.astype(float)
+    m_y = mask_y.astype(float)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = m_x.T @ m_y
+        s_w = (m_x * w).T @ m_y
+        s_x = (x_c * w).T @ m_y
+        s_y = (m_x * w).T @ y_c
+        s_xx = (x_c ** 2 * w).T @ m_y
+        s_yy = (m_x * w).T @ y_c ** 2
+        s_xy = (x_c * w).T @ y_c
+
+        mean_x = s_x / s_w
+        mean_y = s_y / s_w
+        ss_x = s_xx - s_x * mean_x
+        ss_y = s_yy - s_y * mean_y
+        ss_xy = s_xy - s_x * mean_y
+
+        slope = ss_xy / ss_x
+        intercept = (mean_y + center_y) - slope * (mean_x + center_x[:, None])
+        sse = np.maximum(ss_y - slope * ss_xy, 0.0)
+        df_resid = n - 2
+        sigma2 = sse / df_resid
+        slope_se = np.sqrt(sigma2 / ss_x)
+        intercept_se = np.sqrt(sigma2 * (1 / s_w + (mean_x + center_x[:, None]) ** 2 / ss_x))
+        r2 = ss_xy ** 2 / (ss_x * ss_y)
+        t_stat = slope / slope_se
+
+    too_small = df_resid < 1
+    results = {
+        "n": n.astype(int),
+        "slope": slope,
+        "intercept": intercept,
+        "r2": r2,
+        "slope_se": slope_se,
+        "intercept_se": intercept_se,
+        "t_stat": t_stat,
+        "rse": np.sqrt(sigma2),
+        "sse": sse,
+        "df_resid": np.maximum(df_resid, 0).astype(int)
+    }
+    for key in ("slope_se", "intercept_se", "t_stat", "rse"):
+        results[key][too_small] = np.nan
+
+    return results
+
+
+def fit_univariate_ols(df, response_names, covariate_names, weight_name=None):
+    """
+        Fits every univariate OLS regression response ~ covariate for the listed columns and returns
+        the results as a tidy table (one row per pair).
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        response_names : list
+            Columns used as responses (e.g. chronic disease prevalence).
+        covariate_names : list
+            Columns used as covariates (e.g. census metrics).
+        weight_name : str, optional
+            Column of observation weights, e.g. 'est - Total Pop' for population-weighted fits.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Columns: response, covariate, n, slope, intercept, r2, slope_se, intercept_se, t_stat,
+            rse (residual standard error), sse (residual sum of squares) and df_resid.
+    """
+    response_names = list(response_names)
+    covariate_names = list(covariate_names)
+
+    missing_cols = [col for col in response_names + covariate_names if col not in df.columns]
+    if weight_name is not None and weight_name not in df.columns:
+        missing_cols.append(weight_name)
+    if missing_cols:
+        raise KeyError(f"The following columns were not found in the DataFrame: {missing_cols}")
+
+    x = df[covariate_names].to_numpy(dtype=float, na_value=np.nan)
+    y = df[response_names].to_numpy(dtype=float, na_value=np.nan)
+    weights = None if weight_name is None else df[weight_name].to_numpy(dtype=float, na_value=np.nan)
+
+    results = batch_ols(x, y, weights)
+
+    # Results are (covariate x response); flatten so each response lists all of its covariates.
+    tidy = pd.DataFrame({
+        "response": np.repeat(response_names, len(covariate_names)),
+        "covariate": np.tile(covariate_names, len(response_names))
+    })
+    for key, values in results.items():
+        tidy[key] = values.T.ravel()
+
+    return tidy
+
+
+def prevalence_regressions(df, weight_name=None, value_suffix="-DataValue", census_prefix="est - "):
+    """
+        Regresses every chronic disease prevalence column on every census covariate of the final dataset.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The final dataset (chronic disease and census columns joined by State).
+        weight_name : str, optional
+            Column of observation weights, e.g. 'est - Total Pop' for population-weighted fits.
+        value_suffix : str, default="-DataValue"
+            Suffix identifying the prevalence columns.
+        census_prefix : str, default="est - "
+            Prefix identifying the census covariate columns.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Tidy table of fits, sorted by r2 (highest first).
+    """
+    response_names = [col for col in df.columns if col.endswith(value_suffix)]
+    covariate_names = [col for col in df.columns
+                       if col.startswith(census_prefix) and pd.api.types.is_numeric_dtype(df[col])]
+
+    fits = fit_univariate_ols(df, response_names, covariate_names, weight_name)
+
+    return fits.sort_values("r2", ascending=False).reset_index(drop=True)
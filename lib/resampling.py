@@ -0,0 +1,161 @@
+# This .py file will be used for functions that measure the significance of correlations by resampling.
+# Importing python packages
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from correlation import pairwise_corr, rank_columns, rank_matrix, rerank_pairs
+
+
+def resample_indices(n_obs, n_resamples, kind, seed=0):
+    """
+        Generates every resample at once as a single integer array of row positions.
+
+        Parameters
+        ----------
+        n_obs : int
+            Number of observations (rows) in the data.
+        n_resamples : int
+            Number of resamples to draw.
+        kind : str
+            "bootstrap" (rows drawn with replacement) or "permutation" (rows shuffled).
+        seed : int, default=0
+            Seed for the random generator, so the same seed always gives the same resamples.
+
+        Returns
+        -------
+        numpy.ndarray
+            Integer array of shape (n_resamples, n_obs).
+    """
+    rng = np.random.default_rng(seed)
+
+    if kind == "bootstrap":
+        return rng.integers(0, n_obs, size=(n_resamples, n_obs))
+    if kind == "permutation":
+        return rng.permuted(np.tile(np.arange(n_obs), (n_resamples, 1)), axis=1)
+
+    raise ValueError(f"Unknown resampling kind: {kind}")
+
+
+def _resample_chunk(values_rows, values_cols, indices, kind, corr_method, observed, ranks=None):
+    """
+        Worker for one chunk of resamples. Bootstrap chunks return the correlation of every pair for
+        every resample; permutation chunks only return how often the shuffled correlation was at least
+        as extreme as the observed one. Spearman pairs with different missing rows are re-ranked over
+        their complete rows in every resample, like the observed correlation (see rerank_pairs).
+    """
+    if kind == "permutation":
+        # Shuffling the rows of one block breaks the pairing, and ranks are unchanged by a shuffle.
+        ranked_rows, ranked_cols = (values_rows, values_cols) if ranks is None else ranks
+        shape = (len(indices),) + values_cols.shape
+        corr = pairwise_corr(ranked_rows[indices], np.broadcast_to(ranked_cols, shape))
+        if corr_method == "spearman":
+            corr = rerank_pairs(corr, values_rows[indices], np.broadcast_to(values_cols, shape))
+        return (np.abs(corr) >= np.abs(observed) - 1e-12).sum(axis=0)
+
+    rows = values_rows[indices]
+    cols = rows if values_cols is values_rows else values_cols[indices]
+    if corr_method == "spearman":
+        ranked_rows = rank_columns(rows, axis=1)
+        ranked_cols = ranked_rows if cols is rows else rank_columns(cols, axis=1)
+        corr = rerank_pairs(pairwise_corr(ranked_rows, ranked_cols), rows, cols)
+    else:
+        corr = pairwise_corr(rows, cols)
+
+    return corr.astype(np.float32)
+
+
+def _run_chunks(values_rows, values_cols, indices, kind, corr_method, observed, n_jobs, chunk_size,
+                ranks=None):
+    """
+        Splits the resample index array into chunks and runs them inline or on a process pool.
+    """
+    chunks = [indices[start:start + chunk_size] for start in range(0, len(indices), chunk_size)]
+    args = [(values_rows, values_cols, chunk, kind, corr_method, observed, ranks) for chunk in chunks]
+
+    if n_jobs == 1:
+        return [_resample_chunk(*arg) for arg in args]
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(_resample_chunk, *zip(*args)))
+
+
+def corr_significance(df, row_names, column_names=None, corr_method="spearman", n_resamples=10000,
+                      ci=0.95, seed=0, n_jobs=1, chunk_size=500):
+    """
+        Bootstrap confidence intervals and permutation p-values for every cell of a correlation block.
+        All resamples are drawn up front, and each chunk computes the correlations of all column pairs
+        for all of its resamples in one vectorized call. Chunks can be spread across a process pool;
+        the results only depend on the seed, not on the number of workers.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        row_names : list
+            Columns making up the rows of the block.
+        column_names : list, optional
+            Columns making up the columns of the block. Defaults to row_names.
+        corr_method : str, default="spearman"
+            "pearson" or "spearman".
+        n_resamples : int, default=10000
+            Number of bootstrap resamples and of permutations.
+        ci : float, default=0.95
+            Confidence level of the bootstrap percentile interval.
+        seed : int, default=0
+            Seed for the resampling.
+        n_jobs : int, default=1
+            Number of worker processes. 1 runs everything in the current process.
+        chunk_size : int, default=500
+            Number of resamples handled per chunk.
+
+        Returns
+        -------
+        dict
+            DataFrames "corr", "p_value", "ci_low" and "ci_high", each shaped row_names x column_names.
+    """
+    if corr_method not in ("pearson", "spearman"):
+        raise ValueError("Resampling supports the 'pearson' and 'spearman' methods.")
+    if column_names is None:
+        column_names = row_names
+    row_names = list(row_names)
+    column_names = list(column_names)
+
+    values_rows = df[row_names].to_numpy(dtype=float, na_value=np.nan)
+    if column_names == row_names:
+        values_cols = values_rows
+    else:
+        values_cols = df[column_names].to_numpy(dtype=float, na_value=np.nan)
+
+    if corr_method == "spearman":
+        ranked_cols, ranks = rank_matrix(df, list(dict.fromkeys(row_names + column_names)))
+        ranked_rows = ranks[:, ranked_cols.get_indexer(row_names)]
+        ranked_columns = ranked_rows if values_cols is values_rows else ranks[:, ranked_cols.get_indexer(column_names)]
+    else:
+        ranked_rows, ranked_columns = values_rows, values_cols
+    observed = pairwise_corr(ranked_rows, ranked_columns)
+    if corr_method == "spearman":
+        observed = rerank_pairs(observed, values_rows, values_cols)
+
+    n_obs = len(df)
+    perm_idx = resample_indices(n_obs, n_resamples, "permutation", seed=seed)
+    boot_idx = resample_indices(n_obs, n_resamples, "bootstrap", seed=seed + 1)
+
+    perm_counts = _run_chunks(values_rows, values_cols, perm_idx, "permutation", corr_method,
+                              observed, n_jobs, chunk_size, ranks=(ranked_rows, ranked_columns))
+    p_value = (np.sum(perm_counts, axis=0) + 1) / (n_resamples + 1)
+
+    boot_corr = np.concatenate(_run_chunks(values_rows, values_cols, boot_idx, "bootstrap", corr_method,
+                                           observed, n_jobs, chunk_size))
+    tail = (1 - ci) / 2
+    ci_low, ci_high = np.nanquantile(boot_corr, [tail, 1 - tail], axis=0)
+
+    def to_frame(values):
+        return pd.DataFrame(values, index=row_names, columns=column_names)
+
+    return {
+        "corr": to_frame(observed),
+        "p_value": to_frame(p_value),
+        "ci_low": to_frame(ci_low),
+        "ci_high": to_frame(ci_high)
+    }
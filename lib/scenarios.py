@@ -0,0 +1,360 @@
+# This .py file will be used for running many versions (scenarios) of the pipeline on one loaded copy of the data.
+# Importing python packages
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_wrangle import (CDI_COLUMNS, CDI_COLUMNS_EXCLUDE, CDI_COLUMNS_INCLUDE, CDI_QUESTION_NAMES,
+                          CDI_VALUES_EXCLUDE, CDI_VALUES_INCLUDE, STRATIFICATIONS, column_value_changer,
+                          df_combo, drop_columns, pivot_questions, process_census_data,
+                          remove_rows, rename_columns, select_columns, stratify_dataframe)
+from precision import apply_precision
+from profiling import frame_bytes, stage
+
+# Settings of a scenario and their defaults (the settings of main.ipynb).
+SCENARIO_DEFAULTS = {
+    "years": CDI_VALUES_INCLUDE[0],
+    "questions": CDI_VALUES_INCLUDE[2],
+    "values_exclude": CDI_VALUES_EXCLUDE[0],
+    "state_remove": CDI_VALUES_EXCLUDE[0],
+    "stratifications": STRATIFICATIONS,
+    "drop": ["ConfidenceLimit"],
+    "how": "outer"
+}
+
+# The sweep used by the workers of a process pool.
+_WORKER_SWEEP = None
+
+
+def scenario_config(scenario):
+    """
+        Completes a scenario with the default settings.
+
+        Parameters
+        ----------
+        scenario : dict
+            Any of the keys of SCENARIO_DEFAULTS, plus an optional 'name':
+            years - 'YearStart' values kept (the pivot needs one row per State and question, so
+            normally a single year), questions - 'Question' values kept (raw CDI names),
+            values_exclude - locations removed from the CDI data, state_remove - states removed
+            from the census data, stratifications - column groups of the chronic disease table,
+            drop - column name parts removed before the join, how - join of the two tables.
+
+        Returns
+        -------
+        dict
+            Every setting, as tuples so the settings can be used as cache keys.
+    """
+    unknown = [key for key in scenario if key not in SCENARIO_DEFAULTS and key != "name"]
+    if unknown:
+        raise KeyError(f"Unknown scenario settings: {unknown}, use: {list(SCENARIO_DEFAULTS)}")
+
+    config = {}
+    for key, default in SCENARIO_DEFAULTS.items():
+        value = scenario.get(key, default)
+        config[key] = value if isinstance(value, str) else tuple(value)
+
+    return config
+
+
+class ScenarioSweep:
+    """
+        Evaluates many scenarios against one read-only copy of the raw chronic disease data and
+        the processed census data. The chronic disease pipeline is split into stages - year
+        filter and cleaning, one pivot of every question and location per stratification, the
+        scenario's slice of each pivot (questions and locations), merge - and each stage result
+        is cached under the settings it depends on, so scenarios that share a prefix of settings
+        share those stages and only the differing tail is computed. Stage results are never
+        changed after they are cached.
+
+        Parameters
+        ----------
+        cdi_df : pandas.DataFrame
+            The raw chronic disease indicators data.
+        census_df : pandas.DataFrame, optional
+            The processed census data (process_census_data), needed for the joined tables.
+        census_raw : pandas.DataFrame, optional
+            The raw census data, processed once here when census_df is not given.
+    """
+
+    def __init__(self, cdi_df, census_df=None, census_raw=None):
+        # The base: only the columns the stages use and only the data type every scenario keeps.
+        columns = list(dict.fromkeys(CDI_COLUMNS_INCLUDE + CDI_COLUMNS_EXCLUDE + CDI_COLUMNS))
+        missing_cols = [col for col in columns if col not in cdi_df.columns]
+        if missing_cols:
+            raise KeyError(f"The following columns were not found in the DataFrame: {missing_cols}")
+        with stage("scenarios - base") as record:
+            base = cdi_df.loc[cdi_df["DataValueType"].isin(CDI_VALUES_INCLUDE[1]).to_numpy(), columns]
+            self.base = base.reset_index(drop=True)
+            if census_df is None and census_raw is not None:
+                census_df = process_census_data(census_raw)
+            self.census = census_df
+            record["frame_bytes"] = frame_bytes(self.base)
+
+        self._init_cache()
+
+    def _init_cache(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.stats = {"computed": 0, "reused": 0}
+
+    def __getstate__(self):
+        # Only the data is sent to the workers of a process pool; each worker has its own cache.
+        return {"base": self.base, "census": self.census}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_cache()
+
+    def _cached(self, key, compute):
+        """
+            Returns the stage result cached under key, computing it once. Threads asking for a
+            result that another thread is computing wait for it.
+        """
+        with self._lock:
+            future = self._cache.get(key)
+            owner = future is None
+            if owner:
+                future = self._cache[key] = Future()
+                self.stats["computed"] += 1
+            else:
+                self.stats["reused"] += 1
+
+        if owner:
+            try:
+                future.set_result(compute())
+            except BaseException as err:
+                future.set_exception(err)
+
+        return future.result()
+
+    # ---- Stages, in pipeline order; each key holds every setting the stage depends on ----
+
+    def _years(self, config):
+        key = ("years", config["years"])
+        return self._cached(key, lambda: self.base[self.base["YearStart"].isin(config["years"]).to_numpy()])
+
+    def _long(self, config):
+        key = ("long", config["years"])
+
+        def compute():
+            df = column_value_changer(self._years(config), "Question", CDI_QUESTION_NAMES)
+            df = select_columns(df, CDI_COLUMNS)
+            return rename_columns(df, {"LocationDesc": "State"})
+
+        return self._cached(key, compute)
+
+    def _pivot(self, config, strat):
+        # One pivot of every question and location of the year(s); the scenarios take slices of it.
+        key = ("pivot", config["years"], strat)
+
+        def compute():
+            rows = stratify_dataframe(self._long(config), "Stratification1", strat)
+            # Duplicated State/Question pairs cannot be pivoted; scenarios that keep them pivot their own rows.
+            duplicated = rows.duplicated(["State", "Question"], keep=False).to_numpy()
+            pivot = pivot_questions(rows[~duplicated])
+            # Columns are named '<question>-<value>'.
+            columns = pivot.columns[1:]
+            questions = pd.Index([col.rsplit("-", 1)[0] for col in columns])
+            return (rows, duplicated, pivot["State"].to_numpy(), pivot.iloc[:, 1:].to_numpy(dtype=float),
+                    columns, questions)
+
+        return self._cached(key, compute)
+
+    def _slice(self, config, strat):
+        """
+            The pivot of one stratification of a scenario as (states, values, column names).
+        """
+        key = ("slice", config["years"], config["questions"], config["values_exclude"], strat)
+
+        def compute():
+            rows, duplicated, states, values, columns, questions = self._pivot(config, strat)
+            keep_questions = pd.Series(config["questions"], dtype=object).replace(CDI_QUESTION_NAMES)
+            keep = (rows["Question"].isin(keep_questions) & ~rows["State"].isin(config["values_exclude"])).to_numpy()
+            if (keep & duplicated).any():
+                pivot = pivot_questions(rows[keep])
+                states, values = pivot["State"].to_numpy(), pivot.iloc[:, 1:].to_numpy(dtype=float)
+                columns = pivot.columns[1:]
+            else:
+                # The rows and columns process_chronic_disease_data would pivot, in the pivot's order.
+                row_pos = np.flatnonzero(pd.Index(states).isin(rows["State"][keep].unique()))
+                col_pos = np.flatnonzero(questions.isin(rows["Question"][keep].unique()))
+                states, values, columns = states[row_pos], values[np.ix_(row_pos, col_pos)], columns[col_pos]
+            return states, values, [f"{strat} - {col}" for col in columns]
+
+        return self._cached(key, compute)
+
+    def chronic(self, scenario):
+        """
+            The chronic disease table of a scenario, equal to process_chronic_disease_data with the
+            same settings (the pivots are taken from a shared pivot of each year and stratification
+            and merged like df_combo_many with how='outer').
+
+            Parameters
+            ----------
+            scenario : dict
+                Scenario settings (see scenario_config).
+
+            Returns
+            -------
+            pandas.DataFrame
+                One row per State.
+        """
+        config = scenario_config(scenario)
+        key = ("chronic", config["years"], config["questions"], config["values_exclude"],
+               config["stratifications"])
+
+        def compute():
+            strats = list(config["stratifications"])
+            overlap = sorted({strat for strat in strats if strats.count(strat) > 1})
+            if overlap:
+                raise ValueError(f"The following stratifications appear more than once: {overlap}")
+            slices = [self._slice(config, strat) for strat in strats]
+
+            # One sorted index of the States of every stratification, then one float block.
+            keys = np.unique(np.concatenate([states for states, _, _ in slices] + [np.array([], dtype=object)]))
+            out = np.full((len(keys), sum(values.shape[1] for _, values, _ in slices)), np.nan)
+            start = 0
+            for states, values, _ in slices:
+                out[np.searchsorted(keys, states)[:, None], np.arange(start, start + values.shape[1])] = values
+                start += values.shape[1]
+            df = pd.DataFrame(out, columns=[col for _, _, columns in slices for col in columns])
+            df.insert(0, "State", keys)
+
+            return apply_precision(df)
+
+        return self._cached(key, compute)
+
+    def _census(self, config):
+        key = ("census", config["state_remove"])
+        return self._cached(key, lambda: remove_rows(self.census, "State", list(config["state_remove"]))
+                            if config["state_remove"] else self.census)
+
+    def final(self, scenario):
+        """
+            The joined chronic disease and census table of a scenario (the df_final of main.ipynb).
+
+            Parameters
+            ----------
+            scenario : dict
+                Scenario settings (see scenario_config).
+
+            Returns
+            -------
+            pandas.DataFrame
+                One row per State.
+        """
+        if self.census is None:
+            raise ValueError("The sweep has no census data; pass census_df or census_raw.")
+        config = scenario_config(scenario)
+        chronic = self.chronic(config)
+        if config["drop"]:
+            chronic = drop_columns(chronic, list(config["drop"]))
+
+        return df_combo(chronic, self._census(config), "State", config["how"])
+
+    def run(self, scenarios, output="final", executor="thread", max_workers=None):
+        """
+            Evaluates every scenario concurrently.
+
+            Parameters
+            ----------
+            scenarios : list or dict
+                Scenario settings (see scenario_config); a dict maps names to settings, a list
+                uses each scenario's 'name' (default 'scenario_<i>').
+            output : str, default="final"
+                'final' for the joined table, 'chronic' for the chronic disease table.
+            executor : str, default="thread"
+                'thread' runs the scenarios on a thread pool sharing one cache. 'process' runs
+                groups of scenarios that share their filters on a process pool; with the fork
+                start method the workers read the parent's base without copying it.
+            max_workers : int, optional
+                Pool size, defaults to the number of CPUs (at most the number of scenarios).
+
+            Returns
+            -------
+            dict
+                Scenario name -> DataFrame, in the order of the scenarios.
+        """
+        if isinstance(scenarios, dict):
+            named = [(name, {**scenario, "name": name}) for name, scenario in scenarios.items()]
+        else:
+            named = [(scenario.get("name", f"scenario_{i}"), scenario) for i, scenario in enumerate(scenarios)]
+        if output not in ("final", "chronic"):
+            raise ValueError(f"output must be 'final' or 'chronic', got '{output}'.")
+        for _, scenario in named:
+            scenario_config(scenario)
+        max_workers = min(max_workers or os.cpu_count() or 1, max(len(named), 1))
+
+        with stage("scenarios - run", scenarios=len(named), executor=executor) as record:
+            before = dict(self.stats)
+            if executor == "thread":
+                evaluate = getattr(self, output)
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    frames = list(pool.map(evaluate, [scenario for _, scenario in named]))
+                results = dict(zip([name for name, _ in named], frames))
+            elif executor == "process":
+                results = self._run_processes(named, output, max_workers)
+            else:
+                raise ValueError(f"executor must be 'thread' or 'process', got '{executor}'.")
+            record["computed"] = self.stats["computed"] - before["computed"]
+            record["reused"] = self.stats["reused"] - before["reused"]
+
+        return {name: results[name] for name, _ in named}
+
+    def _run_processes(self, named, output, max_workers):
+        # Scenarios with the same filters go to the same worker, so they share its stages.
+        groups = {}
+        for name, scenario in named:
+            config = scenario_config(scenario)
+            key = (config["years"], config["questions"], config["values_exclude"])
+            groups.setdefault(key, []).append((name, scenario))
+        groups = list(groups.values())
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        # With fork the initializer argument is inherited by the workers, not pickled.
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(groups)), mp_context=context,
+                                 initializer=_init_worker, initargs=(self,)) as pool:
+            parts = list(pool.map(_run_group, groups, [output] * len(groups)))
+
+        results = {}
+        for part, stats in parts:
+            results.update(part)
+            for key in self.stats:
+                self.stats[key] += stats[key]
+
+        return results
+
+
+def _init_worker(sweep):
+    global _WORKER_SWEEP
+    _WORKER_SWEEP = sweep
+
+
+def _run_group(group, output):
+    evaluate = getattr(_WORKER_SWEEP, output)
+    before = dict(_WORKER_SWEEP.stats)
+    part = {name: evaluate(scenario) for name, scenario in group}
+    stats = {key: _WORKER_SWEEP.stats[key] - before[key] for key in before}
+
+    return part, stats
+
+
+def run_scenarios(cdi_df, scenarios, census_df=None, census_raw=None, output="final", executor="thread",
+                  max_workers=None):
+    """
+        Builds a ScenarioSweep and runs the scenarios (see ScenarioSweep.run).
+
+        Returns
+        -------
+        dict
+            Scenario name -> DataFrame.
+    """
+    sweep = ScenarioSweep(cdi_df, census_df=census_df, census_raw=census_raw)
+
+    return sweep.run(scenarios, output=output, executor=executor, max_workers=max_workers)
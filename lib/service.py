@@ -0,0 +1,285 @@
+# This .py file will be used for a local read-only HTTP service that serves slices of the final dataset.
+# Importing python packages
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from data_wrangle import (diabete_metrics_all, diabete_v_commute, diabete_v_educated, diabete_v_employement,
+                          diabete_v_health_insurance, diabete_v_income, diabete_v_overall, diabete_v_poverty)
+from geography import GEO_KEY, fips_codes, region_fips
+
+# pyarrow is optional; without it only JSON responses are available.
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+DEFAULT_DATASET = "./data/processed/Final_dataset.csv"
+
+# Derived metric tables served under /metrics/<name>.
+METRICS = {
+    "all": diabete_metrics_all,
+    "overall": diabete_v_overall,
+    "educated": diabete_v_educated,
+    "employment": diabete_v_employement,
+    "commute": diabete_v_commute,
+    "income": diabete_v_income,
+    "health_insurance": diabete_v_health_insurance,
+    "poverty": diabete_v_poverty
+}
+
+
+class QueryError(Exception):
+    """
+        A request that cannot be answered, with the HTTP status to send back.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class DatasetService:
+    """
+        Holds the final dataset in memory and answers queries with an LRU cache of rendered
+        responses. The dataset version is a hash of the file, so cached responses and ETags change
+        as soon as the file is rewritten.
+
+        Parameters
+        ----------
+        path : str, default="./data/processed/Final_dataset.csv"
+            Processed CSV file to serve.
+        cache_size : int, default=256
+            Number of rendered responses kept in memory.
+    """
+
+    def __init__(self, path=DEFAULT_DATASET, cache_size=256):
+        self.path = path
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.reload()
+
+    def reload(self):
+        """
+            Reads the file again and empties the response cache.
+        """
+        with open(self.path, "rb") as file:
+            raw = file.read()
+        df = pd.read_csv(io.BytesIO(raw))
+        df = df.loc[:, [col for col in df.columns if not str(col).startswith("Unnamed:")]]
+        keys = pd.DataFrame({GEO_KEY: fips_codes(df["State"]).to_numpy()}, index=df.index)
+
+        with self._lock:
+            self.df = pd.concat([df, keys], axis=1)
+            self.version = hashlib.blake2b(raw, digest_size=8).hexdigest()
+            self._mtime = os.stat(self.path).st_mtime_ns
+            self._metrics = {}
+            self._cache.clear()
+
+    def _check_file(self):
+        if os.stat(self.path).st_mtime_ns != self._mtime:
+            self.reload()
+
+    def _table(self, name):
+        if name is None:
+            return self.df
+        if name not in METRICS:
+            raise QueryError(404, f"Unknown metric '{name}', use one of: {list(METRICS)}")
+        with self._lock:
+            if name not in self._metrics:
+                table = METRICS[name](self.df)
+                self._metrics[name] = table.assign(**{GEO_KEY: self.df.loc[table.index, GEO_KEY]})
+            return self._metrics[name]
+
+    def _slice(self, name, params):
+        table = self._table(name)
+        rows = pd.Series(True, index=table.index)
+
+        if "region" in params:
+            try:
+                rows &= table[GEO_KEY].isin(region_fips(params["region"][0]))
+            except KeyError as err:
+                raise QueryError(400, err.args[0])
+        if "states" in params:
+            names = ",".join(params["states"]).split(",")
+            wanted = fips_codes(names)
+            if wanted.isna().any():
+                unknown = [name for name, code in zip(names, wanted) if pd.isna(code)]
+                raise QueryError(400, f"The following geographies are not in the geography index: {unknown}")
+            rows &= table[GEO_KEY].isin(wanted.astype(int))
+
+        columns = [col for col in table.columns if col != GEO_KEY]
+        if "columns" in params:
+            wanted = [col for value in params["columns"] for col in value.split(",") if col]
+            missing_cols = [col for col in wanted if col not in table.columns]
+            if missing_cols:
+                raise QueryError(400, f"The following columns were not found in the DataFrame: {missing_cols}")
+            columns = ["State"] + [col for col in wanted if col != "State"]
+
+        return table.loc[rows.to_numpy(), columns].reset_index(drop=True)
+
+    def _render(self, df, fmt):
+        if fmt == "json":
+            return df.to_json(orient="records").encode("utf-8"), "application/json"
+        if fmt == "arrow":
+            if pa is None:
+                raise QueryError(406, "Arrow output needs the pyarrow package")
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes(), "application/vnd.apache.arrow.stream"
+        raise QueryError(400, f"Unknown format '{fmt}', use 'json' or 'arrow'")
+
+    def handle(self, path, query=""):
+        """
+            Answers one request.
+
+            Routes
+            ------
+            /version                          Dataset version and size.
+            /columns                          Column names of the dataset.
+            /data?states=&region=&columns=    Slice of the final dataset.
+            /metrics/<name>?...               Slice of a diabete_v_* table (see METRICS).
+            Every route takes format=json (default) or format=arrow.
+
+            Returns
+            -------
+            tuple
+                1. Response body (bytes).
+                2. Content type.
+                3. ETag.
+        """
+        self._check_file()
+        params = parse_qs(query)
+        fmt = params.pop("format", ["json"])[0]
+        key = (self.version, path, fmt, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        parts = [part for part in path.split("/") if part]
+        if parts == ["version"]:
+            body = json.dumps({"version": self.version, "rows": len(self.df), "columns": self.df.shape[1] - 1})
+            response = (body.encode("utf-8"), "application/json")
+        elif parts == ["columns"]:
+            response = (json.dumps([col for col in self.df.columns if col != GEO_KEY]).encode("utf-8"),
+                        "application/json")
+        elif parts == ["data"]:
+            response = self._render(self._slice(None, params), fmt)
+        elif len(parts) == 2 and parts[0] == "metrics":
+            response = self._render(self._slice(parts[1], params), fmt)
+        else:
+            raise QueryError(404, f"Unknown path '{path}'")
+
+        etag = '"' + hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).hexdigest() + '"'
+        response = response + (etag,)
+        with self._lock:
+            self._cache[key] = response
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return response
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for hundreds of dashboard connections arriving at once.
+    request_queue_size = 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            body, content_type, etag = self.service.handle(url.path, url.query)
+        except QueryError as err:
+            self._send(err.status, json.dumps({"error": str(err)}).encode("utf-8"), "application/json")
+            return
+        except Exception as err:
+            # E.g. a KeyError/ValueError of the wrangle functions; answer instead of dropping the connection.
+            sys.stderr.write(f"Error serving {self.path}:\n{traceback.format_exc()}")
+            self._send(500, json.dumps({"error": f"{type(err).__name__}: {err}"}).encode("utf-8"),
+                       "application/json")
+            return
+
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", None, etag)
+        else:
+            self._send(200, body, content_type, etag)
+
+    def _send(self, status, body, content_type, etag=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Dashboards poll often; keep the notebook output quiet.
+        pass
+
+
+def make_server(service, host="127.0.0.1", port=8050):
+    """
+        Builds a threaded HTTP server for a DatasetService (one thread per connection).
+
+        Parameters
+        ----------
+        service : DatasetService
+        host : str, default="127.0.0.1"
+        port : int, default=8050
+            Use 0 to pick a free port (see server.server_address).
+
+        Returns
+        -------
+        http.server.ThreadingHTTPServer
+    """
+    handler = type("DatasetHandler", (_Handler,), {"service": service})
+    return _Server((host, port), handler)
+
+
+def start_service(path=DEFAULT_DATASET, host="127.0.0.1", port=8050, cache_size=256):
+    """
+        Starts the service in a background thread, e.g. from the notebook. Stop it with
+        server.shutdown().
+
+        Returns
+        -------
+        http.server.ThreadingHTTPServer
+    """
+    server = make_server(DatasetService(path, cache_size), host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the final dataset over HTTP.")
+    parser.add_argument("--path", default=DEFAULT_DATASET)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    args = parser.parse_args()
+
+    make_server(DatasetService(args.path), args.host, args.port).serve_forever()
@@ -0,0 +1,312 @@
+# This .py file will be used for handing DataFrames from the pipeline to plotting/report processes through shared memory.
+# Importing python packages
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+import pandas as pd
+
+# JSON registry of published frames: name -> layout of its shared memory segment.
+REGISTRY_PATH = os.path.join(tempfile.gettempdir(), "siads_shared_frames.json")
+
+# Column buffers start on 64 byte boundaries.
+_ALIGN = 64
+
+# Segments this process created (to unlink) or attached to (to keep the memory mapped).
+_OWNED = {}
+_ATTACHED = {}
+# Unlinked segments stay mapped while frames built on them may still be in use.
+_RETIRED = []
+_TRACKER_LOCK = threading.Lock()
+
+
+def _read_registry(registry_path):
+    if not os.path.exists(registry_path):
+        return {}
+    with open(registry_path) as file:
+        return json.load(file)
+
+
+def _write_registry(registry, registry_path):
+    # Write then rename, so readers never see a half written file.
+    tmp_path = f"{registry_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(registry, file)
+    os.replace(tmp_path, registry_path)
+
+
+@contextmanager
+def _registry_lock(registry_path):
+    # Publishers in other processes update the same registry, so every read-modify-write of it
+    # holds an exclusive lock on a file next to it.
+    with open(f"{registry_path}.lock", "a+") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _series_arrays(series, name):
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufM":
+        return {"name": name, "kind": "numeric", "data": np.ascontiguousarray(series.to_numpy())}
+    if isinstance(series.array, (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)):
+        # Nullable columns: their values (0 where missing) and their missing mask.
+        numpy_dtype = dtype.numpy_dtype
+        return {"name": name, "kind": "masked", "dtype": str(dtype),
+                "data": series.to_numpy(dtype=numpy_dtype, na_value=numpy_dtype.type(0)),
+                "mask": series.isna().to_numpy()}
+    if isinstance(dtype, pd.CategoricalDtype):
+        return {"name": name, "kind": "categorical", "ordered": bool(dtype.ordered),
+                "data": np.ascontiguousarray(series.cat.codes.to_numpy()),
+                "categories": _series_arrays(pd.Series(dtype.categories), "categories")}
+
+    missing = series.isna().to_numpy()
+    text = series.astype(object).where(~missing, "").astype(str).to_numpy().astype(str)
+    return {"name": name, "kind": "text", "dtype": str(dtype), "data": text, "mask": missing}
+
+
+def _column_arrays(df):
+    """
+        Splits a DataFrame into NumPy arrays that can be laid out in shared memory: numeric, boolean
+        and datetime columns as they are, nullable columns as their values plus a missing mask,
+        categorical columns as their codes plus their categories, and everything else as
+        fixed-width unicode plus a missing mask. The original dtype is rebuilt by attach_frame.
+    """
+    return [_series_arrays(df.iloc[:, i], col) for i, col in enumerate(df.columns)]
+
+
+def _buffers(column):
+    # The arrays of a column, its categories included.
+    for part in ("data", "mask"):
+        if part in column:
+            yield column, part
+    if "categories" in column:
+        yield from _buffers(column["categories"])
+
+
+def _column_info(column, offsets):
+    # Registry entry of a column: its metadata and the offset and dtype of each of its arrays.
+    info = {key: value for key, value in column.items() if key not in ("data", "mask", "categories")}
+    for part in ("data", "mask"):
+        if part in column:
+            info[part] = {"offset": offsets[id(column), part], "dtype": column[part].dtype.str}
+    if "categories" in column:
+        info["categories"] = _column_info(column["categories"], offsets)
+        info["categories"]["length"] = len(column["categories"]["data"])
+
+    return info
+
+
+def publish_frame(name, df, registry_path=REGISTRY_PATH):
+    """
+        Copies a DataFrame once into a shared memory segment and registers it under a name, so other
+        processes can attach to it instead of reading a CSV file. Publishing the same name again
+        replaces the frame (processes already attached keep the old copy).
+
+        Parameters
+        ----------
+        name : str
+            Registry name, e.g. 'df_final'.
+        df : pandas.DataFrame
+        registry_path : str, optional
+            Location of the registry file.
+
+        Returns
+        -------
+        dict
+            The registry entry (segment name, sizes and column layout).
+    """
+    columns = _column_arrays(df)
+    index_name = None
+    if not isinstance(df.index, pd.RangeIndex):
+        index_name = "__index__"
+        columns += _column_arrays(df.index.to_frame(name=index_name))
+
+    # Lay every column buffer out one after the other in a single segment.
+    offsets = {}
+    offset = 0
+    for column in columns:
+        for owner, part in _buffers(column):
+            offsets[id(owner), part] = offset
+            offset += -(-max(owner[part].nbytes, 1) // _ALIGN) * _ALIGN
+    segment = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+
+    for column in columns:
+        for owner, part in _buffers(column):
+            array = owner[part]
+            target = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf, offset=offsets[id(owner), part])
+            target[...] = array
+    infos = [_column_info(column, offsets) for column in columns]
+
+    entry = {
+        "segment": segment.name,
+        "n_rows": len(df),
+        "columns": [info for info in infos if info["name"] != index_name],
+        "index": infos[-1] if index_name else
+                 {"start": df.index.start, "stop": df.index.stop, "step": df.index.step},
+        "published": time.time(),
+        "pid": os.getpid()
+    }
+
+    with _registry_lock(registry_path):
+        registry = _read_registry(registry_path)
+        old = registry.get(name)
+        registry[name] = entry
+        _write_registry(registry, registry_path)
+
+    _OWNED[segment.name] = segment
+    if old is not None and old["segment"] in _OWNED:
+        _retire(_OWNED.pop(old["segment"]))
+
+    return entry
+
+
+def _retire(segment):
+    # Unlinking frees the memory once every process has unmapped it. Closing it here would unmap
+    # it under DataFrames of this process that still point into it.
+    segment.unlink()
+    _RETIRED.append(segment)
+
+
+def _open_segment(segment_name):
+    try:
+        return shared_memory.SharedMemory(name=segment_name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching also registers the segment with the resource tracker, which
+        # would delete it when this process exits although the publisher still owns it.
+        with _TRACKER_LOCK:
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                return shared_memory.SharedMemory(name=segment_name)
+            finally:
+                resource_tracker.register = register
+
+
+def _buffer_view(segment, part, n_rows):
+    values = np.ndarray((n_rows,), dtype=np.dtype(part["dtype"]), buffer=segment.buf, offset=part["offset"])
+    values.flags.writeable = False
+    return values
+
+
+def _column_view(segment, info, n_rows):
+    n_rows = info.get("length", n_rows)
+    values = _buffer_view(segment, info["data"], n_rows)
+    if info["kind"] == "numeric":
+        return values
+    if info["kind"] == "categorical":
+        categories = pd.Index(_column_view(segment, info["categories"], n_rows))
+        return pd.Categorical.from_codes(values, categories=categories, ordered=info["ordered"], validate=False)
+
+    missing = _buffer_view(segment, info["mask"], n_rows)
+    if info["kind"] == "masked":
+        dtype = pd.api.types.pandas_dtype(info["dtype"])
+        return dtype.construct_array_type()(values, missing)
+
+    text = values.astype(object)
+    text[missing] = np.nan
+    dtype = info.get("dtype", "object")
+
+    return text if dtype == "object" else pd.Series(text, copy=False).astype(dtype).array
+
+
+def attach_frame(name, registry_path=REGISTRY_PATH):
+    """
+        Attaches to a frame published by another process. Numeric, nullable and categorical columns
+        are read-only views of the shared memory (no copy, so attaching costs the same for any number
+        of rows); text columns are rebuilt as Python strings. Every column gets its published dtype.
+
+        Parameters
+        ----------
+        name : str
+            Registry name used by publish_frame.
+        registry_path : str, optional
+            Location of the registry file.
+
+        Returns
+        -------
+        pandas.DataFrame
+    """
+    registry = _read_registry(registry_path)
+    if name not in registry:
+        raise KeyError(f"No frame named '{name}' has been published, available: {sorted(registry)}")
+    entry = registry[name]
+
+    segment = _OWNED.get(entry["segment"], _ATTACHED.get(entry["segment"]))
+    if segment is None:
+        segment = _open_segment(entry["segment"])
+        _ATTACHED[entry["segment"]] = segment
+
+    n_rows = entry["n_rows"]
+    data = {info["name"]: _column_view(segment, info, n_rows) for info in entry["columns"]}
+    index = entry["index"]
+    if "kind" in index:
+        index = pd.Index(_column_view(segment, index, n_rows))
+    else:
+        index = pd.RangeIndex(index["start"], index["stop"], index["step"])
+
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def list_frames(registry_path=REGISTRY_PATH):
+    """
+        Names of the published frames with their size and publish time.
+
+        Returns
+        -------
+        pandas.DataFrame
+    """
+    registry = _read_registry(registry_path)
+    rows = [{"name": name, "n_rows": entry["n_rows"], "n_columns": len(entry["columns"]),
+             "published": pd.Timestamp(entry["published"], unit="s"), "pid": entry["pid"]}
+            for name, entry in registry.items()]
+
+    return pd.DataFrame(rows, columns=["name", "n_rows", "n_columns", "published", "pid"])
+
+
+def detach_frames():
+    """
+        Releases this process's views of attached frames. DataFrames returned by attach_frame must
+        not be used afterwards.
+    """
+    for segment in _ATTACHED.values():
+        segment.close()
+    _ATTACHED.clear()
+
+
+def unpublish_frame(name, registry_path=REGISTRY_PATH):
+    """
+        Removes a frame from the registry. Its shared memory is freed by the publishing process,
+        right away when it is the caller, otherwise when that process exits.
+    """
+    with _registry_lock(registry_path):
+        registry = _read_registry(registry_path)
+        entry = registry.pop(name, None)
+        if entry is None:
+            return
+        _write_registry(registry, registry_path)
+
+    segment = _OWNED.pop(entry["segment"], None)
+    if segment is not None:
+        _retire(segment)
@@ -0,0 +1,317 @@
+# This .py file will be used for streaming sketches that summarize columns too large to load at once.
+# Importing python packages
+import copy
+
+import numpy as np
+import pandas as pd
+
+from data_loader import load_csv_chunks
+from summary_stats import fft_kde
+
+
+class KLLSketch:
+    """
+        KLL quantile sketch. Values are kept in levels of compactors; a full level is sorted and every
+        other item (random offset) is promoted to the next level with double the weight. The memory
+        stays around 3k items no matter how many values are added, and two sketches can be merged.
+
+        Parameters
+        ----------
+        k : int, default=200
+            Size of the top compactor; larger k gives more accurate quantiles.
+        seed : int, default=0
+            Seed for the compaction offsets.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(8, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays on this level so the weights still add up.
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                pairs = items[:len(items) - len(keep)]
+                promoted = pairs[self.rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def update(self, values):
+        """
+            Adds an array of values (NaNs are skipped).
+        """
+        values = np.asarray(values, dtype=float)
+        self.levels[0] = np.concatenate([self.levels[0], values[~np.isnan(values)]])
+        self._compress()
+
+    def merge(self, other):
+        """
+            Adds every item of another sketch into this one.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+
+    def items(self):
+        """
+            Returns the retained items (sorted) and the number of values each one stands for.
+        """
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+
+        return values[order], weights[order]
+
+    def quantiles(self, q):
+        """
+            Approximate quantiles for an array of probabilities q.
+        """
+        values, weights = self.items()
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        if values.size == 0:
+            return np.full(q.shape, np.nan)
+        cum = np.cumsum(weights)
+        idx = np.searchsorted(cum, q * cum[-1], side="left")
+
+        return values[np.clip(idx, 0, values.size - 1)]
+
+    def rank(self, x):
+        """
+            Approximate number of values <= each point in x.
+        """
+        values, weights = self.items()
+        cum = np.concatenate([[0.0], np.cumsum(weights)])
+
+        return cum[np.searchsorted(values, np.asarray(x, dtype=float), side="right")]
+
+
+class ColumnSketch:
+    """
+        Constant-memory summary of one numeric column built from chunks: running count, mean and
+        variance, min/max, a KLL quantile sketch and (when a range is given) a fixed-bin histogram.
+        Sketches of the same column built by different workers can be merged.
+
+        Parameters
+        ----------
+        k : int, default=200
+            Accuracy parameter of the quantile sketch.
+        bins : int, default=15
+            Number of histogram bins.
+        hist_range : tuple, optional
+            (low, high) of an exact fixed-bin histogram. Without it, the histogram is estimated
+            from the quantile sketch between the observed min and max.
+        seed : int, default=0
+            Seed for the quantile sketch.
+    """
+
+    def __init__(self, k=200, bins=15, hist_range=None, seed=0):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.bins = bins
+        self.hist_range = hist_range
+        self.hist_counts = np.zeros(bins) if hist_range is not None else None
+        self.quantile_sketch = KLLSketch(k=k, seed=seed)
+
+    def _combine_moments(self, count, mean, m2):
+        # Chan et al. parallel update of the running mean and sum of squared deviations.
+        total = self.count + count
+        if total == 0:
+            return
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def update(self, values):
+        """
+            Adds one chunk of values (a pandas.Series or array; NaNs are skipped).
+        """
+        values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+
+        self._combine_moments(values.size, values.mean(), ((values - values.mean()) ** 2).sum())
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        if self.hist_counts is not None:
+            self.hist_counts += np.histogram(values, bins=self.bins, range=self.hist_range)[0]
+        self.quantile_sketch.update(values)
+
+    def merge(self, other):
+        """
+            Combines another sketch of the same column (e.g. from another worker) into this one.
+        """
+        self._combine_moments(other.count, other.mean, other.m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if self.hist_counts is not None:
+            if other.hist_range != self.hist_range or other.bins != self.bins:
+                raise ValueError("Only histograms with the same range and bins can be merged.")
+            self.hist_counts += other.hist_counts
+        self.quantile_sketch.merge(other.quantile_sketch)
+
+        return self
+
+    def summary(self, kde=True, gridsize=200):
+        """
+            Summarizes the sketch in the same format as summary_stats.column_summaries, so the
+            histogram/boxplot functions can draw it through their summary argument.
+        """
+        q1, median, q3 = self.quantile_sketch.quantiles([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        low_limit = q1 - 1.5 * iqr
+        high_limit = q3 + 1.5 * iqr
+
+        # The retained items are real data points, so whiskers and fliers come from them.
+        items, weights = self.quantile_sketch.items()
+        inside = items[(items >= low_limit) & (items <= high_limit)]
+
+        if self.hist_counts is not None:
+            edges = np.linspace(self.hist_range[0], self.hist_range[1], self.bins + 1)
+            counts = self.hist_counts.copy()
+        else:
+            edges = np.linspace(self.min, self.max, self.bins + 1)
+            ranks = self.quantile_sketch.rank(edges)
+            ranks[0] = 0.0
+            ranks[-1] = self.quantile_sketch.rank([self.max])[0]
+            counts = np.diff(ranks) * self.count / max(ranks[-1], 1.0)
+
+        kde_x = kde_y = None
+        if kde and items.size > 1:
+            kde_x, kde_y = fft_kde(items[:, None], gridsize, weights=weights[:, None])
+            kde_x, kde_y = kde_x[0], kde_y[0]
+
+        return {
+            "count": int(self.count),
+            "mean": float(self.mean) if self.count else np.nan,
+            "std": float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else np.nan,
+            "min": float(self.min) if self.count else np.nan,
+            "q1": float(q1),
+            "median": float(median),
+            "q3": float(q3),
+            "max": float(self.max) if self.count else np.nan,
+            "whisker_low": float(max(inside.min(), self.min)) if inside.size else float(q1),
+            "whisker_high": float(min(inside.max(), self.max)) if inside.size else float(q3),
+            "fliers": items[(items < low_limit) | (items > high_limit)],
+            "hist_counts": counts,
+            "hist_edges": edges,
+            "kde_x": kde_x,
+            "kde_y": kde_y
+        }
+
+
+def sketch_chunks(chunks, column_names, **sketch_kws):
+    """
+        Builds one ColumnSketch per column from an iterator of DataFrame chunks.
+
+        Parameters
+        ----------
+        chunks : iterable of pandas.DataFrame
+            E.g. the output of data_loader.load_csv_chunks.
+        column_names : list
+            Columns to sketch.
+        **sketch_kws
+            Passed to ColumnSketch (k, bins, hist_range, seed).
+
+        Returns
+        -------
+        dict
+            Maps each column name to its ColumnSketch.
+    """
+    sketches = {col: ColumnSketch(**sketch_kws) for col in column_names}
+    for chunk in chunks:
+        for col in column_names:
+            sketches[col].update(chunk[col])
+
+    return sketches
+
+
+def sketch_csv(file, column_names, chunksize=100000, **sketch_kws):
+    """
+        Streams a CSV file chunk by chunk and sketches the listed columns with constant memory.
+
+        Parameters
+        ----------
+        file : str or file-like object
+            Path to the CSV file.
+        column_names : list
+            Columns to sketch.
+        chunksize : int, default=100000
+            Number of rows per chunk.
+        **sketch_kws
+            Passed to ColumnSketch (k, bins, hist_range, seed).
+
+        Returns
+        -------
+        dict
+            Maps each column name to its ColumnSketch.
+    """
+    return sketch_chunks(load_csv_chunks(file, chunksize=chunksize, usecols=column_names),
+                         column_names, **sketch_kws)
+
+
+def merge_sketches(sketch_dicts):
+    """
+        Merges the per-column sketches produced by several workers into copies, so the sketches
+        passed in are left unchanged.
+
+        Parameters
+        ----------
+        sketch_dicts : list of dict
+            Each dict maps column names to ColumnSketch objects.
+
+        Returns
+        -------
+        dict
+            Maps each column name to the merged ColumnSketch.
+    """
+    merged = {}
+    for sketches in sketch_dicts:
+        for col, sketch in sketches.items():
+            if col in merged:
+                merged[col].merge(sketch)
+            else:
+                merged[col] = copy.deepcopy(sketch)
+
+    return merged
+
+
+def describe_sketches(sketches):
+    """
+        A DataFrame.describe()-style table computed from sketches instead of the full columns.
+
+        Parameters
+        ----------
+        sketches : dict
+            Maps column names to ColumnSketch objects.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Rows count, mean, std, min, 25%, 50%, 75%, max; one column per sketch.
+    """
+    rows = {}
+    for col, sketch in sketches.items():
+        summary = sketch.summary(kde=False)
+        rows[col] = [summary["count"], summary["mean"], summary["std"], summary["min"],
+                     summary["q1"], summary["median"], summary["q3"], summary["max"]]
+
+    return pd.DataFrame(rows, index=["count", "mean", "std", "min", "25%", "50%", "75%", "max"])
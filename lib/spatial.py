@@ -0,0 +1,504 @@
+# This .py file will be used for a spatial index over the CDI Geolocation points (neighbors, spatial lags, Moran's I).
+# Importing python packages
+import math
+
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+
+# scipy is optional; its KD-tree is used when installed, otherwise queries compare every pair in blocks.
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# Mean earth radius, for distances in kilometers.
+EARTH_RADIUS_KM = 6371.0088
+
+# Query points compared at a time by the block search used without scipy.
+BLOCK_ROWS = 1024
+
+# Permutations of the values scored at a time by morans_i.
+PERMUTATION_BLOCK = 64
+
+# WKT point as written in the CDI 'Geolocation' column: 'POINT (lon lat)'.
+POINT_PATTERN = r"^\s*POINT\s*\(\s*([-+]?[0-9.]+(?:[eE][-+]?[0-9]+)?)\s+([-+]?[0-9.]+(?:[eE][-+]?[0-9]+)?)\s*\)\s*$"
+
+
+def parse_points(values):
+    """
+        Parses WKT 'POINT (lon lat)' strings into coordinate arrays. Every distinct string is
+        parsed once with one vectorized regular expression, so a column repeating a few
+        locations over many rows costs little more than its distinct values.
+
+        Parameters
+        ----------
+        values : pandas.Series or list
+            WKT strings, e.g. the CDI 'Geolocation' column.
+
+        Returns
+        -------
+        tuple
+            1. numpy.ndarray of longitudes.
+            2. numpy.ndarray of latitudes.
+            NaN where the value is missing or not a point.
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype="str"))
+    parts = pd.Series(uniques, dtype="str").str.extract(POINT_PATTERN)
+    coords = np.full((len(uniques) + 1, 2), np.nan)
+    coords[:-1] = parts.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # Code -1 (missing) picks the NaN row at the end.
+    return coords[codes, 0], coords[codes, 1]
+
+
+def _unit_vectors(lon, lat):
+    # Points on the unit sphere; straight-line (chord) distance grows with great-circle distance.
+    lon, lat = np.radians(lon), np.radians(lat)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _chord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=float) / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def _km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+class SpatialWeights:
+    """
+        Sparse spatial weights: row i holds the weights of the neighbors of point i, stored like a
+        CSR matrix (indptr, indices, data) so lags are one bincount over all the pairs.
+
+        Parameters
+        ----------
+        indptr : numpy.ndarray
+            Start of every row in indices/data (length n + 1).
+        indices : numpy.ndarray
+            Neighbor of every pair.
+        data : numpy.ndarray
+            Weight of every pair.
+        standardized : bool
+            The weights of every row add up to 1.
+    """
+
+    def __init__(self, indptr, indices, data, standardized=False):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float64)
+        self.standardized = standardized
+        self.n = len(self.indptr) - 1
+        self.rows = np.repeat(np.arange(self.n), np.diff(self.indptr))
+
+    @classmethod
+    def from_pairs(cls, rows, cols, n, standardize=True):
+        """
+            Binary weights (1 per pair), divided by the number of neighbors when standardize is set.
+        """
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        counts = np.bincount(rows, minlength=n)
+        data = np.ones(len(rows))
+        if standardize:
+            data = data / counts[rows]
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+
+        return cls(indptr, cols, data, standardize)
+
+    def neighbors(self, i):
+        """
+            Neighbors of point i.
+        """
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def lag(self, values):
+        """
+            Weighted sum of the neighbors' values of every point (the spatial lag).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        return np.bincount(self.rows, weights=self.data * values[self.indices], minlength=self.n)
+
+    def subset(self, mask):
+        """
+            The weights among the points where mask is True (renumbered), standardized again when
+            the weights are standardized.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        new_ids = np.cumsum(mask) - 1
+        keep = mask[self.rows] & mask[self.indices]
+        rows, cols = new_ids[self.rows[keep]], new_ids[self.indices[keep]]
+        n = int(mask.sum())
+        if self.standardized:
+            return SpatialWeights.from_pairs(rows, cols, n, standardize=True)
+        counts = np.bincount(rows, minlength=n)
+
+        return SpatialWeights(np.concatenate([[0], np.cumsum(counts)]), cols, self.data[keep])
+
+
+class SpatialIndex:
+    """
+        Index over geography points (e.g. the CDI Geolocation of every location) for nearest
+        neighbor and radius queries. Points are stored as unit vectors, so the straight-line
+        distances used by the index order points like great-circle distances and no projection
+        is needed. Uses scipy's KD-tree when scipy is installed, otherwise an exact block search
+        over every pair, which is fast at county scale (a few thousand points).
+
+        Parameters
+        ----------
+        lon : array-like
+            Longitudes in degrees.
+        lat : array-like
+            Latitudes in degrees.
+        labels : array-like, optional
+            Name of every point (e.g. the State); values passed as a pandas Series are aligned on them.
+    """
+
+    def __init__(self, lon, lat, labels=None):
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        if np.isnan(self.lon).any() or np.isnan(self.lat).any():
+            raise ValueError("The points of a SpatialIndex need coordinates; drop the missing ones first.")
+        self.labels = pd.Index(range(len(self.lon)) if labels is None else labels)
+        self.xyz = _unit_vectors(self.lon, self.lat)
+        self.tree = cKDTree(self.xyz) if cKDTree is not None and len(self.xyz) else None
+
+    @classmethod
+    def from_frame(cls, df, point_col='Geolocation', label_col='LocationDesc'):
+        """
+            One point per geography of a frame with a WKT point column (the first parsable point
+            of every label).
+
+            Parameters
+            ----------
+            df : pandas.DataFrame
+                E.g. the raw chronic disease indicators data.
+            point_col : str, default='Geolocation'
+            label_col : str, default='LocationDesc'
+
+            Returns
+            -------
+            SpatialIndex
+        """
+        missing_cols = [col for col in [point_col, label_col] if col not in df.columns]
+        if missing_cols:
+            raise KeyError(f"The following columns were not found in the DataFrame: {missing_cols}")
+
+        with stage('spatial - index') as record:
+            # The distinct (label, point) pairs first, so the points are parsed once per location.
+            pairs = df[[label_col, point_col]].drop_duplicates()
+            lon, lat = parse_points(pairs[point_col])
+            found = ~np.isnan(lon) & ~np.isnan(lat)
+            labels = pairs[label_col].to_numpy()[found]
+            first = ~pd.Index(labels).duplicated()
+            index = cls(lon[found][first], lat[found][first], labels[first])
+            record['points'] = len(index.labels)
+
+        return index
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _points(self, lon, lat):
+        return _unit_vectors(np.atleast_1d(np.asarray(lon, dtype=np.float64)),
+                             np.atleast_1d(np.asarray(lat, dtype=np.float64)))
+
+    def _knn(self, xyz, k):
+        k = min(k, len(self))
+        if self.tree is not None:
+            dist, idx = self.tree.query(xyz, k=k)
+            return dist.reshape(len(xyz), k), idx.reshape(len(xyz), k)
+
+        dist = np.empty((len(xyz), k))
+        idx = np.empty((len(xyz), k), dtype=np.int64)
+        for start in range(0, len(xyz), BLOCK_ROWS):
+            block = xyz[start:start + BLOCK_ROWS]
+            d2 = np.maximum(2 - 2 * block @ self.xyz.T, 0)
+            part = np.argpartition(d2, k - 1, axis=1)[:, :k] if k < len(self) else np.tile(np.arange(k), (len(block), 1))
+            part_d2 = np.take_along_axis(d2, part, axis=1)
+            order = np.argsort(part_d2, axis=1, kind='stable')
+            idx[start:start + len(block)] = np.take_along_axis(part, order, axis=1)
+            dist[start:start + len(block)] = np.sqrt(np.take_along_axis(part_d2, order, axis=1))
+
+        return dist, idx
+
+    def query(self, lon, lat, k=1):
+        """
+            The k nearest points of every query point.
+
+            Parameters
+            ----------
+            lon, lat : float or array-like
+                Query coordinates in degrees.
+            k : int, default=1
+
+            Returns
+            -------
+            tuple
+                1. numpy.ndarray (queries x k) of distances in km, nearest first.
+                2. numpy.ndarray (queries x k) of point positions.
+        """
+        dist, idx = self._knn(self._points(lon, lat), k)
+        return _km(dist), idx
+
+    def within(self, lon, lat, radius_km):
+        """
+            The points within radius_km of every query point.
+
+            Parameters
+            ----------
+            lon, lat : float or array-like
+                Query coordinates in degrees.
+            radius_km : float
+
+            Returns
+            -------
+            list
+                One numpy.ndarray of point positions per query point (sorted).
+        """
+        xyz = self._points(lon, lat)
+        chord = _chord(radius_km)
+        if self.tree is not None:
+            return [np.sort(np.asarray(found, dtype=np.int64)) for found in self.tree.query_ball_point(xyz, chord)]
+
+        found = []
+        for start in range(0, len(xyz), BLOCK_ROWS):
+            d2 = np.maximum(2 - 2 * xyz[start:start + BLOCK_ROWS] @ self.xyz.T, 0)
+            rows, cols = np.nonzero(d2 <= chord ** 2)
+            found.extend(np.split(cols, np.searchsorted(rows, np.arange(1, len(d2)))))
+
+        return found
+
+    def weights(self, k=None, radius_km=None, standardize=True):
+        """
+            Spatial weights between the points of the index: the k nearest other points, or
+            every other point within radius_km.
+
+            Parameters
+            ----------
+            k : int, optional
+            radius_km : float, optional
+                Exactly one of k and radius_km.
+            standardize : bool, default=True
+                Divide the weights of every point by its number of neighbors (the spatial lag is
+                then the mean of the neighbors).
+
+            Returns
+            -------
+            SpatialWeights
+        """
+        if (k is None) == (radius_km is None):
+            raise ValueError("Pass either k or radius_km.")
+        n = len(self)
+        own = np.arange(n)
+
+        if k is not None:
+            # One extra neighbor, then drop the point itself (or the farthest one when a
+            # duplicate location took its place).
+            _, idx = self._knn(self.xyz, min(k + 1, n))
+            other = idx != own[:, None]
+            drop_last = other.all(axis=1)
+            other[drop_last, -1] = False
+            rows = np.broadcast_to(own[:, None], idx.shape)[other]
+            cols = idx[other]
+        else:
+            found = self.within(self.lon, self.lat, radius_km)
+            rows = np.repeat(own, [len(cols) for cols in found])
+            cols = np.concatenate(found) if found else np.array([], dtype=np.int64)
+            rows, cols = rows[rows != cols], cols[rows != cols]
+
+        return SpatialWeights.from_pairs(rows, cols, n, standardize)
+
+    def align(self, values):
+        """
+            Values in the order of the points: a pandas Series is matched on the labels (missing
+            labels become NaN), anything else is taken in order.
+        """
+        if isinstance(values, pd.Series):
+            return values.reindex(self.labels).to_numpy(dtype=np.float64, na_value=np.nan)
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) != len(self):
+            raise ValueError(f"Got {len(values)} values for {len(self)} points.")
+        return values
+
+
+def spatial_lag(values, weights):
+    """
+        Weighted mean (standardized weights) or sum of the neighbors' values of every point.
+        Missing neighbor values are left out and the weights of the others rescaled.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            One value per point of the weights.
+        weights : SpatialWeights
+
+        Returns
+        -------
+        numpy.ndarray
+    """
+    values = np.asarray(values, dtype=np.float64)
+    observed = ~np.isnan(values)
+    num = weights.lag(np.where(observed, values, 0.0))
+    if not weights.standardized:
+        return np.where(np.bincount(weights.rows, weights=observed[weights.indices], minlength=weights.n) > 0,
+                        num, np.nan)
+    den = weights.lag(observed.astype(np.float64))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def smooth_values(values, weights, self_weight=1.0):
+    """
+        Neighbor-smoothed estimates: the weighted mean of every point's own value (with
+        self_weight) and its neighbors' values. Points without a value get the mean of their
+        neighbors.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            One value per point, e.g. the prevalence of every location.
+        weights : SpatialWeights
+        self_weight : float, default=1.0
+            Weight of the point's own value. With standardized weights the observed neighbors
+            share a weight of 1, so 1.0 gives the own value half of the weight.
+
+        Returns
+        -------
+        numpy.ndarray
+    """
+    values = np.asarray(values, dtype=np.float64)
+    observed = ~np.isnan(values)
+    own = np.where(observed, values, 0.0)
+    num = weights.lag(own)
+    den = weights.lag(observed.astype(np.float64))
+    if weights.standardized:
+        # The observed neighbors share the whole neighbor weight of 1.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            num = np.where(den > 0, num / den, 0.0)
+        den = (den > 0).astype(np.float64)
+    num = self_weight * own + num
+    den = self_weight * observed + den
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def _pair_sums(weights):
+    # S0, S1 and S2 of Moran's I variance, from the pairs and their transposed pairs.
+    n = weights.n
+    codes = weights.rows * n + weights.indices
+    order = np.argsort(codes)
+    transposed = weights.indices * n + weights.rows
+    if len(codes):
+        pos = np.minimum(np.searchsorted(codes[order], transposed), len(codes) - 1)
+        reverse = codes[order][pos] == transposed
+        w_ji = np.where(reverse, weights.data[order][pos], 0.0)
+    else:
+        reverse, w_ji = np.zeros(0, dtype=bool), np.zeros(0)
+
+    s0 = weights.data.sum()
+    # A pair without its reverse pair also stands for the (w_ji = 0) term of the reverse direction.
+    s1 = 0.5 * np.where(reverse, (weights.data + w_ji) ** 2, 2 * weights.data ** 2).sum()
+    row_sums = np.bincount(weights.rows, weights=weights.data, minlength=n)
+    col_sums = np.bincount(weights.indices, weights=weights.data, minlength=n)
+    s2 = ((row_sums + col_sums) ** 2).sum()
+
+    return s0, s1, s2
+
+
+def morans_i(values, weights, permutations=0, seed=0):
+    """
+        Global Moran's I of the values: positive when neighbors have similar values (spatial
+        clustering), near its expected value -1/(n-1) without spatial pattern. Points without a
+        value are left out together with their pairs.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            One value per point of the weights.
+        weights : SpatialWeights
+        permutations : int, default=0
+            Number of random permutations of the values for a pseudo p-value; scored in blocks
+            of PERMUTATION_BLOCK at once.
+        seed : int, default=0
+
+        Returns
+        -------
+        dict
+            I, expected, variance (normal approximation), z, p_norm (two-sided) and, with
+            permutations, p_perm (share of permutations at least as extreme, one-sided).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    observed = ~np.isnan(values)
+    if not observed.all():
+        weights = weights.subset(observed)
+        values = values[observed]
+    n = len(values)
+    z = values - values.mean()
+    s0, s1, s2 = _pair_sums(weights)
+    if n < 3 or s0 == 0 or (z ** 2).sum() == 0:
+        raise ValueError("Moran's I needs at least 3 points with different values and some neighbors.")
+
+    def statistic(z_block):
+        # z_block: (permutations x n); returns Moran's I of every row.
+        cross = (z_block[:, weights.rows] * z_block[:, weights.indices] * weights.data).sum(axis=1)
+        return n / s0 * cross / (z_block ** 2).sum(axis=1)
+
+    i_value = float(statistic(z[None, :])[0])
+    expected = -1.0 / (n - 1)
+    variance = (n ** 2 * s1 - n * s2 + 3 * s0 ** 2) / ((n ** 2 - 1) * s0 ** 2) - expected ** 2
+    z_score = (i_value - expected) / math.sqrt(variance) if variance > 0 else float('nan')
+    result = {'I': i_value, 'expected': expected, 'variance': variance, 'z': z_score,
+              'p_norm': math.erfc(abs(z_score) / math.sqrt(2)) if variance > 0 else float('nan')}
+
+    if permutations:
+        rng = np.random.default_rng(seed)
+        extreme = 0
+        for start in range(0, permutations, PERMUTATION_BLOCK):
+            size = min(PERMUTATION_BLOCK, permutations - start)
+            simulated = statistic(rng.permuted(np.tile(z, (size, 1)), axis=1))
+            extreme += int((simulated >= i_value).sum()) if i_value >= expected else int((simulated <= i_value).sum())
+        result['p_perm'] = (extreme + 1) / (permutations + 1)
+
+    return result
+
+
+def smooth_prevalence(index, values, k=5, radius_km=None, self_weight=1.0):
+    """
+        Neighbor-smoothed prevalence of every geography of an index (see smooth_values), e.g.
+        smooth_prevalence(index, df_final.set_index('State')['Overall - Diabetes-DataValue']).
+
+        Parameters
+        ----------
+        index : SpatialIndex
+        values : pandas.Series or array-like
+            Prevalence per geography; a Series is matched on the labels of the index.
+        k : int, default=5
+            Number of neighbors, unless radius_km is given.
+        radius_km : float, optional
+            Use every geography within this distance as a neighbor instead.
+        self_weight : float, default=1.0
+
+        Returns
+        -------
+        pandas.Series
+            Smoothed values, indexed by the labels of the index.
+    """
+    weights = index.weights(k=None if radius_km is not None else k, radius_km=radius_km)
+    return pd.Series(smooth_values(index.align(values), weights, self_weight), index=index.labels,
+                     name=getattr(values, 'name', None))
+
+
+def spatial_autocorrelation(index, values, k=5, radius_km=None, permutations=999, seed=0):
+    """
+        Moran's I of the values of every geography of an index over its k nearest neighbors (or
+        the neighbors within radius_km), see morans_i.
+
+        Returns
+        -------
+        dict
+    """
+    weights = index.weights(k=None if radius_km is not None else k, radius_km=radius_km)
+    with stage('spatial - morans_i', points=weights.n, pairs=len(weights.data)):
+        return morans_i(index.align(values), weights, permutations=permutations, seed=seed)
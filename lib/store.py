@@ -0,0 +1,292 @@
+# This .py file will be used for publishing the processed DataFrames into a local SQLite store and querying it.
+# Importing python packages
+import os
+import re
+import sqlite3
+
+import pandas as pd
+
+from geography import GEO_KEY, fips_codes, fips_regions, region_fips
+
+DEFAULT_STORE = "./data/processed/processed.sqlite"
+DEFAULT_YEAR = 2022
+
+# Long table holding every '<Stratification> - <Question>-<Measure>' value of the published outputs.
+INDICATOR_TABLE = "indicators"
+INDICATOR_PATTERN = re.compile(r"^(?P<stratification>.+?) - (?P<question>.+)-(?P<measure>DataValue|LowConfidenceLimit|HighConfidenceLimit)$")
+
+# Names used by the CDI file that differ from the prefixes of the processed columns.
+STRATIFICATION_ALIASES = {"Male": "Males", "Female": "Females"}
+
+_CONNECTIONS = {}
+
+
+def open_store(path=DEFAULT_STORE):
+    """
+        Opens (and creates if needed) the SQLite store. Connections are reused, so repeated queries
+        do not pay for opening the file again.
+
+        Parameters
+        ----------
+        path : str, default="./data/processed/processed.sqlite"
+
+        Returns
+        -------
+        sqlite3.Connection
+    """
+    key = os.path.abspath(path)
+    if key not in _CONNECTIONS:
+        con = sqlite3.connect(key, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {INDICATOR_TABLE} (
+                source TEXT, {GEO_KEY} INTEGER, State TEXT, region TEXT, year INTEGER,
+                stratification TEXT, question TEXT, measure TEXT, value REAL
+            )""")
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{INDICATOR_TABLE}_lookup "
+                    f"ON {INDICATOR_TABLE} (source, question, stratification, year, region)")
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{INDICATOR_TABLE}_geo ON {INDICATOR_TABLE} ({GEO_KEY}, year)")
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{INDICATOR_TABLE}_strat ON {INDICATOR_TABLE} (stratification, year)")
+        con.commit()
+        _CONNECTIONS[key] = con
+
+    return _CONNECTIONS[key]
+
+
+def close_store(path=DEFAULT_STORE):
+    """
+        Closes the cached connection to a store.
+    """
+    con = _CONNECTIONS.pop(os.path.abspath(path), None)
+    if con is not None:
+        con.close()
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _table_columns(con, name):
+    return [row[1] for row in con.execute(f"PRAGMA table_info({_quote(name)})")]
+
+
+def _indicator_rows(df, source, year):
+    """
+        Melts the '<Stratification> - <Question>-<Measure>' columns of a wide output into long rows.
+    """
+    matches = {col: INDICATOR_PATTERN.match(col) for col in df.columns}
+    matches = {col: match for col, match in matches.items() if match}
+    if not matches:
+        return pd.DataFrame()
+
+    long_df = df[["State", GEO_KEY] + list(matches)].melt(id_vars=["State", GEO_KEY], var_name="column")
+    parts = pd.DataFrame([match.groupdict() for match in matches.values()], index=list(matches))
+    long_df = long_df.join(parts, on="column").drop(columns=["column"])
+    long_df = long_df.dropna(subset=["value"])
+    long_df.insert(0, "source", source)
+    long_df["region"] = fips_regions(long_df[GEO_KEY]).to_numpy()
+    long_df["year"] = year
+
+    return long_df[["source", GEO_KEY, "State", "region", "year", "stratification", "question", "measure", "value"]]
+
+
+def publish_table(df, name, year=DEFAULT_YEAR, path=DEFAULT_STORE):
+    """
+        Publishes one processed DataFrame. The wide table is written as-is with FIPS and year columns
+        (indexed), and every prevalence/confidence limit value is added to the long indicators table
+        so it can be looked up by geography, year and stratification.
+        Publishing the same name and year again replaces the earlier rows.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            A processed output with a 'State' column.
+        name : str
+            Table name, e.g. 'Final_dataset'.
+        year : int, default=2022
+        path : str, default="./data/processed/processed.sqlite"
+    """
+    con = open_store(path)
+    df = df.loc[:, [col for col in df.columns if not str(col).startswith("Unnamed:")]]
+    keys = pd.DataFrame({GEO_KEY: fips_codes(df["State"]).to_numpy(), "year": year}, index=df.index)
+    df = pd.concat([df, keys], axis=1)
+
+    with con:
+        # Keep other years of the table when the columns still match; otherwise start over.
+        if _table_columns(con, name) == list(df.columns):
+            con.execute(f"DELETE FROM {_quote(name)} WHERE year = ?", (year,))
+            df.to_sql(name, con, if_exists="append", index=False)
+        else:
+            df.to_sql(name, con, if_exists="replace", index=False)
+        con.execute(f"CREATE INDEX IF NOT EXISTS {_quote('idx_' + name + '_geo')} ON {_quote(name)} ({GEO_KEY}, year)")
+
+        con.execute(f"DELETE FROM {INDICATOR_TABLE} WHERE source = ? AND year = ?", (name, year))
+        rows = _indicator_rows(df, name, year)
+        if len(rows):
+            rows.to_sql(INDICATOR_TABLE, con, if_exists="append", index=False)
+
+    con.execute("ANALYZE")
+
+
+def publish_outputs(frames, year=DEFAULT_YEAR, path=DEFAULT_STORE):
+    """
+        Publishes several processed DataFrames at once.
+
+        Parameters
+        ----------
+        frames : dict
+            Maps table names (e.g. 'Census_Final', 'diabete_vs_income') to DataFrames.
+        year : int, default=2022
+        path : str, default="./data/processed/processed.sqlite"
+    """
+    for name, df in frames.items():
+        publish_table(df, name, year=year, path=path)
+
+
+def publish_processed_dir(directory="./data/processed", year=DEFAULT_YEAR, path=DEFAULT_STORE):
+    """
+        Publishes every CSV file of the processed folder (table name = file name), e.g. to build the
+        store from outputs that were saved before it existed.
+
+        Returns
+        -------
+        list
+            Names of the published tables.
+    """
+    names = []
+    for file in sorted(os.listdir(directory)):
+        if file.endswith(".csv"):
+            name = file[:-len(".csv")]
+            publish_table(pd.read_csv(os.path.join(directory, file)), name, year=year, path=path)
+            names.append(name)
+
+    return names
+
+
+def _geo_filter(region, states):
+    """
+        SQL condition and parameters restricting rows to a region and/or a list of states.
+    """
+    codes = []
+    if region is not None:
+        codes += region_fips(region)
+    if states is not None:
+        state_codes = fips_codes(states)
+        unknown = [state for state, code in zip(states, state_codes) if pd.isna(code)]
+        if unknown:
+            raise KeyError(f"The following geographies are not in the geography index: {unknown}")
+        state_codes = [int(code) for code in state_codes]
+        codes = [code for code in codes if code in state_codes] if region is not None else state_codes
+
+    return f"{GEO_KEY} IN ({', '.join('?' * len(codes))})", codes
+
+
+def _as_list(value):
+    return [value] if isinstance(value, (str, int)) else list(value)
+
+
+def query_indicators(question=None, stratification=None, region=None, states=None, year=None,
+                     measure="DataValue", source="Chronic_Disease_Final", path=DEFAULT_STORE):
+    """
+        Looks up indicator values through the store's indexes, e.g.
+        query_indicators("Diabetes", "Female", region="Southeast").
+
+        Parameters
+        ----------
+        question : str or list, optional
+            Short question names, e.g. 'Diabetes', 'Obesity'.
+        stratification : str or list, optional
+            E.g. 'Overall', 'Female' (or 'Females'), 'Hispanic'.
+        region : str, optional
+            BEA region, one of geography.REGIONS.
+        states : list, optional
+            State names or abbreviations.
+        year : int or list, optional
+        measure : str or list, default="DataValue"
+            'DataValue', 'LowConfidenceLimit' or 'HighConfidenceLimit'.
+        source : str, default="Chronic_Disease_Final"
+            Published table the values came from.
+        path : str, default="./data/processed/processed.sqlite"
+
+        Returns
+        -------
+        pandas.DataFrame
+            Columns State, FIPS, region, year, stratification, question, measure and value.
+    """
+    conditions = ["source = ?"]
+    params = [source]
+    if stratification is not None:
+        stratification = [STRATIFICATION_ALIASES.get(strat, strat) for strat in _as_list(stratification)]
+    for col, value in (("question", question), ("stratification", stratification),
+                       ("year", year), ("measure", measure)):
+        if value is not None:
+            value = _as_list(value)
+            conditions.append(f"{col} IN ({', '.join('?' * len(value))})")
+            params += value
+    if region is not None or states is not None:
+        condition, codes = _geo_filter(region, states)
+        conditions.append(condition)
+        params += codes
+
+    sql = (f"SELECT State, {GEO_KEY}, region, year, stratification, question, measure, value "
+           f"FROM {INDICATOR_TABLE} WHERE {' AND '.join(conditions)} "
+           f"ORDER BY question, stratification, year, {GEO_KEY}")
+
+    return pd.read_sql_query(sql, open_store(path), params=params)
+
+
+def query_table(name, columns=None, region=None, states=None, year=None, path=DEFAULT_STORE):
+    """
+        Reads the rows and columns of interest from a published wide table.
+
+        Parameters
+        ----------
+        name : str
+            Published table name, e.g. 'diabete_vs_income'.
+        columns : list, optional
+            Columns to return ('State' is always included).
+        region : str, optional
+            BEA region, one of geography.REGIONS.
+        states : list, optional
+            State names or abbreviations.
+        year : int, optional
+        path : str, default="./data/processed/processed.sqlite"
+
+        Returns
+        -------
+        pandas.DataFrame
+    """
+    con = open_store(path)
+    available = _table_columns(con, name)
+    if not available:
+        raise KeyError(f"No table named '{name}' has been published")
+    columns = available if columns is None else ["State"] + [col for col in columns if col != "State"]
+    missing_cols = [col for col in columns if col not in available]
+    if missing_cols:
+        raise KeyError(f"The following columns were not found in the DataFrame: {missing_cols}")
+
+    conditions = []
+    params = []
+    if year is not None:
+        conditions.append("year = ?")
+        params.append(year)
+    if region is not None or states is not None:
+        condition, codes = _geo_filter(region, states)
+        conditions.append(condition)
+        params += codes
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    sql = f"SELECT {', '.join(_quote(col) for col in columns)} FROM {_quote(name)}{where} ORDER BY {GEO_KEY}"
+
+    return pd.read_sql_query(sql, con, params=params)
+
+
+def list_tables(path=DEFAULT_STORE):
+    """
+        Names of the published wide tables.
+    """
+    rows = open_store(path).execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name != ? AND name NOT LIKE 'sqlite_%' ORDER BY name",
+        (INDICATOR_TABLE,))
+
+    return [row[0] for row in rows]
@@ -0,0 +1,177 @@
+# This .py file will be used for functions that precompute the summary statistics behind the distribution plots.
+# Importing python packages
+import numpy as np
+
+from binning import hist1d
+from correlation import frame_fingerprint
+
+# Summaries that have already been computed, keyed by a fingerprint of the column and the settings.
+_SUMMARY_CACHE = {}
+_SUMMARY_CACHE_SIZE = 256
+
+
+def fft_kde(values, gridsize=200, cut=0, bw_adjust=1, weights=None):
+    """
+        Gaussian kernel density estimate of every column at once. Each column is linearly binned onto
+        an evenly spaced grid and the bins are convolved with the kernel through an FFT, so the cost
+        grows with the grid size instead of (rows x grid points).
+        The bandwidth follows Scott's rule, like seaborn's kdeplot.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            2D array (observations x columns). Missing values are ignored.
+        gridsize : int, default=200
+            Number of points in each evaluation grid.
+        cut : float, default=0
+            How many bandwidths the grid extends past the data (seaborn's histplot uses 0).
+        bw_adjust : float, default=1
+            Factor applied to the bandwidth.
+        weights : numpy.ndarray, optional
+            How many observations each value stands for (e.g. the items of a quantile sketch).
+
+        Returns
+        -------
+        tuple
+            1. numpy.ndarray of grid points (columns x gridsize).
+            2. numpy.ndarray of densities (columns x gridsize).
+    """
+    values = np.asarray(values, dtype=float)
+    observed = ~np.isnan(values)
+    weight = observed.astype(float) if weights is None else np.where(observed, weights, 0.0)
+    n = weight.sum(axis=0)
+    n_cols = values.shape[1]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(values * weight, axis=0) / n
+        std = np.sqrt(np.nansum(weight * (values - mean) ** 2, axis=0) / (n - 1))
+        # Scott's rule with the effective sample size, which is just n when every weight is 1.
+        n_eff = n ** 2 / (weight ** 2).sum(axis=0)
+        bw = std * n_eff ** (-1 / 5) * bw_adjust
+        low = np.nanmin(values, axis=0) - cut * bw
+        high = np.nanmax(values, axis=0) + cut * bw
+
+    usable = (n > 1) & (bw > 0)
+    low = np.where(usable, low, 0.0)
+    high = np.where(usable, high, 1.0)
+    bw = np.where(usable, bw, 1.0)
+    delta = (high - low) / (gridsize - 1)
+    grid = low[:, None] + delta[:, None] * np.arange(gridsize)
+
+    # Linear binning: each value splits its weight between the two nearest grid points.
+    with np.errstate(invalid="ignore"):
+        pos = np.clip((values - low) / delta, 0, gridsize - 1)
+    left = np.minimum(np.floor(np.where(observed, pos, 0)), gridsize - 2).astype(np.int64)
+    frac = np.where(observed, pos - left, 0.0)
+    offset = np.arange(n_cols) * gridsize
+    counts = (
+        np.bincount((left + offset).ravel(), weights=(weight * (1 - frac)).ravel(), minlength=n_cols * gridsize)
+        + np.bincount((left + 1 + offset).ravel(), weights=(weight * frac).ravel(), minlength=n_cols * gridsize)
+    ).reshape(n_cols, gridsize)
+
+    # Kernel evaluated at every grid offset, then a zero-padded (non-circular) FFT convolution.
+    lags = np.arange(-(gridsize - 1), gridsize)
+    kernel = np.exp(-0.5 * (lags[None, :] * delta[:, None] / bw[:, None]) ** 2) / (np.sqrt(2 * np.pi) * bw[:, None])
+    size = 4 * gridsize
+    density = np.fft.irfft(np.fft.rfft(counts, size, axis=1) * np.fft.rfft(kernel, size, axis=1), size, axis=1)
+    density = density[:, gridsize - 1:2 * gridsize - 1]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        density = np.maximum(density, 0) / n[:, None]
+    density[~usable] = np.nan
+
+    return grid, density
+
+
+def _compute_summaries(values, bins, kde, gridsize):
+    """
+        Computes the summaries of every column of a 2D array in one pass.
+    """
+    with np.errstate(invalid="ignore"):
+        q_min, q1, median, q3, q_max = np.nanquantile(values, [0, 0.25, 0.5, 0.75, 1], axis=0)
+        mean = np.nanmean(values, axis=0)
+        std = np.nanstd(values, axis=0, ddof=1)
+
+    # Whiskers reach the furthest points within 1.5 IQR of the box, like seaborn's boxplot.
+    iqr = q3 - q1
+    low_limit = q1 - 1.5 * iqr
+    high_limit = q3 + 1.5 * iqr
+    with np.errstate(invalid="ignore"):
+        whisker_low = np.nanmin(np.where(values >= low_limit, values, np.nan), axis=0)
+        whisker_high = np.nanmax(np.where(values <= high_limit, values, np.nan), axis=0)
+
+    counts, edges = hist1d(values, bins)
+    if kde:
+        kde_x, kde_y = fft_kde(values, gridsize)
+
+    summaries = []
+    for i in range(values.shape[1]):
+        column = values[:, i]
+        column = column[~np.isnan(column)]
+        summaries.append({
+            "count": int(column.size),
+            "mean": float(mean[i]),
+            "std": float(std[i]),
+            "min": float(q_min[i]),
+            "q1": float(q1[i]),
+            "median": float(median[i]),
+            "q3": float(q3[i]),
+            "max": float(q_max[i]),
+            "whisker_low": float(whisker_low[i]),
+            "whisker_high": float(whisker_high[i]),
+            "fliers": column[(column < low_limit[i]) | (column > high_limit[i])],
+            "hist_counts": counts[i],
+            "hist_edges": edges[i],
+            "kde_x": kde_x[i] if kde else None,
+            "kde_y": kde_y[i] if kde else None
+        })
+
+    return summaries
+
+
+def column_summaries(df, column_names, bins=15, kde=True, gridsize=200):
+    """
+        Quantiles, mean, median, box plot whiskers, histogram counts and an FFT-binned KDE for many
+        columns. Columns are fingerprinted by their values, so a column that was already summarized
+        with the same settings is taken from the cache; the rest are computed together in one pass.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        column_names : list
+            Columns to summarize.
+        bins : int, default=15
+            Number of histogram bins.
+        kde : bool, default=True
+            Include the density estimate.
+        gridsize : int, default=200
+            Number of KDE grid points.
+
+        Returns
+        -------
+        dict
+            Maps each column name to its summary dict.
+    """
+    column_names = list(column_names)
+    values = df[column_names].to_numpy(dtype=float, na_value=np.nan)
+
+    keys = [
+        (frame_fingerprint(values[:, i], [name]), bins, kde, gridsize)
+        for i, name in enumerate(column_names)
+    ]
+    todo = [i for i, key in enumerate(keys) if key not in _SUMMARY_CACHE]
+
+    if todo:
+        for i, summary in zip(todo, _compute_summaries(values[:, todo], bins, kde, gridsize)):
+            if len(_SUMMARY_CACHE) >= _SUMMARY_CACHE_SIZE:
+                _SUMMARY_CACHE.pop(next(iter(_SUMMARY_CACHE)))
+            _SUMMARY_CACHE[keys[i]] = summary
+
+    return {name: _SUMMARY_CACHE[key] for name, key in zip(column_names, keys)}
+
+
+def clear_summary_cache():
+    """
+        Empties the cached column summaries.
+    """
+    _SUMMARY_CACHE.clear()
@@ -0,0 +1,290 @@
+# This .py file will be used for computing the year-over-year change, slope and change points of every CDI series.
+# Importing python packages
+import numpy as np
+import pandas as pd
+
+from data_wrangle import CDI_QUESTION_NAMES
+from profiling import stage
+
+# Columns that identify a series of the raw CDI data: geography, question and stratification.
+TREND_KEYS = ['LocationDesc', 'Question', 'Stratification1']
+
+# Significance level of the change point test (after the Bonferroni correction over the years tested).
+CHANGE_ALPHA = 0.05
+
+# Years of data needed on each side of a change point.
+MIN_SEGMENT = 2
+
+
+def trend_array(df, value='DataValue', keys=None, year='YearStart'):
+    """
+        Lays the values of every series out as one (series x year) array, one column per year from
+        the first to the last year (years without data are NaN columns), so the trend metrics are
+        whole-array operations. Rows repeated for the same series and year are averaged.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Long table with one row per series and year, e.g. the raw CDI data of one DataValueType.
+        value : str, default='DataValue'
+            Column holding the values.
+        keys : list, optional
+            Columns that identify a series, defaults to TREND_KEYS.
+        year : str, default='YearStart'
+            Column holding the year.
+
+        Returns
+        -------
+        tuple
+            1. pandas.DataFrame of the series keys, one row per row of the array.
+            2. numpy.ndarray of the years.
+            3. numpy.ndarray (series x years) of the values.
+    """
+    keys = TREND_KEYS if keys is None else list(keys)
+    missing_cols = [col for col in keys + [value, year] if col not in df.columns]
+    if missing_cols:
+        raise KeyError(f"The following columns were not found in the DataFrame: {missing_cols}")
+
+    # One integer per series, from the codes of the key columns.
+    codes = np.zeros(len(df), dtype=np.int64)
+    for col in keys:
+        col_codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        codes = codes * (len(uniques) + 1) + col_codes
+    series, _ = pd.factorize(codes)
+    _, first = np.unique(series, return_index=True)
+
+    years_col = df[year].to_numpy(dtype=np.int64)
+    first_year = years_col.min() if len(df) else 0
+    years = np.arange(first_year, (years_col.max() if len(df) else -1) + 1)
+    values = df[value].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # Sum and count of every (series, year) cell in one pass.
+    n_series = len(first)
+    cell = series * len(years) + (years_col - first_year)
+    observed = ~np.isnan(values)
+    sums = np.bincount(cell[observed], weights=values[observed], minlength=n_series * len(years))
+    counts = np.bincount(cell[observed], minlength=n_series * len(years))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        array = (sums / counts).reshape(n_series, len(years))
+
+    return df[keys].iloc[first].reset_index(drop=True), years, array
+
+
+def yoy_change(values):
+    """
+        Year-over-year change of every series (NaN when either year is missing).
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            (series x years) array of trend_array.
+
+        Returns
+        -------
+        numpy.ndarray
+            (series x years - 1) array; column i is the change from year i to year i + 1.
+    """
+    return np.diff(values, axis=1)
+
+
+def linear_slope(values, years):
+    """
+        Least squares slope (change per year) of every series over its observed years.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            (series x years) array of trend_array.
+        years : numpy.ndarray
+            Years of the columns.
+
+        Returns
+        -------
+        tuple
+            1. Slope of every series, NaN with fewer than 2 observed years.
+            2. Number of observed years of every series.
+    """
+    observed = ~np.isnan(values)
+    n = observed.sum(axis=1)
+    t = np.where(observed, years - years.mean(), 0.0)
+    y = np.where(observed, values, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_mean = t.sum(axis=1) / n
+        y_mean = y.sum(axis=1) / n
+        t_dev = np.where(observed, t - t_mean[:, None], 0.0)
+        slope = (t_dev * (y - y_mean[:, None])).sum(axis=1) / (t_dev ** 2).sum(axis=1)
+
+    return np.where(n >= 2, slope, np.nan), n
+
+
+def _f_sf(f, dof):
+    """
+        Upper tail probability of the F(1, dof) distribution, i.e. the two-sided tail of Student's t
+        with dof degrees of freedom at sqrt(f), from the finite series of Abramowitz & Stegun
+        26.7.3-4 (dof is a positive integer array).
+    """
+    theta = np.arctan(np.sqrt(f / dof))
+    cos2 = np.cos(theta) ** 2
+    odd = dof % 2 == 1
+    # Terms of the series: dof / 2 for even dof, (dof - 1) / 2 for odd dof.
+    n_terms = np.where(odd, (dof - 1) // 2, dof // 2)
+    total = np.zeros(np.shape(f))
+    term = np.ones(np.shape(f))
+    for j in range(int(np.max(n_terms, initial=0))):
+        if j:
+            term = term * cos2 * np.where(odd, 2 * j / (2 * j + 1), (2 * j - 1) / (2 * j))
+        total += np.where(j < n_terms, term, 0.0)
+    within = np.where(odd, 2 / np.pi * (theta + np.sin(theta) * np.cos(theta) * total), np.sin(theta) * total)
+
+    return np.clip(1 - within, 0, 1)
+
+
+def change_points(values, years, min_segment=MIN_SEGMENT):
+    """
+        The most likely single step of every series away from its linear trend. Every split between
+        two years is scored at once from running sums by an F-test of the linear fit against the
+        linear fit plus a step at the split (one more parameter), so a steady trend is not taken for
+        a change point. The p-value of the best split is multiplied by the number of splits tested
+        (Bonferroni), which accounts for the length of the series.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            (series x years) array of trend_array.
+        years : numpy.ndarray
+            Years of the columns.
+        min_segment : int, default=MIN_SEGMENT
+            Observed years needed on each side of the split.
+
+        Returns
+        -------
+        dict
+            Arrays with one value per series: 'year' (first year after the step), 'shift' (size of
+            the step on top of the linear trend), 'score' (F statistic) and 'p_value'; NaN for
+            series without a possible split (at least 4 observed years are needed).
+    """
+    if values.shape[1] < 2:
+        empty = np.full(len(values), np.nan)
+        return {'year': empty, 'shift': empty.copy(), 'score': empty.copy(), 'p_value': empty.copy()}
+
+    observed = ~np.isnan(values)
+    # Center the years and every series so the running sums stay accurate.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y = np.where(observed, values - np.nanmean(np.where(observed, values, np.nan), axis=1)[:, None], 0.0)
+    t = np.where(observed, years - years.mean(), 0.0)
+    n = observed.sum(axis=1)[:, None]
+    s_t, s_y = t.sum(axis=1)[:, None], y.sum(axis=1)[:, None]
+    s_tt, s_ty, s_yy = (t ** 2).sum(axis=1)[:, None], (t * y).sum(axis=1)[:, None], (y ** 2).sum(axis=1)[:, None]
+
+    # Split after column k: the step is 1 for columns k + 1.., so its sums are the sums after k.
+    n_left = np.cumsum(observed, axis=1)[:, :-1]
+    n_step = n - n_left
+    s_step_t = s_t - np.cumsum(t, axis=1)[:, :-1]
+    s_step_y = s_y - np.cumsum(y, axis=1)[:, :-1]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Centered cross products of the year (t), the step (d) and the values (y).
+        c_tt, c_ty, c_yy = s_tt - s_t ** 2 / n, s_ty - s_t * s_y / n, s_yy - s_y ** 2 / n
+        c_dd, c_td, c_dy = n_step - n_step ** 2 / n, s_step_t - s_t * n_step / n, s_step_y - n_step * s_y / n
+        det = c_tt * c_dd - c_td ** 2
+        sse_linear = c_yy - c_ty ** 2 / c_tt
+        sse_step = c_yy - (c_dd * c_ty ** 2 - 2 * c_td * c_ty * c_dy + c_tt * c_dy ** 2) / det
+        shift = (c_tt * c_dy - c_td * c_ty) / det
+
+        dof = n - 3
+        gain = sse_linear - sse_step
+        tol = 1e-12 * c_yy
+        f_stat = np.where(gain <= tol, 0.0, np.where(sse_step <= tol, np.inf, gain / (sse_step / dof)))
+
+    valid = (n_left >= min_segment) & (n_step >= min_segment) & (dof >= 1) & (det > 1e-12 * c_tt * c_dd)
+    # A split is only scored at a year with data after it.
+    valid &= observed[:, 1:]
+    score = np.where(valid, f_stat, -np.inf)
+
+    found = valid.any(axis=1)
+    best = np.argmax(score, axis=1)
+    rows = np.arange(len(values))
+    best_f = np.where(found, score[rows, best], np.nan)
+    p_value = np.where(found, np.minimum(_f_sf(np.where(found, best_f, 0.0), np.maximum(dof[:, 0], 1))
+                                         * valid.sum(axis=1), 1.0), np.nan)
+
+    return {'year': np.where(found, years[best + 1], np.nan),
+            'shift': np.where(found, shift[rows, best], np.nan),
+            'score': best_f,
+            'p_value': p_value}
+
+
+def _last_observed(array):
+    # Last non-missing value of every row (NaN for empty rows).
+    observed = ~np.isnan(array)
+    if array.shape[1] == 0:
+        return np.full(len(array), np.nan)
+    last = array.shape[1] - 1 - np.argmax(observed[:, ::-1], axis=1)
+    return np.where(observed.any(axis=1), array[np.arange(len(array)), last], np.nan)
+
+
+def compute_trends(df, years=None, questions=None, stratifications=None, data_value_type='Crude Prevalence',
+                   alpha=CHANGE_ALPHA, min_segment=MIN_SEGMENT):
+    """
+        Trend metrics of every geography x question x stratification series of the raw CDI data,
+        computed for all series at once on a (series x year) array (see trend_array).
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The raw chronic disease indicators data, with more than one YearStart.
+        years : list, optional
+            Values of 'YearStart' to keep, defaults to every year.
+        questions : list, optional
+            Values of 'Question' to keep (raw CDI names), defaults to every question.
+        stratifications : list, optional
+            Values of 'Stratification1' to keep, defaults to every stratification.
+        data_value_type : str, default='Crude Prevalence'
+            Value of 'DataValueType' to keep; None keeps every row.
+        alpha : float, default=CHANGE_ALPHA
+            Largest p-value of a flagged change point (see change_points).
+        min_segment : int, default=MIN_SEGMENT
+            Observed years needed on each side of a change point.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per series: State, Question (readable names of CDI_QUESTION_NAMES),
+            Stratification1, the value of every year (one integer column per year, listed in
+            attrs['years']), n_years, last_year, yoy (the latest year-over-year change), slope,
+            change_year, change_shift, change_score, change_p and change_flag.
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for col, values in (('DataValueType', None if data_value_type is None else [data_value_type]),
+                        ('YearStart', years), ('Question', questions), ('Stratification1', stratifications)):
+        if values is not None:
+            mask &= df[col].isin(list(values)).to_numpy()
+
+    with stage('trends - compute') as record:
+        keys, year_values, values = trend_array(df[mask] if not mask.all() else df)
+        slope, n_years = linear_slope(values, year_values)
+        change = change_points(values, year_values, min_segment)
+
+        trends = keys.rename(columns={'LocationDesc': 'State'})
+        trends['Question'] = trends['Question'].replace(CDI_QUESTION_NAMES)
+        trends = pd.concat([trends, pd.DataFrame(values, columns=[int(y) for y in year_values])], axis=1)
+        trends['n_years'] = n_years
+        trends['last_year'] = _last_observed(np.where(np.isnan(values), np.nan, year_values.astype(float)))
+        trends['yoy'] = _last_observed(yoy_change(values))
+        trends['slope'] = slope
+        trends['change_year'] = change['year']
+        trends['change_shift'] = change['shift']
+        trends['change_score'] = change['score']
+        trends['change_p'] = change['p_value']
+        trends['change_flag'] = np.nan_to_num(change['p_value'], nan=1.0) <= alpha
+        trends.attrs['years'] = [int(y) for y in year_values]
+        record['series'] = len(trends)
+
+    return trends
+
+
+def trend_years(trends):
+    """
+        The year columns of a compute_trends output.
+    """
+    return trends.attrs.get('years') or [col for col in trends.columns if isinstance(col, (int, np.integer))]
@@ -0,0 +1,301 @@
+# This .py file will be used for checking the outputs of the pipeline stages against declared constraints.
+# Importing python packages
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# What happens when a constraint is violated: None (no checks), "warn" or "raise".
+VALIDATION = "warn"
+
+# Number of offending row labels kept per constraint in the report.
+EXAMPLE_ROWS = 5
+
+# Declared constraints of the pipeline tables. Each constraint is a dict with a 'rule':
+#   columns  - the frame has exactly these columns, in this order
+#   not_null - no missing values in 'columns'
+#   unique   - one row per combination of 'columns' (e.g. State and year)
+#   range    - values of 'columns' (or the columns matching 'pattern') within [min, max];
+#              'where' = (column, value) restricts the check to the rows with that value
+#   ordered  - low <= value <= high for every column stem that has all of the 'suffixes'
+#              (or for the three 'columns')
+# Missing values are never a range/ordered violation.
+# data_wrangle declares "census_columns" (the CENSUS_COLUMNS of census_filter_cols) with set_rules.
+RULES = {
+    "census": [
+        {"rule": "not_null", "columns": ["State"]},
+        {"rule": "unique", "columns": ["State"]},
+        {"rule": "range", "pattern": r" - %$", "min": 0, "max": 100},
+        {"rule": "range", "pattern": r"^est - ", "min": 0}
+    ],
+    "cdi_filtered": [
+        {"rule": "unique", "columns": ["LocationDesc", "YearStart", "Question", "Stratification1"]},
+        {"rule": "range", "columns": ["DataValue"], "min": 0, "max": 100, "where": ("DataValueUnit", "%")},
+        {"rule": "ordered", "columns": ["LowConfidenceLimit", "DataValue", "HighConfidenceLimit"]}
+    ],
+    "chronic": [
+        {"rule": "not_null", "columns": ["State"]},
+        {"rule": "unique", "columns": ["State"]},
+        {"rule": "range", "pattern": r"-DataValue$", "min": 0, "max": 100},
+        {"rule": "ordered", "suffixes": ["-LowConfidenceLimit", "-DataValue", "-HighConfidenceLimit"]}
+    ]
+}
+
+# Rule sets checked on the output of the profiling stages of data_wrangle.
+STAGE_RULES = {
+    "census - census_filter_cols": "census_columns",
+    "census - numeric_converter": "census",
+    "chronic - filter_dataframe": "cdi_filtered",
+    "chronic - df_combo_many": "chronic"
+}
+
+# Compiled rule sets, keyed by rule set and column names.
+_COMPILED = {}
+
+
+class ValidationError(ValueError):
+    """
+        A table that violates its constraints; report holds the validation report.
+    """
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+def set_validation(mode="warn"):
+    """
+        Chooses what happens when a stage output violates its constraints.
+
+        Parameters
+        ----------
+        mode : str or None, default="warn"
+            None turns the checks off, "warn" issues a warning, "raise" raises a ValidationError.
+    """
+    global VALIDATION
+    if mode not in (None, "warn", "raise"):
+        raise ValueError(f"Unknown validation mode '{mode}', use None, 'warn' or 'raise'")
+    VALIDATION = mode
+
+
+def set_rules(name, rules):
+    """
+        Declares (or replaces) a rule set.
+
+        Parameters
+        ----------
+        name : str
+            Rule set name, e.g. 'census'.
+        rules : list of dict
+            Constraints, see RULES.
+    """
+    RULES[name] = list(rules)
+    for key in [key for key in _COMPILED if key[0] == name]:
+        del _COMPILED[key]
+
+
+def _match(columns, rule):
+    if rule.get("columns") is not None:
+        return list(rule["columns"])
+    pattern = re.compile(rule["pattern"])
+    return [col for col in columns if pattern.search(str(col))]
+
+
+def compile_rules(rules, columns):
+    """
+        Resolves the columns of every constraint against the columns of a frame once, so checking
+        a frame is one pass over one block of numbers plus the key and column checks.
+
+        Parameters
+        ----------
+        rules : list of dict
+            Constraints, see RULES.
+        columns : pandas.Index
+            Columns of the frames to check.
+
+        Returns
+        -------
+        dict
+            'numeric' - the columns read as one float block, 'checks' - one entry per constraint
+            with the positions of its columns in that block.
+    """
+    numeric = []
+
+    def positions(cols):
+        for col in cols:
+            if col not in numeric:
+                numeric.append(col)
+        return np.array([numeric.index(col) for col in cols], dtype=np.intp)
+
+    checks = []
+    for rule in rules:
+        kind = rule["rule"]
+        check = {"rule": rule, "name": _describe(rule)}
+        if kind in ("columns", "not_null", "unique"):
+            check["columns"] = list(rule["columns"])
+        elif kind == "range":
+            cols = _match(columns, rule)
+            check.update(columns=cols, positions=positions(cols),
+                         low=rule.get("min", -np.inf), high=rule.get("max", np.inf))
+        elif kind == "ordered":
+            if rule.get("columns") is not None:
+                groups = [list(rule["columns"])]
+            else:
+                low, mid, high = rule["suffixes"]
+                stems = [col[:-len(mid)] for col in columns if str(col).endswith(mid)]
+                groups = [[stem + low, stem + mid, stem + high] for stem in stems
+                          if stem + low in columns and stem + high in columns]
+            check.update(columns=[col for group in groups for col in group],
+                         positions=[positions(group) for group in zip(*groups)] if groups else None)
+        else:
+            raise ValueError(f"Unknown rule '{kind}'")
+        checks.append(check)
+
+    missing_cols = [col for check in checks if check["rule"]["rule"] != "columns"
+                    for col in (check["columns"] or []) if col not in columns]
+    if missing_cols:
+        raise KeyError(f"The following columns were not found in the DataFrame: {sorted(set(missing_cols))}")
+
+    return {"numeric": numeric, "checks": checks}
+
+
+def _describe(rule):
+    kind = rule["rule"]
+    if kind == "range":
+        target = rule.get("columns") or f"/{rule['pattern']}/"
+        return f"{target} in [{rule.get('min', '-inf')}, {rule.get('max', 'inf')}]"
+    if kind == "ordered":
+        return " <= ".join(rule.get("columns") or [f"*{suffix}" for suffix in rule["suffixes"]])
+    if kind == "columns":
+        return "expected columns"
+    return f"{kind} {rule['columns']}"
+
+
+def _compiled(name, rules, columns):
+    if name is None:
+        return compile_rules(rules, columns)
+    key = (name, tuple(columns))
+    if key not in _COMPILED:
+        _COMPILED[key] = compile_rules(rules, columns)
+    return _COMPILED[key]
+
+
+def _duplicated(df, columns):
+    """
+        True for every row whose key (the values of columns) appears more than once.
+    """
+    codes, n_codes = _key_codes(df, columns)
+    if n_codes <= 4 * len(codes) + 1024:
+        # Few possible keys: count them directly.
+        return np.bincount(codes, minlength=n_codes)[codes] > 1
+    return pd.Series(codes).duplicated(keep=False).to_numpy()
+
+
+def _key_codes(df, columns):
+    # One integer per row that is equal for rows with equal keys, and the number of possible integers.
+    codes = np.zeros(len(df), dtype=np.int64)
+    n_codes = 1
+    for col in columns:
+        col_codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        if n_codes > 2**62 // (len(uniques) + 1):
+            # Renumber the combined keys so the product stays within int64.
+            codes, combined = pd.factorize(codes)
+            n_codes = len(combined)
+        codes = codes * (len(uniques) + 1) + col_codes
+        n_codes *= len(uniques) + 1
+    return codes, n_codes
+
+
+def validate(df, rules):
+    """
+        Checks a frame against its constraints in one vectorized pass.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        rules : str or list of dict
+            Name of a rule set of RULES (e.g. 'census') or a list of constraints.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per constraint: the constraint, the number of offending rows ('violations'),
+            the first offending row labels ('rows') and details (missing/extra columns).
+    """
+    name = rules if isinstance(rules, str) else None
+    rules = RULES[name] if name is not None else rules
+    plan = _compiled(name, rules, df.columns)
+
+    # The numbers of every range/ordered constraint as one float block, read once.
+    block = df[plan["numeric"]].to_numpy(dtype=np.float64, na_value=np.nan) if plan["numeric"] else None
+
+    rows = []
+    for check in plan["checks"]:
+        rule = check["rule"]
+        kind = rule["rule"]
+        detail = ""
+        bad = np.zeros(len(df), dtype=bool)
+        if kind == "columns":
+            expected = check["columns"]
+            missing = [col for col in expected if col not in df.columns]
+            extra = [col for col in df.columns if col not in expected]
+            if missing or extra or list(df.columns) != expected:
+                detail = f"missing: {missing}, extra: {extra}" if missing or extra else "different order"
+        elif kind == "not_null":
+            bad = df[check["columns"]].isna().to_numpy().any(axis=1)
+        elif kind == "unique":
+            bad = _duplicated(df, check["columns"])
+        elif kind == "range":
+            values = block[:, check["positions"]]
+            bad = ((values < check["low"]) | (values > check["high"])).any(axis=1)
+            if "where" in rule:
+                col, value = rule["where"]
+                bad &= (df[col] == value).to_numpy(dtype=bool, na_value=False)
+        elif kind == "ordered" and check["positions"] is not None:
+            low, mid, high = (block[:, pos] for pos in check["positions"])
+            bad = ((low > mid) | (mid > high) | (low > high)).any(axis=1)
+
+        # A column set violation counts once; the others count offending rows.
+        violations = int(bool(detail)) if kind == "columns" else int(bad.sum())
+        rows.append({"rule": check["name"], "violations": violations,
+                     "rows": list(df.index[np.flatnonzero(bad)[:EXAMPLE_ROWS]]), "detail": detail})
+
+    return pd.DataFrame(rows, columns=["rule", "violations", "rows", "detail"])
+
+
+def validate_stage(stage_name, df, record=None):
+    """
+        Checks the output of a pipeline stage with its rule set of STAGE_RULES, according to
+        VALIDATION. Stages without rules are not checked.
+
+        Parameters
+        ----------
+        stage_name : str
+            Profiling stage name, e.g. 'census - numeric_converter'.
+        df : pandas.DataFrame
+            The stage output.
+        record : dict, optional
+            Profiling record of the stage; gets the number of violations.
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            The validation report, None when nothing was checked.
+    """
+    if VALIDATION is None or stage_name not in STAGE_RULES:
+        return None
+
+    report = validate(df, STAGE_RULES[stage_name])
+    violations = int(report["violations"].sum())
+    if record is not None:
+        record["violations"] = violations
+    if violations:
+        failed = report[report["violations"] > 0]
+        message = f"{stage_name}: " + "; ".join(f"{rule} ({n} violations)"
+                                               for rule, n in zip(failed["rule"], failed["violations"]))
+        if VALIDATION == "raise":
+            raise ValidationError(message, report)
+        warnings.warn(message, stacklevel=2)
+
+    return report
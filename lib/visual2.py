@@ -7,6 +7,14 @@ import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
 import seaborn as sns
 
+from binning import bin_index, binned_mean, column_edges, pairwise_hist2d
+from correlation import corr_block
+from data_loader import load_csv
+from regression import batch_ols
+from shared_frames import attach_frame
+from summary_stats import column_summaries
+from trends import trend_years
+
 # Visual colors for consistency
 ORANGE = "#E56D09" 
 TEAL   = "#0F8A83"
@@ -16,6 +24,32 @@ sns.set_theme(style="white", rc={"axes.grid": False})
 
 
 
+def load_plot_frame(name="df_final", file="./data/processed/Final_dataset.csv"):
+    """
+        Returns the frame to plot: the one the pipeline published under name (see
+        shared_frames.publish_frame), attached without a copy, or the CSV file when nothing is
+        published under that name (e.g. the pipeline ran in an earlier session).
+
+        Parameters
+        ----------
+        name : str, default="df_final"
+            Registry name used by publish_frame.
+
+        file : str, default="./data/processed/Final_dataset.csv"
+            CSV file read when the frame is not published.
+
+        Returns
+        -------
+        pandas.DataFrame
+    """
+    try:
+        return attach_frame(name)
+    except (KeyError, FileNotFoundError):
+        df = load_csv(file)
+        # the index column written by DataFrame.to_csv
+        return df.loc[:, [col for col in df.columns if not str(col).startswith("Unnamed:")]]
+
+
 # Function to rename key dataframe features to human-readable names
 
 def rename_vis_columns(df):
@@ -64,10 +98,77 @@ def rename_vis_columns(df):
 
     
 
+# Function to draw a boxplot and a histogram from a precomputed summary (see summary_stats.py)
+
+def draw_summary(summary, feature, ax_box, ax_hist, kde=True, box_color=ORANGE):
+    """
+        Draws the boxplot and histogram of one feature from its precomputed summary,
+        so no statistic is recomputed from the raw data while plotting.
+
+        Parameters
+        ----------
+        summary : dict
+            Summary of the feature from summary_stats.column_summaries.
+
+        feature : str
+            Name of the feature, used for the axis label
+
+        ax_box : matplotlib axis
+            Subplot axis for the boxplot
+
+        ax_hist : matplotlib axis
+            Subplot axis for the histogram
+
+        kde : boolean, default=True
+            Include/exclude density estimation line
+
+        box_color : str
+            Color of the box
+
+        Returns
+        -------
+        None
+    """
+    box_stats = {
+        "med": summary["median"],
+        "q1": summary["q1"],
+        "q3": summary["q3"],
+        "whislo": summary["whisker_low"],
+        "whishi": summary["whisker_high"],
+        "mean": summary["mean"],
+        "fliers": summary["fliers"]
+    }
+    ax_box.bxp(
+        [box_stats],
+        orientation="horizontal",
+        showmeans=True,
+        patch_artist=True,
+        widths=0.8,
+        boxprops={"facecolor": box_color},
+        medianprops={"color": "black"},
+        meanprops={"marker": "^", "markerfacecolor": "white", "markeredgecolor": "black"},
+        flierprops={"marker": "d", "markerfacecolor": "black", "markersize": 4}
+    )                   # Boxplot with a marker indicating the mean value of the column
+    ax_box.set_yticks([])
+
+    edges = summary["hist_edges"]
+    counts = summary["hist_counts"]
+    ax_hist.bar(edges[:-1], counts, width=np.diff(edges), align="edge",
+                color=TEAL, alpha=0.75, edgecolor="white")
+
+    if kde and summary["kde_x"] is not None:
+        # Scale the density to the histogram counts, like seaborn's histplot(kde=True).
+        bin_width = edges[1] - edges[0]
+        ax_hist.plot(summary["kde_x"], summary["kde_y"] * summary["count"] * bin_width, color=TEAL)
+
+    ax_hist.set_xlabel(feature)
+    ax_hist.set_ylabel("Count")
+
+
 # Function to plot a boxplot and a histogram along the same scale
 
 
-def histogram_boxplot(data, feature, figsize = (12, 7), kde = True, bins = 15):
+def histogram_boxplot(data, feature, figsize = (12, 7), kde = True, bins = 15, summary = None):
 
     """
     Boxplot and histogram combined
@@ -77,7 +178,11 @@ def histogram_boxplot(data, feature, figsize = (12, 7), kde = True, bins = 15):
     figsize: size of figure (default (12, 7))
     kde: whether to show the density curve (default False)
     bins: number of bins for histogram (default None)
+    summary: precomputed summary of the feature (default None, computed and cached from data)
     """
+
+    if summary is None:
+        summary = column_summaries(data, [feature], bins=bins, kde=kde)[feature]
     
     f2, (ax_box2, ax_hist2) = plt.subplots(
         nrows = 2,      # Number of rows of the subplot grid = 2
@@ -88,19 +193,16 @@ def histogram_boxplot(data, feature, figsize = (12, 7), kde = True, bins = 15):
     )                   # Creating the 2 subplots
 
    
-    sns.boxplot(
-        data = data, x = feature, ax = ax_box2, showmeans = True, color = ORANGE)       # Boxplot will be created and a star will indicate the mean value of the column
-    sns.histplot(
-        data = data, x = feature, ax = ax_hist2, bins = bins, color = TEAL, kde=kde)
+    draw_summary(summary, feature, ax_box2, ax_hist2, kde=kde, box_color=ORANGE)
    
     ax_hist2.axvline(
-        data[feature].mean(),
+        summary["mean"],
         color = "black", 
         linestyle = "--",
         label="Mean"
     )                   # Add mean to the histogram
     ax_hist2.axvline(
-        data[feature].median(), 
+        summary["median"], 
         color = "red", 
         linestyle = "--",
         label="Median",
@@ -155,7 +257,8 @@ def select_columns(df, column_names):
     return df_specific_columns
     
 
-def create_corrplot(df, column_names, corr_method):
+def create_corrplot(df, column_names, corr_method, row_names=None, significance=None,
+                    alpha=0.05, sig_display="annotate"):
     """
         Create a correlation heatmap for specified columns in a data frame
     
@@ -164,6 +267,14 @@ def create_corrplot(df, column_names, corr_method):
         df : pandas.DataFrame
         columns : list of column names to run a correlation 
         corr_method : correlation coefficient method ("pearson", "spearman", "kendall")
+        row_names : list of column names for the heatmap rows, optional
+            When given, only the row_names x column_names slice is computed and drawn.
+        significance : dict or pandas.DataFrame, optional
+            Output of resampling.corr_significance (or just its "p_value" DataFrame).
+        alpha : float, default=0.05
+            Significance level used with significance.
+        sig_display : str, default="annotate"
+            "annotate" adds a * to significant cells, "mask" hides the cells that are not significant.
  
         Returns
         -------
@@ -180,16 +291,32 @@ def create_corrplot(df, column_names, corr_method):
 )
     
     
-    corr_df = select_columns(df, column_names)
     corr_name = corr_method.capitalize()
 
-    corr_obj = corr_df.corr(method=corr_method)
+    # Only the requested block is computed; the ranks of the full frame are cached between calls.
+    corr_obj = corr_block(df, row_names if row_names is not None else column_names, column_names, corr_method)
+
+    annot = True
+    fmt = ".2f"
+    mask = None
+    if significance is not None:
+        p_values = significance["p_value"] if isinstance(significance, dict) else significance
+        p_values = p_values.loc[corr_obj.index, corr_obj.columns]
+        if sig_display == "mask":
+            mask = p_values >= alpha
+        elif sig_display == "annotate":
+            stars = np.where(p_values < alpha, "*", "")
+            annot = corr_obj.map("{:.2f}".format) + stars
+            fmt = ""
+        else:
+            raise ValueError("sig_display must be 'annotate' or 'mask'.")
     
     plt.figure(figsize=(12,8))
     sns.heatmap(
         corr_obj,
-        annot=True,
-        fmt=".2f",
+        annot=annot,
+        fmt=fmt,
+        mask=mask,
         cmap=custom_cmap,
         center=0,
         vmin=-1,
@@ -222,7 +349,60 @@ def create_corrplot(df, column_names, corr_method):
 
 # Function to create a Scatter Plot Matrix of key features
 
-def create_splom(df, column_names):
+def binned_splom(df, column_names, bins=40):
+    """
+    Draws a scatter plot matrix from precomputed 2D histograms instead of raw points,
+    so the drawing time does not depend on the number of rows.
+
+    Parameters
+        ----------
+        df : pandas.DataFrame
+        columns : list of column names to run a SPLOM
+        bins : int, default=40
+            number of bins along each axis
+ 
+        Returns
+        -------
+        matplotlib.figure.Figure
+
+    """
+    values = df[column_names].to_numpy(dtype=float, na_value=np.nan)
+    binned = pairwise_hist2d(values, bins)
+    edges = binned["edges"]
+    fits = batch_ols(values, values)
+    cmap = LinearSegmentedColormap.from_list("white_teal", ["#FFFFFF", TEAL])
+
+    n_cols = len(column_names)
+    fig, axes = plt.subplots(n_cols, n_cols, figsize=(2.5 * n_cols, 2.5 * n_cols), squeeze=False)
+
+    for row in range(n_cols):
+        for col in range(n_cols):
+            ax = axes[row, col]
+            if row == col:
+                ax.stairs(binned["density"][col], edges[col], fill=True, color=ORANGE, alpha=0.6)
+            else:
+                counts = np.ma.masked_equal(binned["pairs"][(row, col)], 0)
+                ax.imshow(counts, origin="lower", aspect="auto", cmap=cmap, interpolation="nearest",
+                          extent=[edges[col, 0], edges[col, -1], edges[row, 0], edges[row, -1]])
+                # Regression line of the row column on the column column.
+                x_line = edges[col, [0, -1]]
+                ax.plot(x_line, fits["intercept"][col, row] + fits["slope"][col, row] * x_line, color="gray")
+                ax.set_ylim(edges[row, 0], edges[row, -1])
+            ax.set_xlim(edges[col, 0], edges[col, -1])
+
+            ax.set_xlabel(column_names[col] if row == n_cols - 1 else "")
+            ax.set_ylabel(column_names[row] if col == 0 else "")
+            if row != n_cols - 1:
+                ax.set_xticklabels([])
+            if col != 0 and row != col:
+                ax.set_yticklabels([])
+
+    sns.despine(fig=fig)
+
+    return fig
+
+
+def create_splom(df, column_names, binned=False, bins=40):
     """
     Create a scatter plot matrix (SPLOM) for selected columns.
 
@@ -230,6 +410,10 @@ def create_splom(df, column_names):
         ----------
         df : pandas.DataFrame
         columns : list of column names to run a SPLOM
+        binned : bool, default=False
+            draw 2D histograms and binned densities instead of every point (for large data)
+        bins : int, default=40
+            number of bins along each axis when binned=True
  
         Returns
         -------
@@ -237,30 +421,34 @@ def create_splom(df, column_names):
 
     """
     
-    # Assign pairplot to variable 'g'
-    g = sns.pairplot(
-        df[column_names],
-        kind='reg',
-        diag_kind="kde",
-        plot_kws={
-            'ci': None,
-            'line_kws':{'color':'gray'},
-            "color": TEAL          
-        },
-        diag_kws={
-            "color": ORANGE        
-        }
-    )
+    if binned:
+        fig = binned_splom(df, column_names, bins)
+    else:
+        # Assign pairplot to variable 'g'
+        g = sns.pairplot(
+            df[column_names],
+            kind='reg',
+            diag_kind="kde",
+            plot_kws={
+                'ci': None,
+                'line_kws':{'color':'gray'},
+                "color": TEAL          
+            },
+            diag_kws={
+                "color": ORANGE        
+            }
+        )
+        fig = g.fig
   
     
-    g.fig.suptitle(
+    fig.suptitle(
         "Scatter Plot Matrix of Chronic Disease Prevalence Among Adults",
         fontsize=16,
         fontweight="bold",
         y=0.99
     )
     
-    g.fig.text(
+    fig.text(
         0.5, 0.94,
         "Across the U.S. States in 2022",
         ha="center",
@@ -268,7 +456,7 @@ def create_splom(df, column_names):
         color="black"
     )
       
-    g.fig.subplots_adjust(top=0.90)
+    fig.subplots_adjust(top=0.90)
     plt.show()
 
 
@@ -369,7 +557,7 @@ def plot_state_prevalence(
 
 
 
-def histogram_boxplot2(data, feature, ax_box, ax_hist, kde = True, bins = 15):
+def histogram_boxplot2(data, feature, ax_box, ax_hist, kde = True, bins = 15, summary = None):
     """
         Boxplot and histogram created to be passed into subplot
 
@@ -393,26 +581,27 @@ def histogram_boxplot2(data, feature, ax_box, ax_hist, kde = True, bins = 15):
         bins : int, default=15
             bin size for histogram
 
+        summary : dict, optional
+            precomputed summary of the feature (computed and cached from data when None)
+
         Returns
         -------
         boxplot and histogram
 
     """
-    sns.boxplot(
-        data = data, x = feature, ax = ax_box, showmeans = True, color = "#D35400"
-    )
+    if summary is None:
+        summary = column_summaries(data, [feature], bins=bins, kde=kde)[feature]
 
-    sns.histplot(
-        data = data, x = feature, ax = ax_hist, bins = bins, color = TEAL, kde=kde)
+    draw_summary(summary, feature, ax_box, ax_hist, kde=kde, box_color="#D35400")
 
     ax_hist.axvline(
-        data[feature].mean(),
+        summary["mean"],
         color = "green", 
         linestyle = "--",
         label="Mean"
     )                   # Add mean to the histogram
     ax_hist.axvline(
-        data[feature].median(), 
+        summary["median"], 
         color = "red", 
         linestyle = "--",
         label="Median",
@@ -454,6 +643,9 @@ def histogram_boxplot_grid(df, features, cols):
                              figsize = (15,12))
     axes = axes.flatten()
 
+    # Summaries of every feature in one pass (cached for later re-renders).
+    summaries = column_summaries(df, features)
+
     for i, feature in enumerate(features):
         column_i = i % cols
         row_j = i // cols
@@ -466,7 +658,7 @@ def histogram_boxplot_grid(df, features, cols):
 
         ax_box.sharex(ax_hist)
 
-        histogram_boxplot2(df, feature, ax_box, ax_hist)
+        histogram_boxplot2(df, feature, ax_box, ax_hist, summary=summaries[feature])
 
         ax_box.set_title(f"Distribution of {feature} Among Adults",
                          fontsize=16,
@@ -479,7 +671,19 @@ def histogram_boxplot_grid(df, features, cols):
 
 
 
-def create_bubbleplot(df, x, y, size, color):
+def _xy_bins(df, x, y, bins):
+    """
+        Bins the x and y columns once and returns the bin positions, edges and image extent.
+    """
+    values = df[[x, y]].to_numpy(dtype=float, na_value=np.nan)
+    edges = column_edges(values, bins)
+    idx = bin_index(values, edges)
+    extent = [edges[0, 0], edges[0, -1], edges[1, 0], edges[1, -1]]
+
+    return idx[:, 0], idx[:, 1], extent
+
+
+def create_bubbleplot(df, x, y, size, color, binned=False, bins=40):
     """
         Creates bubbleplot with three dimensions
 
@@ -499,6 +703,12 @@ def create_bubbleplot(df, x, y, size, color):
         color: str
             name of column for color gradient
 
+        binned : bool, default=False
+            draw the mean color value of each x/y bin as an image instead of every point (for large data)
+
+        bins : int, default=40
+            number of bins along each axis when binned=True
+
         
         Returns
         -------
@@ -508,22 +718,33 @@ def create_bubbleplot(df, x, y, size, color):
 
     plt.figure(figsize=(10, 6))
     cmap= "viridis"
+    # one color scale for the points or bins and the color bar
+    norm = plt.Normalize(df[color].min(), df[color].max())
 
-    # make plot
-    plot = sns.scatterplot(
-        data=df, 
-        x=x, 
-        y=y,
-        hue=color, 
-        s=200, 
-        alpha=.8, 
-        palette="viridis",
-        legend=False
-    )
+    if binned:
+        x_idx, y_idx, extent = _xy_bins(df, x, y, bins)
+        mean_color = binned_mean(x_idx, y_idx, bins, bins, df[color].to_numpy(dtype=float, na_value=np.nan))
+        plot = plt.gca()
+        plot.imshow(np.ma.masked_invalid(mean_color), origin="lower", aspect="auto", cmap=cmap,
+                    norm=norm, extent=extent, interpolation="nearest")
+        plot.set_xlabel(x)
+        plot.set_ylabel(y)
+    else:
+        # make plot
+        plot = sns.scatterplot(
+            data=df, 
+            x=x, 
+            y=y,
+            hue=color, 
+            s=200, 
+            alpha=.8, 
+            palette="viridis",
+            hue_norm=norm,
+            legend=False
+        )
 
 
     # make color bar on the side for legend
-    norm = plt.Normalize(df[color].min(), df[color].max())
     sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
     sm.set_array([])
     cbar = plt.colorbar(sm, ax=plot)
@@ -537,7 +758,7 @@ def create_bubbleplot(df, x, y, size, color):
     plt.show()
 
 
-def mult_scatter_plot(df, x, y, mult_colors, color_axis_name):
+def mult_scatter_plot(df, x, y, mult_colors, color_axis_name, binned=False, bins=40):
     """
         Creates scatter plot with colors for each feature
 
@@ -557,6 +778,12 @@ def mult_scatter_plot(df, x, y, mult_colors, color_axis_name):
         color_axis_name : str
             name of category on color axis (e.g., insurance, work transportation, etc.)
 
+        binned : bool, default=False
+            draw one panel per feature with its mean value in each x/y bin, without melting the frame
+
+        bins : int, default=40
+            number of bins along each axis when binned=True
+
 
         
         Returns
@@ -565,6 +792,24 @@ def mult_scatter_plot(df, x, y, mult_colors, color_axis_name):
 
     """
 
+    if binned:
+        # Every feature shares the same x/y position, so bin the positions once and skip the melt.
+        x_idx, y_idx, extent = _xy_bins(df, x, y, bins)
+        fig, axes = plt.subplots(1, len(mult_colors), figsize=(5 * len(mult_colors), 5),
+                                 sharex=True, sharey=True, squeeze=False)
+        for ax, feature in zip(axes[0], mult_colors):
+            mean_value = binned_mean(x_idx, y_idx, bins, bins, df[feature].to_numpy(dtype=float, na_value=np.nan))
+            image = ax.imshow(np.ma.masked_invalid(mean_value), origin="lower", aspect="auto",
+                              cmap="viridis", extent=extent, interpolation="nearest")
+            fig.colorbar(image, ax=ax, label="Percentage_Value")
+            ax.set_title(feature)
+            ax.set_xlabel(x)
+        axes[0, 0].set_ylabel(y)
+
+        fig.suptitle(f'{y} vs {x} by {color_axis_name}')
+        plt.show()
+        return
+
     df_long = df.melt(id_vars=[x, y], 
                       value_vars=mult_colors, 
                       var_name=color_axis_name, 
@@ -585,10 +830,115 @@ def mult_scatter_plot(df, x, y, mult_colors, color_axis_name):
     plt.grid(True, linestyle='--', alpha=0.6)
     plt.show()
 
-        
 
-    
 
-        
 
+def _trend_rows(trends, question, stratification, states=None):
+    """
+        The rows of a compute_trends output for one question and stratification (and states).
+    """
+    mask = (trends["Question"] == question) & (trends["Stratification1"] == stratification)
+    if states is not None:
+        mask &= trends["State"].isin(states)
+    rows = trends[mask.to_numpy(dtype=bool)]
+    if rows.empty:
+        raise ValueError(f"No trends for question '{question}' and stratification '{stratification}'.")
+
+    return rows
+
+
+def plot_trends(trends, question, stratification="Overall", states=None, top_n=10):
+    """
+        Plots the yearly values of one question and stratification per state, marking the change
+        points flagged by compute_trends.
+
+        Parameters
+        ----------
+        trends : pandas.DataFrame
+            Output of trends.compute_trends.
+
+        question : str
+            Question to plot (readable name, e.g. "Diabetes").
+
+        stratification : str, default="Overall"
+            Stratification to plot.
+
+        states : list, optional
+            States to plot; by default the top_n states with the steepest slopes.
+
+        top_n : int, default=10
+            Number of states plotted when states is None.
+
+
+        Returns
+        -------
+        renders line plot
+    """
+    rows = _trend_rows(trends, question, stratification, states)
+    if states is None:
+        rows = rows.loc[rows["slope"].abs().sort_values(ascending=False).index[:top_n]]
+    years = trend_years(trends)
+
+    fig, ax = plt.subplots(figsize=(12, 7))
+    colors = sns.color_palette("viridis", len(rows))
+    for color, (_, row) in zip(colors, rows.iterrows()):
+        values = row[years].to_numpy(dtype=float)
+        ax.plot(years, values, marker="o", color=color, label=row["State"])
+        if row["change_flag"]:
+            ax.axvline(row["change_year"] - 0.5, color=color, linestyle="--", alpha=0.5)
+
+    fig.suptitle(f"{question} Prevalence (%) by Year", fontsize=18, fontweight="bold")
+    ax.set_title(f"{stratification}; dashed lines mark flagged change points", fontsize=13)
+    ax.set_xlabel("Year")
+    ax.set_ylabel(f"{question} Prev. (%)")
+    ax.set_xticks(years)
+    ax.legend(bbox_to_anchor=(1.02, 1), loc="upper left", frameon=False)
+    sns.despine()
+
+    plt.tight_layout()
+    plt.show()
+
+
+def plot_trend_slopes(trends, question, stratification="Overall", top_n=15):
+    """
+        Bar chart of the yearly slope of one question and stratification per state; states with
+        a flagged change point are drawn in orange.
+
+        Parameters
+        ----------
+        trends : pandas.DataFrame
+            Output of trends.compute_trends.
+
+        question : str
+            Question to plot (readable name, e.g. "Diabetes").
+
+        stratification : str, default="Overall"
+            Stratification to plot.
+
+        top_n : int, default=15
+            Number of states displayed, sorted by slope. If None, all states are displayed.
 
+
+        Returns
+        -------
+        renders bar chart
+    """
+    rows = _trend_rows(trends, question, stratification)
+    rows = rows.dropna(subset=["slope"]).sort_values("slope", ascending=False).head(top_n)
+    colors = np.where(rows["change_flag"].to_numpy(dtype=bool), ORANGE, TEAL)
+
+    plt.figure(figsize=(12, 8))
+    ax = plt.gca()
+    ax.bar(rows["State"], rows["slope"], color=colors, alpha=.7)
+    ax.axhline(0, color="black", linewidth=0.8)
+
+    plt.suptitle(f"{question} Prevalence Trend by State", fontsize=18, fontweight="bold", y=0.98)
+    plt.title(f"{stratification}; orange = flagged change point", fontsize=13, y=0.94)
+    ax.set_ylabel("Change per Year (pct. points)")
+    ax.set_xlabel("")
+
+    plt.xticks(rotation=45, ha="right")
+    sns.despine()
+
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,50 @@
+# Tests of the Polars and DuckDB backends of backend.py against the pandas code.
+# Importing python packages
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from backend import collect, set_backend, to_backend
+from data_wrangle import df_combo, process_chronic_disease_data
+
+LEFT = pd.DataFrame({'x': [1.0, 2.0, 3.0, 4.0, 5.0], 'State': ['Texas', 'Alabama', 'Ohio', 'Alabama', None]})
+RIGHT = pd.DataFrame({'y': [10.0, 20.0, 30.0, 40.0], 'State': ['Ohio', 'Alabama', 'Utah', 'Ohio']})
+
+RAW_CDI = pd.DataFrame({'YearStart': [2022, 2022, 2021, 2022, 2022, 2022],
+                        'DataValueType': ['Crude Prevalence'] * 5 + ['Age-adjusted Prevalence'],
+                        'Question': ['Diabetes among adults', 'Obesity among adults', 'Diabetes among adults',
+                                     'Diabetes among adults', 'Diabetes among adults', 'Diabetes among adults'],
+                        'LocationDesc': ['Texas', 'Texas', 'Texas', 'Ohio', 'Guam', 'Ohio'],
+                        'Stratification1': ['Overall'] * 6,
+                        'DataValue': [12.0, 35.0, 11.0, 13.0, 9.0, 14.0],
+                        'LowConfidenceLimit': [11.0, 34.0, 10.0, 12.0, 8.0, 13.0],
+                        'HighConfidenceLimit': [13.0, 36.0, 12.0, 14.0, 10.0, 15.0],
+                        'DataValueUnit': ['%'] * 6, 'Geolocation': ['POINT (0 0)'] * 6})
+
+
+@pytest.mark.parametrize('backend', ['polars', 'duckdb'])
+@pytest.mark.parametrize('how', ['inner', 'left', 'right', 'outer'])
+def test_df_combo_matches_pandas(backend, how):
+    pytest.importorskip(backend)
+    expected = df_combo(LEFT, RIGHT, 'State', how).reset_index(drop=True)
+    result = collect(df_combo(to_backend(LEFT, backend), to_backend(RIGHT, backend), 'State', how))
+
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result.astype(expected.dtypes.to_dict()), expected)
+
+
+@pytest.mark.parametrize('backend', ['polars', 'duckdb'])
+def test_chronic_pipeline_honours_backend(backend):
+    pytest.importorskip(backend)
+    expected = process_chronic_disease_data(RAW_CDI, stratifications=['Overall'])
+    set_backend(backend)
+    try:
+        result = process_chronic_disease_data(RAW_CDI, stratifications=['Overall'])
+    finally:
+        set_backend('pandas')
+
+    pd.testing.assert_frame_equal(result, expected)
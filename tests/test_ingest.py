@@ -0,0 +1,59 @@
+# Tests of the incremental refresh of ingest.py.
+# Importing python packages
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from data_wrangle import drop_columns, df_combo, process_chronic_disease_data
+from ingest import FINAL_DROP_COLUMNS, incremental_refresh, processed_names
+
+STATES = {'Texas': 48, 'Vermont': 50, 'Ohio': 39}
+QUESTIONS = ['Diabetes among adults', 'Obesity among adults']
+STRATIFICATIONS = ['Overall', 'Male', 'Female', 'Hawaiian or Pacific Islander, non-Hispanic']
+
+
+def _raw_cdi():
+    rows = []
+    for state, location_id in STATES.items():
+        for question in QUESTIONS:
+            for strat in STRATIFICATIONS:
+                # Vermont has no Hawaiian or Pacific Islander values, like most states.
+                if state == 'Vermont' and strat.startswith('Hawaiian'):
+                    continue
+                value = 10.0 + location_id / 10 + len(strat) / 100
+                rows.append({'YearStart': 2022, 'LocationDesc': state, 'LocationID': location_id,
+                             'Question': question, 'QuestionID': question[:5], 'Stratification1': strat,
+                             'StratificationID1': strat[:6], 'DataValueType': 'Crude Prevalence',
+                             'DataValue': value, 'LowConfidenceLimit': value - 1,
+                             'HighConfidenceLimit': value + 1, 'DataValueUnit': '%',
+                             'Geolocation': 'POINT (0 0)'})
+    return pd.DataFrame(rows)
+
+
+def _refresh(df_raw, census, last=None):
+    last = last or {'chronic_final': pd.DataFrame(), 'final_dataset': pd.DataFrame(),
+                    'manifest': pd.DataFrame()}
+    return incremental_refresh(df_raw, census, last['chronic_final'], last['final_dataset'], last['manifest'],
+                               questions=QUESTIONS, stratifications=STRATIFICATIONS)
+
+
+def test_changed_state_without_a_stratification():
+    census = pd.DataFrame({'State': list(STATES), 'est - Total Pop': [29.5, 0.6, 11.8]})
+    raw = _raw_cdi()
+    first = _refresh(raw, census)
+
+    changed = raw.copy()
+    changed.loc[changed['LocationDesc'] == 'Vermont', 'DataValue'] += 1
+    result = _refresh(changed, census, first)
+
+    assert result['states'] == ['Vermont']
+    chronic = processed_names(process_chronic_disease_data(changed, questions=QUESTIONS,
+                                                           stratifications=STRATIFICATIONS))
+    final = df_combo(drop_columns(chronic, FINAL_DROP_COLUMNS), census, 'State', 'outer')
+    pd.testing.assert_frame_equal(result['chronic_final'], chronic.reset_index(drop=True), check_dtype=False)
+    pd.testing.assert_frame_equal(result['final_dataset'], final.reset_index(drop=True), check_dtype=False)
+    assert np.isnan(result['chronic_final'].set_index('State').loc['Vermont', 'Hawaiian or Pacific Islander - Diabetes-DataValue'])
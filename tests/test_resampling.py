@@ -0,0 +1,42 @@
+# Tests of the resampled correlation significance of resampling.py.
+# Importing python packages
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from correlation import pairwise_corr
+from resampling import corr_significance, resample_indices
+
+
+def _with_missing():
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame(rng.normal(size=(30, 3)), columns=['a', 'b', 'c'])
+    # a and b miss different rows, so their ranks over the whole columns do not hold for the pair.
+    df.loc[[0, 4, 9], 'a'] = np.nan
+    df.loc[[2, 4, 17, 25], 'b'] = np.nan
+    return df
+
+
+def test_spearman_resamples_rerank_pairs_with_missing_values():
+    df = _with_missing()
+    result = corr_significance(df, ['a', 'b'], ['b', 'c'], n_resamples=40, seed=5, chunk_size=16)
+
+    boot = [df.iloc[idx].reset_index(drop=True).corr(method='spearman').loc[['a', 'b'], ['b', 'c']].to_numpy()
+            for idx in resample_indices(len(df), 40, 'bootstrap', seed=6)]
+    ci_low, ci_high = np.nanquantile(np.array(boot, dtype=np.float32), [0.025, 0.975], axis=0)
+    np.testing.assert_allclose(result['ci_low'].to_numpy(), ci_low, rtol=1e-6)
+    np.testing.assert_allclose(result['ci_high'].to_numpy(), ci_high, rtol=1e-6)
+
+    observed = df.corr(method='spearman').loc[['a', 'b'], ['b', 'c']].to_numpy()
+    counts = 0
+    for idx in resample_indices(len(df), 40, 'permutation', seed=5):
+        shuffled = pd.concat([df[['a', 'b']].iloc[idx].reset_index(drop=True).add_suffix('_row'),
+                              df[['b', 'c']]], axis=1)
+        corr = shuffled.corr(method='spearman').loc[['a_row', 'b_row'], ['b', 'c']].to_numpy()
+        counts += np.abs(corr) >= np.abs(observed) - 1e-12
+    np.testing.assert_allclose(result['p_value'].to_numpy(), (counts + 1) / 41)
+    np.testing.assert_allclose(result['corr'].to_numpy(), observed)
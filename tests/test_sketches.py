@@ -0,0 +1,30 @@
+# Tests of the streaming column sketches of sketches.py.
+# Importing python packages
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from sketches import ColumnSketch, merge_sketches
+
+
+def _sketch(values):
+    sketch = ColumnSketch(hist_range=(0, 10), bins=5)
+    sketch.update(values)
+    return sketch
+
+
+def test_merge_sketches_leaves_the_inputs_unchanged():
+    first = {'a': _sketch(np.arange(5.0))}
+    second = {'a': _sketch(np.arange(5.0, 10.0))}
+
+    merged = merge_sketches([first, second])
+    merged_again = merge_sketches([first, second])
+
+    assert first['a'].count == 5 and first['a'].max == 4
+    np.testing.assert_array_equal(first['a'].hist_counts, [2, 2, 1, 0, 0])
+    assert merged['a'].count == merged_again['a'].count == 10
+    assert merged['a'].mean == merged_again['a'].mean == 4.5
+    np.testing.assert_array_equal(merged['a'].hist_counts, [2, 2, 2, 2, 2])
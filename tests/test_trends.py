@@ -0,0 +1,45 @@
+# Tests of the change point flags of trends.py.
+# Importing python packages
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from trends import CHANGE_ALPHA, change_points, compute_trends
+
+YEARS = np.arange(2015, 2023)
+
+
+def test_linear_series_is_not_flagged():
+    rng = np.random.default_rng(0)
+    exact = 10 + 0.8 * (YEARS - YEARS[0])
+    noisy = exact + rng.normal(0, 0.3, (2000, len(YEARS)))
+
+    assert change_points(exact[None, :], YEARS)['p_value'][0] > CHANGE_ALPHA
+    # Only the false positive rate of the test is left on noisy linear series.
+    assert (change_points(noisy, YEARS)['p_value'] <= CHANGE_ALPHA).mean() < 2 * CHANGE_ALPHA
+
+
+def test_step_series_is_flagged():
+    rng = np.random.default_rng(1)
+    step = 10 + 0.3 * (YEARS - YEARS[0]) + np.where(YEARS >= 2019, 4.0, 0.0) + rng.normal(0, 0.3, len(YEARS))
+    change = change_points(step[None, :], YEARS)
+
+    assert change['p_value'][0] <= CHANGE_ALPHA
+    assert change['year'][0] == 2019
+    assert abs(change['shift'][0] - 4.0) < 1.0
+
+
+def test_compute_trends_flags():
+    series = {'Linear': 10 + 0.8 * (YEARS - YEARS[0]), 'Step': np.where(YEARS >= 2019, 14.0, 10.0)}
+    df = pd.DataFrame([{'LocationDesc': state, 'Question': 'Diabetes among adults', 'Stratification1': 'Overall',
+                        'DataValueType': 'Crude Prevalence', 'YearStart': year, 'DataValue': value}
+                       for state, values in series.items() for year, value in zip(YEARS, values)])
+    trends = compute_trends(df).set_index('State')
+
+    assert not trends.loc['Linear', 'change_flag']
+    assert trends.loc['Step', 'change_flag']
+    assert trends.loc['Step', 'change_year'] == 2019